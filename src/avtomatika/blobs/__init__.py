@@ -0,0 +1,20 @@
+from contextlib import suppress
+
+from .base import BLOB_REF_KEY, BlobStoreBase, BlobView, contains_blob_ref, is_blob_ref, offload_blobs, resolve_blobs
+from .filesystem import FileSystemBlobStore
+
+__all__ = [
+    "BLOB_REF_KEY",
+    "BlobStoreBase",
+    "BlobView",
+    "FileSystemBlobStore",
+    "contains_blob_ref",
+    "is_blob_ref",
+    "offload_blobs",
+    "resolve_blobs",
+]
+
+with suppress(ImportError):
+    from .redis import RedisBlobStore  # noqa: F401
+
+    __all__.append("RedisBlobStore")
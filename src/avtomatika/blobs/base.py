@@ -0,0 +1,183 @@
+from abc import ABC, abstractmethod
+from hashlib import sha256
+from re import fullmatch
+from typing import Any, AsyncIterator, Iterable
+
+# Key that marks a dictionary as a reference to a blob, e.g.
+# {"$blob": "<sha256 hex>", "size": 1048576, "encoding": "utf-8"}
+BLOB_REF_KEY = "$blob"
+
+
+def blob_digest(data: bytes) -> str:
+    """Returns the content address (hex SHA-256) of the data."""
+    return sha256(data).hexdigest()
+
+
+def is_valid_digest(digest: str) -> bool:
+    """Checks that a string is a well-formed digest (and therefore safe to use in paths and keys)."""
+    return fullmatch(r"[0-9a-f]{64}", digest) is not None
+
+
+def is_blob_ref(value: Any) -> bool:
+    """Checks whether a value is a reference produced by `offload_blobs`."""
+    return isinstance(value, dict) and isinstance(value.get(BLOB_REF_KEY), str)
+
+
+def contains_blob_ref(value: Any) -> bool:
+    """Checks whether a value is or contains a reference produced by `offload_blobs`."""
+    if isinstance(value, dict):
+        return is_blob_ref(value) or any(contains_blob_ref(item) for item in value.values())
+    if isinstance(value, list):
+        return any(contains_blob_ref(item) for item in value)
+    return False
+
+
+class BlobStoreBase(ABC):
+    """Abstract base class for a content-addressed blob store.
+    Blobs are immutable and identified by the SHA-256 digest of their content,
+    so the same payload is stored only once no matter how often it is referenced.
+    """
+
+    @abstractmethod
+    async def put(self, data: bytes) -> str:
+        """Stores the data (if not already present) and returns its digest.
+
+        :param data: The content to store.
+        :return: The hex SHA-256 digest that addresses the blob.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, digest: str, start: int = 0, end: int | None = None) -> bytes | None:
+        """Reads a blob or a byte range of it.
+
+        :param digest: The digest returned by `put`.
+        :param start: The offset of the first byte to read.
+        :param end: The offset after the last byte to read (None for the end of the blob).
+        :return: The requested bytes or None if the blob does not exist.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def size(self, digest: str) -> int | None:
+        """Returns the size of a blob in bytes or None if it does not exist."""
+        raise NotImplementedError
+
+    async def iter_chunks(
+        self,
+        digest: str,
+        start: int = 0,
+        end: int | None = None,
+        chunk_size: int = 256 * 1024,
+    ) -> AsyncIterator[bytes]:
+        """Yields a blob (or a byte range of it) in chunks, so large blobs can be
+        streamed without being loaded into memory at once.
+        """
+        if end is None:
+            end = await self.size(digest) or 0
+        position = start
+        while position < end:
+            chunk = await self.get(digest, position, min(position + chunk_size, end))
+            if not chunk:
+                return
+            yield chunk
+            position += len(chunk)
+
+    async def close(self) -> None:
+        """Releases the resources held by the store."""
+        # Nothing to release by default
+        return None
+
+
+async def offload_blobs(
+    store: BlobStoreBase,
+    value: Any,
+    threshold: int,
+    known: dict[int, tuple[Any, dict[str, Any]]] | None = None,
+) -> Any:
+    """Returns a copy of `value` in which every string or bytes value longer than
+    `threshold` bytes is moved to the blob store and replaced by a reference.
+    Dictionaries and lists are processed recursively; existing references are kept.
+
+    :param known: Content resolved by `resolve_blobs`, by object ID. Content that is
+        still the same object gets its old reference back without being hashed again.
+    """
+    if isinstance(value, dict):
+        if is_blob_ref(value):
+            return value
+        return {key: await offload_blobs(store, item, threshold, known) for key, item in value.items()}
+    if isinstance(value, list):
+        return [await offload_blobs(store, item, threshold, known) for item in value]
+    if known and isinstance(value, (str, bytes)):
+        content, ref = known.get(id(value), (None, None))
+        if content is value:
+            return ref
+    if isinstance(value, str):
+        data = value.encode("utf-8")
+        if len(data) > threshold:
+            return {BLOB_REF_KEY: await store.put(data), "size": len(data), "encoding": "utf-8"}
+    elif isinstance(value, bytes) and len(value) > threshold:
+        return {BLOB_REF_KEY: await store.put(value), "size": len(value)}
+    return value
+
+
+async def resolve_blobs(
+    store: BlobStoreBase,
+    value: Any,
+    known: dict[int, tuple[Any, dict[str, Any]]] | None = None,
+) -> Any:
+    """The inverse of `offload_blobs`: returns a copy of `value` with every
+    reference replaced by the blob content.
+
+    :param known: If given, each resolved content is recorded in it with its reference.
+    :raises KeyError: If a referenced blob does not exist.
+    """
+    if is_blob_ref(value):
+        data = await store.get(value[BLOB_REF_KEY])
+        if data is None:
+            raise KeyError(f"Blob {value[BLOB_REF_KEY]} not found")
+        content = data.decode(value["encoding"]) if value.get("encoding") else data
+        if known is not None:
+            # The content is kept alive with its ID, so the ID cannot be reused.
+            known[id(content)] = (content, value)
+        return content
+    if isinstance(value, dict):
+        return {key: await resolve_blobs(store, item, known) for key, item in value.items()}
+    if isinstance(value, list):
+        return [await resolve_blobs(store, item, known) for item in value]
+    return value
+
+
+class BlobView:
+    """The initial data of a job as handlers see it, with blob references resolved
+    only for the keys that are read.
+
+    `data` starts as a copy of the stored data, references included. `resolve` fetches
+    the blobs of the given keys into it, and `store` returns the data to save:
+    content that was only read goes back to its old reference, so only new or
+    changed values are hashed and uploaded.
+    """
+
+    def __init__(self, store: BlobStoreBase, stored: dict[str, Any], threshold: int) -> None:
+        self._store = store
+        self._threshold = threshold
+        # Values in `data` that still hold references, by key
+        self._unresolved = {key: value for key, value in stored.items() if contains_blob_ref(value)}
+        self._known: dict[int, tuple[Any, dict[str, Any]]] = {}
+        self.data = dict(stored)
+
+    async def resolve(self, keys: Iterable[str] | None) -> None:
+        """Replaces the references under `keys` (under all keys if None) with the blob content.
+
+        :raises KeyError: If a referenced blob does not exist.
+        """
+        for key in list(self._unresolved) if keys is None else keys:
+            value = self._unresolved.pop(key, None)
+            # A value a handler has replaced is left alone.
+            if value is not None and self.data.get(key) is value:
+                self.data[key] = await resolve_blobs(self._store, value, self._known)
+
+    async def store(self) -> dict[str, Any]:
+        """Returns the data to save, with large values as references."""
+        stored: dict[str, Any] = await offload_blobs(self._store, self.data, self._threshold, self._known)
+        return stored
@@ -0,0 +1,62 @@
+from asyncio import to_thread
+from contextlib import suppress
+from logging import getLogger
+from os import makedirs, replace
+from os.path import getsize, join
+from tempfile import NamedTemporaryFile
+
+from .base import BlobStoreBase, blob_digest, is_valid_digest
+
+logger = getLogger(__name__)
+
+
+class FileSystemBlobStore(BlobStoreBase):
+    """Stores blobs as files under a root directory (single-node deployments).
+    Files are sharded by the first two bytes of the digest: `<root>/ab/cd/<digest>`.
+    """
+
+    def __init__(self, root: str):
+        self._root = root
+
+    def _path(self, digest: str) -> str:
+        if not is_valid_digest(digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return join(self._root, digest[:2], digest[2:4], digest)
+
+    def _write(self, digest: str, data: bytes) -> None:
+        path = self._path(digest)
+        with suppress(FileNotFoundError):
+            if getsize(path) == len(data):
+                return
+        directory = join(self._root, digest[:2], digest[2:4])
+        makedirs(directory, exist_ok=True)
+        # Write to a temporary file and rename it, so readers never see a partial blob.
+        with NamedTemporaryFile(dir=directory, delete=False) as tmp:
+            tmp.write(data)
+        replace(tmp.name, path)
+
+    def _read(self, digest: str, start: int, end: int | None) -> bytes | None:
+        try:
+            with open(self._path(digest), "rb") as f:
+                f.seek(start)
+                return f.read() if end is None else f.read(max(end - start, 0))
+        except FileNotFoundError:
+            return None
+
+    def _size(self, digest: str) -> int | None:
+        try:
+            return getsize(self._path(digest))
+        except FileNotFoundError:
+            return None
+
+    async def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        await to_thread(self._write, digest, data)
+        logger.debug(f"Stored blob {digest} ({len(data)} bytes) in {self._root}")
+        return digest
+
+    async def get(self, digest: str, start: int = 0, end: int | None = None) -> bytes | None:
+        return await to_thread(self._read, digest, start, end)
+
+    async def size(self, digest: str) -> int | None:
+        return await to_thread(self._size, digest)
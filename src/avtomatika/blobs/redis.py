@@ -0,0 +1,58 @@
+from logging import getLogger
+
+from redis import Redis
+
+from .base import BlobStoreBase, blob_digest, is_valid_digest
+
+logger = getLogger(__name__)
+
+
+class RedisBlobStore(BlobStoreBase):
+    """Stores blobs as Redis strings, so every orchestrator instance of a cluster
+    can serve them. Byte ranges are read with GETRANGE.
+    """
+
+    def __init__(self, redis_client: Redis, prefix: str = "orchestrator:blob"):
+        self._redis = redis_client
+        self._prefix = prefix
+
+    def _get_key(self, digest: str) -> str:
+        if not is_valid_digest(digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return f"{self._prefix}:{digest}"
+
+    async def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        key = self._get_key(digest)
+        # The content never changes for a given key, so an existing blob is not sent again.
+        if await self._redis.exists(key):
+            return digest
+        if await self._redis.set(key, data, nx=True):
+            logger.debug(f"Stored blob {digest} ({len(data)} bytes) in Redis")
+        return digest
+
+    async def get(self, digest: str, start: int = 0, end: int | None = None) -> bytes | None:
+        key = self._get_key(digest)
+        if start == 0 and end is None:
+            blob: bytes | None = await self._redis.get(key)
+            return blob
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.exists(key)
+            # GETRANGE takes an inclusive end offset; -1 means the end of the string.
+            pipe.getrange(key, start, -1 if end is None else end - 1)
+            exists, data = await pipe.execute()
+        if not exists:
+            return None
+        return b"" if end is not None and end <= start else data
+
+    async def size(self, digest: str) -> int | None:
+        key = self._get_key(digest)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.exists(key)
+            pipe.strlen(key)
+            exists, length = await pipe.execute()
+        return length if exists else None
+
+    async def close(self) -> None:
+        await self._redis.aclose()
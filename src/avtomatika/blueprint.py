@@ -1,7 +1,11 @@
+import ast
+from inspect import getsource, signature
 from operator import eq, ge, gt, le, lt, ne
 from re import compile as re_compile
+from textwrap import dedent
 from typing import Any, Callable, NamedTuple
 
+from .data_types import JobContext
 from .datastore import AsyncDictStore
 
 # Simple parser for expressions like "context.area.field operator value"
@@ -67,6 +71,62 @@ class ConditionalHandler:
             return False
 
 
+class HandlerPlan(NamedTuple):
+    """How to call a handler, worked out once from its signature.
+
+    Handlers that take `context` get the `JobContext` (and `actions` if asked for).
+    Other handlers get each parameter from the `JobContext` fields, then from
+    `state_history`, then from `initial_data`; parameters found nowhere are left out.
+    """
+
+    func: Callable
+    takes_context: bool
+    takes_actions: bool
+    context_fields: tuple[str, ...]
+    data_params: tuple[str, ...]
+    # The `initial_data` keys the handler can read, or None if they are unknown
+    data_keys: frozenset[str] | None = None
+
+    def bind(self, context: JobContext) -> dict[str, Any]:
+        """Builds the keyword arguments for a call to the handler."""
+        if self.takes_context:
+            if self.takes_actions:
+                return {"context": context, "actions": context.actions}
+            return {"context": context}
+
+        kwargs = {name: getattr(context, name) for name in self.context_fields}
+        state_history = context.state_history
+        initial_data = context.initial_data
+        for name in self.data_params:
+            if name in state_history:
+                kwargs[name] = state_history[name]
+            elif name in initial_data:
+                kwargs[name] = initial_data[name]
+        return kwargs
+
+
+def _string_constants(func: Callable) -> frozenset[str] | None:
+    """Returns the string literals in the source of a function, which include every
+    key it reads by name (`data["key"]`, `data.get("key")`), or None without source.
+    """
+    try:
+        tree = ast.parse(dedent(getsource(func)))
+    except (OSError, TypeError, SyntaxError):
+        return None
+    return frozenset(
+        node.value for node in ast.walk(tree) if isinstance(node, ast.Constant) and isinstance(node.value, str)
+    )
+
+
+def compile_handler_plan(func: Callable) -> HandlerPlan:
+    parameters = signature(func).parameters
+    if "context" in parameters:
+        return HandlerPlan(func, True, "actions" in parameters, (), (), _string_constants(func))
+    context_fields = tuple(name for name in parameters if name in JobContext._fields)
+    data_params = tuple(name for name in parameters if name not in JobContext._fields)
+    return HandlerPlan(func, False, False, context_fields, data_params, frozenset(data_params))
+
+
 class HandlerDecorator:
     def __init__(
         self,
@@ -104,6 +164,7 @@ class HandlerDecorator:
 
             handler = ConditionalHandler(self._blueprint, self._state, func, condition_str)
             self._blueprint.conditional_handlers.append(handler)
+            self._blueprint._conditions_by_state = None
             return func
 
         return decorator
@@ -136,6 +197,9 @@ class StateMachineBlueprint:
         self.conditional_handlers: list[ConditionalHandler] = []
         self.start_state: str | None = None
         self.end_states: set[str] = set()
+        # Built by `compile()` (or lazily on first use) so the per-step hot path does no reflection.
+        self._conditions_by_state: dict[str, list[ConditionalHandler]] | None = None
+        self._handler_plans: dict[Callable, HandlerPlan] = {}
 
     def add_data_store(self, name: str, initial_data: dict[str, Any]):
         """Adds a named data store to the blueprint."""
@@ -170,9 +234,49 @@ class StateMachineBlueprint:
         if self.start_state is None:
             raise ValueError(f"Blueprint '{self.name}' must have exactly one start state.")
 
-    def find_handler(self, state: str, context: Any) -> Callable:
+    def _index_conditions(self) -> dict[str, list[ConditionalHandler]]:
+        conditions_by_state: dict[str, list[ConditionalHandler]] = {}
         for handler in self.conditional_handlers:
-            if handler.state == state and handler.evaluate(context):
+            conditions_by_state.setdefault(handler.state, []).append(handler)
+        self._conditions_by_state = conditions_by_state
+        return conditions_by_state
+
+    def compile(self) -> None:
+        """Precomputes the per-state condition lists and the invocation plan of
+        every handler. Called by the engine when the blueprint is registered.
+        """
+        self._index_conditions()
+        funcs = [
+            *self.handlers.values(),
+            *self.aggregator_handlers.values(),
+            *(handler.func for handler in self.conditional_handlers),
+        ]
+        self._handler_plans = {func: compile_handler_plan(func) for func in funcs}
+
+    def handler_plan(self, func: Callable) -> HandlerPlan:
+        """Returns the cached invocation plan of a handler, compiling it on first use."""
+        plan = self._handler_plans.get(func)
+        if plan is None:
+            plan = self._handler_plans[func] = compile_handler_plan(func)
+        return plan
+
+    def condition_keys(self, state: str) -> frozenset[str]:
+        """Returns the `initial_data` keys read by the transition conditions of a state."""
+        conditions_by_state = self._conditions_by_state
+        if conditions_by_state is None:
+            conditions_by_state = self._index_conditions()
+        return frozenset(
+            handler.condition.field
+            for handler in conditions_by_state.get(state, ())
+            if handler.condition.area == "initial_data"
+        )
+
+    def find_handler(self, state: str, context: Any) -> Callable:
+        conditions_by_state = self._conditions_by_state
+        if conditions_by_state is None:
+            conditions_by_state = self._index_conditions()
+        for handler in conditions_by_state.get(state, ()):
+            if handler.evaluate(context):
                 return handler.func
         if default_handler := self.handlers.get(state):
             return default_handler
@@ -3,6 +3,8 @@
 import re
 from typing import Any
 
+from ..blobs.base import is_blob_ref
+
 
 class ValidationError(Exception):
     """Ошибка валидации с детальной информацией."""
@@ -244,9 +246,9 @@ def _validate_simple_mode(data: dict[str, Any]) -> None:
                 example={"files": {"bot.py": "import aiogram..."}}
             )
         
-        # Проверяем что все значения - строки
+        # Проверяем что все значения - строки (или ссылки на blob store)
         for filename, content in files.items():
-            if not isinstance(content, str):
+            if not isinstance(content, str) and not is_blob_ref(content):
                 raise ValidationError(
                     code="INVALID_FILE_CONTENT",
                     message=f"Содержимое файла '{filename}' должно быть строкой",
@@ -40,7 +40,8 @@ async def compression_middleware(
 
     response = await handler(request)
 
-    if isinstance(response, web.WebSocketResponse):
+    # WebSocket and streamed responses (e.g. blob downloads) are already sent.
+    if not isinstance(response, web.Response):
         return response
 
     if (
@@ -15,6 +15,16 @@ class Config:
         self.REDIS_HOST: str = getenv("REDIS_HOST", "")
         self.REDIS_PORT: int = int(getenv("REDIS_PORT", 6379))
         self.REDIS_DB: int = int(getenv("REDIS_DB", 0))
+        # Separate pools for short commands and for commands that block a connection
+        self.REDIS_MAX_CONNECTIONS: int = int(getenv("REDIS_MAX_CONNECTIONS", 50))
+        self.REDIS_BLOCKING_MAX_CONNECTIONS: int = int(getenv("REDIS_BLOCKING_MAX_CONNECTIONS", 50))
+        self.REDIS_POOL_TIMEOUT_SECONDS: float = float(getenv("REDIS_POOL_TIMEOUT_SECONDS", 5))
+        # Optional replica for reads that only display data (job status, worker list, queue stats)
+        self.REDIS_REPLICA_HOST: str = getenv("REDIS_REPLICA_HOST", "")
+        self.REDIS_REPLICA_PORT: int = int(getenv("REDIS_REPLICA_PORT", 6379))
+        self.REDIS_REPLICA_MAX_LAG_SECONDS: float = float(getenv("REDIS_REPLICA_MAX_LAG_SECONDS", 5))
+        # Use RedisClusterStorage, with its hash-tagged key layout, for a Redis Cluster
+        self.REDIS_CLUSTER: bool = getenv("REDIS_CLUSTER", "false").lower() == "true"
 
         # Postgres settings
         self.POSTGRES_DSN: str = getenv(
@@ -42,6 +52,13 @@ class Config:
         self.WORKER_POLL_TIMEOUT_SECONDS: int = int(
             getenv("WORKER_POLL_TIMEOUT_SECONDS", 30),
         )
+        # "direct": the dispatcher picks a worker; "shared": tasks go to per-task-type queues
+        self.DISPATCH_MODE: str = getenv("DISPATCH_MODE", "direct").lower()
+        # Tasks taken by polling workers are leased for this long (0 disables leases)
+        self.TASK_LEASE_SECONDS: int = int(getenv("TASK_LEASE_SECONDS", 0))
+        self.WS_TASK_ACK_TIMEOUT_MS: int = int(
+            getenv("WS_TASK_ACK_TIMEOUT_MS", 2000),
+        )
         self.WORKER_HEALTH_CHECK_INTERVAL_SECONDS: int = int(
             getenv("WORKER_HEALTH_CHECK_INTERVAL_SECONDS", 60),
         )
@@ -49,12 +66,42 @@ class Config:
         self.WATCHER_INTERVAL_SECONDS: int = int(
             getenv("WATCHER_INTERVAL_SECONDS", 20),
         )
+        self.WORKER_LOSS_CHECK_INTERVAL_SECONDS: int = int(
+            getenv("WORKER_LOSS_CHECK_INTERVAL_SECONDS", 5),
+        )
         self.EXECUTOR_MAX_CONCURRENT_JOBS: int = int(
             getenv("EXECUTOR_MAX_CONCURRENT_JOBS", 100),
         )
+        self.EXECUTOR_DEQUEUE_BLOCK_MS: int = int(
+            getenv("EXECUTOR_DEQUEUE_BLOCK_MS", 5000),
+        )
+        self.EXECUTOR_MAX_CHAINED_STEPS: int = int(
+            getenv("EXECUTOR_MAX_CHAINED_STEPS", 0),
+        )
+        self.EXECUTOR_RECLAIM_INTERVAL_SECONDS: int = int(
+            getenv("EXECUTOR_RECLAIM_INTERVAL_SECONDS", 15),
+        )
+        # Number of job stream partitions (by hash of job_id), spread across the live instances
+        self.JOB_STREAM_PARTITIONS: int = int(getenv("JOB_STREAM_PARTITIONS", 1))
+        self.JOB_STREAM_PARTITION_TTL_SECONDS: int = int(
+            getenv("JOB_STREAM_PARTITION_TTL_SECONDS", 15),
+        )
+        # Number of shards of the timeout watch list, spread across the live instances
+        self.WATCH_SHARDS: int = int(getenv("WATCH_SHARDS", 1))
+        # Lease of the leader instance, which runs the singleton background services
+        self.LEADER_LEASE_SECONDS: int = int(getenv("LEADER_LEASE_SECONDS", 15))
 
         # History storage settings
         self.HISTORY_DATABASE_URI: str = getenv("HISTORY_DATABASE_URI", "")
+        self.HISTORY_QUEUE_SIZE: int = int(getenv("HISTORY_QUEUE_SIZE", 10000))
+        self.HISTORY_BATCH_SIZE: int = int(getenv("HISTORY_BATCH_SIZE", 500))
+        self.HISTORY_FLUSH_INTERVAL_MS: int = int(getenv("HISTORY_FLUSH_INTERVAL_MS", 1000))
+
+        # Blob store settings (large payloads are stored out of line and referenced by hash)
+        self.BLOB_STORE_URI: str = getenv("BLOB_STORE_URI", "")
+        self.BLOB_INLINE_THRESHOLD_BYTES: int = int(
+            getenv("BLOB_INLINE_THRESHOLD_BYTES", 65536),
+        )
 
         # Rate limiting settings
         self.RATE_LIMITING_ENABLED: bool = getenv("RATE_LIMITING_ENABLED", "true").lower() == "true"
@@ -26,6 +26,22 @@ class JobContext(NamedTuple):
     aggregation_results: dict[str, Any] | None = None
 
 
+class WorkerTask(NamedTuple):
+    """A task prepared by the `Dispatcher` for a specific worker's queue, or for a
+    shared task-type queue (`shared_queue`) that any capable worker can take it from.
+    """
+
+    worker_id: str | None
+    payload: dict[str, Any]
+    priority: float
+    shared_queue: str | None = None
+
+    @property
+    def queue(self) -> str:
+        """Name of the task queue the task goes into."""
+        return self.shared_queue or self.worker_id or ""
+
+
 class GPUInfo(NamedTuple):
     """Information about the graphics processor."""
 
@@ -59,3 +75,39 @@ class WorkerInfo(NamedTuple):
     resources: Resources
     installed_software: dict[str, str]
     installed_models: list[InstalledModel]
+
+
+class FencingToken(NamedTuple):
+    """A token returned by `acquire_lock_with_token` for the lock `lock_key`. Writes
+    that carry it are refused once another holder has acquired the lock.
+    """
+
+    lock_key: str
+    token: int
+
+
+class WorkerTaskStats(NamedTuple):
+    """Aggregated task outcomes of a worker over the reputation window."""
+
+    successes: int = 0
+    failures: int = 0
+    # Sum of task durations and the number of tasks whose duration is known.
+    total_duration_ms: int = 0
+    timed_tasks: int = 0
+
+    def add(self, success: bool, duration_ms: int | None) -> "WorkerTaskStats":
+        """Returns the stats with one more finished task counted in."""
+        return WorkerTaskStats(
+            self.successes + int(success),
+            self.failures + int(not success),
+            self.total_duration_ms + (duration_ms or 0),
+            self.timed_tasks + int(duration_ms is not None),
+        )
+
+    @property
+    def total(self) -> int:
+        return self.successes + self.failures
+
+    @property
+    def average_duration_ms(self) -> float | None:
+        return self.total_duration_ms / self.timed_tasks if self.timed_tasks else None
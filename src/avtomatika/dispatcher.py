@@ -1,7 +1,10 @@
+from asyncio import Task, create_task, gather
 from collections import defaultdict
+from hashlib import blake2b
+from json import dumps
 from logging import getLogger
 from random import choice
-from typing import Any
+from typing import TYPE_CHECKING, Any
 from uuid import uuid4
 
 try:
@@ -12,21 +15,59 @@ except ImportError:
         pass
 
 
+from .blobs.base import BlobStoreBase, offload_blobs
 from .config import Config
+from .data_types import WorkerTask
 from .storage.base import StorageBackend
 
+if TYPE_CHECKING:
+    from .ws_manager import WebSocketManager
+
 logger = getLogger(__name__)
 
+# Dispatch modes (`DISPATCH_MODE`)
+DISPATCH_MODE_DIRECT = "direct"
+DISPATCH_MODE_SHARED = "shared"
+
+
+def shared_queue_name(task_type: str, class_id: str) -> str:
+    return f"shared:{task_type}:{class_id}"
+
+
+def task_requirements(task_info: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    """Returns the requirement class of a task: a stable ID and the requirements
+    (`resource_requirements`, `max_cost`) a worker must meet to take it.
+    """
+    requirements = {
+        key: task_info[key] for key in ("resource_requirements", "max_cost") if task_info.get(key) is not None
+    }
+    if not requirements:
+        return "any", requirements
+    class_id = blake2b(dumps(requirements, sort_keys=True).encode(), digest_size=8).hexdigest()
+    return class_id, requirements
+
 
 class Dispatcher:
     """Responsible for dispatching tasks to specific workers using various strategies.
-    In the PULL model, this means enqueuing the task for the worker.
+    In the PULL model, this means enqueuing the task for the worker. Workers with
+    a WebSocket connection that accepts pushed tasks get them over the socket instead.
     """
 
-    def __init__(self, storage: StorageBackend, config: Config):
+    def __init__(
+        self,
+        storage: StorageBackend,
+        config: Config,
+        blob_store: BlobStoreBase | None = None,
+        ws_manager: "WebSocketManager | None" = None,
+    ):
         self.storage = storage
         self.config = config
+        self.blob_store = blob_store
+        self.ws_manager = ws_manager
         self._round_robin_indices: dict[str, int] = defaultdict(int)
+        # Requirement classes this instance has already registered in storage.
+        self._registered_queue_classes: set[tuple[str, str]] = set()
+        self._pushes: set[Task] = set()
 
     @staticmethod
     def _is_worker_compliant(
@@ -128,27 +169,18 @@ class Dispatcher:
         """Selects the worker with the best price-quality (reputation) ratio."""
         return min(workers, key=self._get_best_value_score)
 
-    async def dispatch(self, job_state: dict[str, Any], task_info: dict[str, Any]):
-        job_id = job_state["id"]
-        task_type = task_info.get("type")
-        if not task_type:
-            raise ValueError("Task info must include a 'type'")
-
-        dispatch_strategy = task_info.get("dispatch_strategy", "default")
-        resource_requirements = task_info.get("resource_requirements")
-
-        all_workers = await self.storage.get_available_workers()
-        logger.info(f"Found {len(all_workers)} available workers")
-        if not all_workers:
-            raise RuntimeError("No available workers")
+    async def _raise_no_suitable_workers(self, task_type: str):
+        """Determines why no worker could be selected and raises a descriptive error.
+        Runs only on the failure path, so it may afford a broader registry query.
+        """
+        supporting_workers = await self.storage.find_workers(task_type=task_type)
+        if not supporting_workers:
+            raise RuntimeError(f"No suitable workers for task type '{task_type}'")
 
         # A worker is considered available if its status is 'idle' or not specified (for backward compatibility)
-        logger.debug(f"All available workers: {[w['worker_id'] for w in all_workers]}")
-        idle_workers = [w for w in all_workers if w.get("status", "idle") == "idle"]
-        logger.debug(f"Idle workers: {[w['worker_id'] for w in idle_workers]}")
-        if not idle_workers:
+        if not any(w.get("status", "idle") == "idle" for w in supporting_workers):
             if busy_mo_workers := [
-                w for w in all_workers if w.get("status") == "busy" and "multi_orchestrator_info" in w
+                w for w in supporting_workers if w.get("status") == "busy" and "multi_orchestrator_info" in w
             ]:
                 logger.warning(
                     f"No idle workers. Found {len(busy_mo_workers)} busy workers "
@@ -156,24 +188,105 @@ class Dispatcher:
                 )
             raise RuntimeError("No idle workers (all are 'busy')")
 
-        # Filter by task type
-        capable_workers = [w for w in idle_workers if task_type in w.get("supported_tasks", [])]
-        logger.debug(f"Capable workers for task '{task_type}': {[w['worker_id'] for w in capable_workers]}")
-        if not capable_workers:
-            raise RuntimeError(f"No suitable workers for task type '{task_type}'")
+        raise RuntimeError(f"No worker satisfies the resource requirements for task '{task_type}'")
 
-        # Filter by resource requirements
+    def _meets_requirements(self, worker: dict[str, Any], requirements: dict[str, Any]) -> bool:
+        if not self._is_worker_compliant(worker, requirements.get("resource_requirements") or {}):
+            return False
+        max_cost = requirements.get("max_cost")
+        return max_cost is None or worker.get("cost_per_second", float("inf")) <= max_cost
+
+    async def shared_queues_for_worker(self, worker: dict[str, Any]) -> list[str]:
+        """Returns the shared task queues a worker may take tasks from: one per
+        requirement class of each supported task type that the worker satisfies.
+        """
+        classes = await self.storage.get_task_queue_classes(worker.get("supported_tasks", []))
+        return [
+            shared_queue_name(task_type, class_id)
+            for task_type, task_classes in classes.items()
+            for class_id, requirements in task_classes.items()
+            if self._meets_requirements(worker, requirements)
+        ]
+
+    async def _prepare_shared_task(self, job_state: dict[str, Any], task_info: dict[str, Any]) -> WorkerTask:
+        """Puts the task into the shared queue of its task type and requirement class.
+        No worker is selected: the first capable worker that polls takes it, so
+        dispatching does not fail when all workers are busy.
+        """
+        task_type = task_info["type"]
+        class_id, requirements = task_requirements(task_info)
+        if (task_type, class_id) not in self._registered_queue_classes:
+            await self.storage.register_task_queue_class(task_type, class_id, requirements)
+            self._registered_queue_classes.add((task_type, class_id))
+
+        queue = shared_queue_name(task_type, class_id)
+        logger.info(f"Dispatching task '{task_type}' to shared queue {queue}")
+        payload = await self._build_payload(job_state, task_info)
+        payload["shared_queue"] = queue
+        # The worker is recorded when it takes the task.
+        job_state["task_worker_id"] = None
+        return WorkerTask(
+            worker_id=None,
+            payload=payload,
+            priority=task_info.get("priority", 0.0),
+            shared_queue=queue,
+        )
+
+    async def _build_payload(self, job_state: dict[str, Any], task_info: dict[str, Any]) -> dict[str, Any]:
+        task_id = task_info.get("task_id") or str(uuid4())
+        params = task_info.get("params", {})
+        if self.blob_store:
+            # Large params are sent as references; the worker fetches them from /_worker/blobs/.
+            params = await offload_blobs(self.blob_store, params, self.config.BLOB_INLINE_THRESHOLD_BYTES)
+        payload = {
+            "job_id": job_state["id"],
+            "task_id": task_id,
+            "type": task_info["type"],
+            "params": params,
+            "tracing_context": {},
+        }
+        # Inject tracing context into the payload, not headers
+        inject(payload["tracing_context"], context=job_state.get("tracing_context"))
+
+        # Save the task ID in the Job state for cancellation capability
+        job_state["current_task_id"] = task_id
+        return payload
+
+    async def prepare_task(self, job_state: dict[str, Any], task_info: dict[str, Any]) -> WorkerTask:
+        """Selects a worker for the task and builds its payload without writing anything.
+        The task ID and worker ID are recorded in `job_state` for cancellation capability,
+        so the caller can persist the state and the task together in one commit.
+        In the `shared` dispatch mode, the task goes to a shared queue instead.
+        """
+        task_type = task_info.get("type")
+        if not task_type:
+            raise ValueError("Task info must include a 'type'")
+
+        if self.config.DISPATCH_MODE == DISPATCH_MODE_SHARED:
+            return await self._prepare_shared_task(job_state, task_info)
+
+        dispatch_strategy = task_info.get("dispatch_strategy", "default")
+        resource_requirements = task_info.get("resource_requirements")
+
+        # Only workers that are idle, support the task type and have the required
+        # GPU model / installed models are fetched from the registry indexes.
+        capable_workers = await self.storage.find_workers(
+            task_type=task_type,
+            status="idle",
+            resource_requirements=resource_requirements,
+        )
+        logger.debug(f"Candidate workers for task '{task_type}': {[w['worker_id'] for w in capable_workers]}")
+
+        # Verify the requirements the index cannot express (e.g. minimum VRAM)
         if resource_requirements:
-            compliant_workers = [w for w in capable_workers if self._is_worker_compliant(w, resource_requirements)]
+            capable_workers = [w for w in capable_workers if self._is_worker_compliant(w, resource_requirements)]
             logger.debug(
                 f"Compliant workers for resources '{resource_requirements}': "
-                f"{[w['worker_id'] for w in compliant_workers]}"
+                f"{[w['worker_id'] for w in capable_workers]}"
             )
-            if not compliant_workers:
-                raise RuntimeError(
-                    f"No worker satisfies the resource requirements for task '{task_type}'",
-                )
-            capable_workers = compliant_workers
+
+        if not capable_workers:
+            await self._raise_no_suitable_workers(task_type)
 
         # Filter by maximum cost
         max_cost = task_info.get("max_cost")
@@ -205,31 +318,77 @@ class Dispatcher:
             f"Dispatching task '{task_type}' to worker {worker_id} (strategy: {dispatch_strategy})",
         )
 
-        # --- Task creation and enqueuing ---
-        task_id = task_info.get("task_id") or str(uuid4())
-        payload = {
-            "job_id": job_id,
-            "task_id": task_id,
-            "type": task_type,
-            "params": task_info.get("params", {}),
-            "tracing_context": {},
-        }
-        # Inject tracing context into the payload, not headers
-        inject(payload["tracing_context"], context=job_state.get("tracing_context"))
+        # --- Task creation ---
+        payload = await self._build_payload(job_state, task_info)
+        # Save the worker ID in the Job state for cancellation capability
+        job_state["task_worker_id"] = worker_id
+        return WorkerTask(worker_id=worker_id, payload=payload, priority=task_info.get("priority", 0.0))
 
+    async def dispatch(self, job_state: dict[str, Any], task_info: dict[str, Any]):
+        """Selects a worker and atomically enqueues the task together with the updated job state."""
+        worker_task = await self.prepare_task(job_state, task_info)
         try:
-            priority = task_info.get("priority", 0.0)
-            await self.storage.enqueue_task_for_worker(worker_id, payload, priority)
+            await self.storage.commit_transition(job_state["id"], job_state, worker_tasks=[worker_task])
             logger.info(
-                f"Task {task_id} with priority {priority} successfully enqueued for worker {worker_id}",
+                f"Task {worker_task.payload['task_id']} with priority {worker_task.priority} "
+                f"successfully enqueued in queue {worker_task.queue}",
             )
-            # Save task ID and worker ID in the Job state for cancellation capability
-            job_state["current_task_id"] = task_id
-            job_state["task_worker_id"] = worker_id
-            await self.storage.save_job_state(job_id, job_state)
-
         except Exception as e:
             logger.exception(
-                f"Error enqueuing task for worker {worker_id}",
+                f"Error enqueuing task in queue {worker_task.queue}",
             )
             raise e
+        self.push_tasks([worker_task])
+
+    def push_tasks(self, worker_tasks: list[WorkerTask]) -> None:
+        """Delivers already enqueued tasks over the WebSocket of workers that accept pushed tasks.
+
+        A task is first claimed from the worker's queue, so it is delivered exactly once
+        even if the worker polls at the same time. Pushes wait for the worker's ack, so
+        they run in the background (and concurrently): the caller does not hold its slot
+        for up to `WS_TASK_ACK_TIMEOUT_MS`.
+        """
+        if not self.ws_manager:
+            return
+        ack_timeout = self.config.WS_TASK_ACK_TIMEOUT_MS / 1000
+        # Tasks in shared queues have no worker yet; they are taken by polling.
+        for task in worker_tasks:
+            if task.worker_id is not None and self.ws_manager.accepts_pushed_tasks(task.worker_id):
+                push = create_task(self._push_task(self.ws_manager, task.worker_id, task, ack_timeout))
+                self._pushes.add(push)
+                push.add_done_callback(self._push_done)
+
+    def _push_done(self, push: Task) -> None:
+        self._pushes.discard(push)
+        if not push.cancelled() and (error := push.exception()) is not None:
+            # The task stays in the queue or under its lease, so it is not lost.
+            logger.error(f"Failed to push task: {error}")
+
+    async def wait_for_pushes(self) -> None:
+        """Waits until the pushes started so far are acknowledged or have timed out."""
+        if self._pushes:
+            await gather(*self._pushes, return_exceptions=True)
+
+    async def _push_task(
+        self, ws_manager: "WebSocketManager", worker_id: str, task: WorkerTask, ack_timeout: float
+    ) -> None:
+        lease_seconds = self.config.TASK_LEASE_SECONDS
+        # Leased on claim, so the task is redelivered if this instance dies before the ack.
+        if not await self.storage.claim_worker_task(worker_id, task.payload, lease_seconds):
+            # Already taken by a poll, or the backend cannot claim single tasks.
+            return
+        task_id = task.payload["task_id"]
+        if await ws_manager.push_task(worker_id, task.payload, ack_timeout):
+            logger.info(f"Task {task_id} pushed to worker {worker_id} over WebSocket")
+            return
+        if lease_seconds > 0:
+            # The ack may just be late: a worker running the task extends the lease,
+            # otherwise the lease expires and the HealthChecker redelivers the task.
+            logger.warning(f"Task {task_id} was not acknowledged by worker {worker_id}, leaving it to its lease")
+            return
+        # Without a lease, withdraw the task before returning it to the queue,
+        # so that a late ack does not run it a second time.
+        logger.warning(f"Task {task_id} was not acknowledged by worker {worker_id}, returning it to the queue")
+        command = {"command": "cancel_task", "task_id": task_id, "job_id": task.payload.get("job_id")}
+        await ws_manager.send_command(worker_id, command)
+        await self.storage.enqueue_task_for_worker(worker_id, task.payload, task.priority)
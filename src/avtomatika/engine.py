@@ -1,7 +1,9 @@
-from asyncio import Task, create_task, gather, get_running_loop, wait_for
+from asyncio import Task, create_task, gather, wait_for
 from asyncio import TimeoutError as AsyncTimeoutError
+from contextlib import suppress
 from logging import getLogger
-from typing import Callable, Dict
+from time import time
+from typing import Any, Callable, Dict
 from uuid import uuid4
 
 from aiohttp import ClientSession, WSMsgType, web
@@ -9,21 +11,27 @@ from aiohttp.web import AppKey
 from aioprometheus import render
 
 from . import metrics
+from .blobs.base import BlobStoreBase, is_valid_digest, offload_blobs, resolve_blobs
 from .blueprint import StateMachineBlueprint
 from .client_config_loader import load_client_configs_to_redis
 from .compression import compression_middleware
 from .config import Config
-from .dispatcher import Dispatcher
-from .executor import JobExecutor
+from .data_types import WorkerTask
+from .dispatcher import DISPATCH_MODE_SHARED, Dispatcher
+from .executor import JobExecutor, JobStreamTrimmer
 from .health_checker import HealthChecker
 from .history.base import HistoryStorageBase
+from .history.buffered import BufferedHistoryStorage
 from .history.noop import NoOpHistoryStorage
+from .leader import LeaderElector
 from .logging_config import setup_logging
 from .quota import quota_middleware_factory
 from .ratelimit import rate_limit_middleware_factory
-from .reputation import ReputationCalculator
+from .reputation import ReputationCalculator, record_task_outcome
+from .scheduler import Scheduler
 from .security import client_auth_middleware_factory, worker_auth_middleware_factory
 from .storage.base import StorageBackend
+from .task_waiter import TaskWaiter
 from .telemetry import setup_telemetry
 from .watcher import Watcher
 from .worker_config_loader import load_worker_configs_to_redis
@@ -37,10 +45,13 @@ EXECUTOR_KEY = AppKey("executor", JobExecutor)
 WATCHER_KEY = AppKey("watcher", Watcher)
 REPUTATION_CALCULATOR_KEY = AppKey("reputation_calculator", ReputationCalculator)
 HEALTH_CHECKER_KEY = AppKey("health_checker", HealthChecker)
+SCHEDULER_KEY = AppKey("scheduler", Scheduler)
+TASK_WAITER_KEY = AppKey("task_waiter", TaskWaiter)
+LEADER_ELECTOR_KEY = AppKey("leader_elector", LeaderElector)
 EXECUTOR_TASK_KEY = AppKey("executor_task", Task)
 WATCHER_TASK_KEY = AppKey("watcher_task", Task)
-REPUTATION_CALCULATOR_TASK_KEY = AppKey("reputation_calculator_task", Task)
-HEALTH_CHECKER_TASK_KEY = AppKey("health_checker_task", Task)
+TASK_WAITER_TASK_KEY = AppKey("task_waiter_task", Task)
+LEADER_ELECTOR_TASK_KEY = AppKey("leader_elector_task", Task)
 
 
 metrics.init_metrics()
@@ -53,10 +64,6 @@ async def status_handler(_request: web.Request) -> web.Response:
     return web.json_response({"status": "ok"})
 
 
-async def metrics_handler(_request: web.Request) -> web.Response:
-    return web.Response(body=render(), content_type="text/plain")
-
-
 class OrchestratorEngine:
     def __init__(self, storage: StorageBackend, config: Config):
         setup_logging(config.LOG_LEVEL, config.LOG_FORMAT)
@@ -65,6 +72,7 @@ class OrchestratorEngine:
         self.config = config
         self.blueprints: Dict[str, StateMachineBlueprint] = {}
         self.history_storage: HistoryStorageBase = NoOpHistoryStorage()
+        self.blob_store: BlobStoreBase | None = None
         self.ws_manager = WebSocketManager()
         self.app = web.Application(middlewares=[compression_middleware])
         self.app[ENGINE_KEY] = self
@@ -78,6 +86,7 @@ class OrchestratorEngine:
                 f"Blueprint with name '{blueprint.name}' is already registered.",
             )
         blueprint.validate()
+        blueprint.compile()
         self.blueprints[blueprint.name] = blueprint
 
     def setup(self):
@@ -129,7 +138,13 @@ class OrchestratorEngine:
             return
 
         if storage_class:
-            self.history_storage = storage_class(*storage_args)
+            # Events are written in batches by a background task instead of inline in each job step.
+            self.history_storage = BufferedHistoryStorage(
+                storage_class(*storage_args),
+                max_queue_size=self.config.HISTORY_QUEUE_SIZE,
+                batch_size=self.config.HISTORY_BATCH_SIZE,
+                flush_interval=self.config.HISTORY_FLUSH_INTERVAL_MS / 1000,
+            )
             try:
                 await self.history_storage.initialize()
             except Exception as e:
@@ -139,6 +154,32 @@ class OrchestratorEngine:
                 )
                 self.history_storage = NoOpHistoryStorage()
 
+    async def _setup_blob_store(self) -> None:
+        uri = self.config.BLOB_STORE_URI
+        if not uri:
+            logger.info("Blob store is disabled (BLOB_STORE_URI is not set). Large payloads are stored inline.")
+            return
+
+        if uri.startswith("file:"):
+            from urllib.parse import urlparse
+
+            from .blobs.filesystem import FileSystemBlobStore
+
+            self.blob_store = FileSystemBlobStore(urlparse(uri).path)
+        elif uri.startswith(("redis:", "rediss:")):
+            try:
+                from redis.asyncio import from_url
+
+                from .blobs.redis import RedisBlobStore
+            except ImportError as e:
+                logger.error(f"Could not import RedisBlobStore, perhaps redis is not installed? Error: {e}")
+                return
+            self.blob_store = RedisBlobStore(from_url(uri))
+        else:
+            logger.warning(f"Unsupported BLOB_STORE_URI scheme: {uri}. Large payloads are stored inline.")
+            return
+        logger.info(f"Blob store {type(self.blob_store).__name__} enabled.")
+
     async def on_startup(self, app: web.Application):
         try:
             from opentelemetry.instrumentation.aiohttp_client import (
@@ -151,6 +192,7 @@ class OrchestratorEngine:
                 "opentelemetry-instrumentation-aiohttp-client not found. AIOHTTP client instrumentation is disabled."
             )
         await self._setup_history_storage()
+        await self._setup_blob_store()
 
         # Load client configs if the path is provided
         if self.config.CLIENTS_CONFIG_PATH:
@@ -186,38 +228,48 @@ class OrchestratorEngine:
             )
 
         app[HTTP_SESSION_KEY] = ClientSession()
-        self.dispatcher = Dispatcher(self.storage, self.config)
+        self.dispatcher = Dispatcher(self.storage, self.config, self.blob_store, self.ws_manager)
         app[DISPATCHER_KEY] = self.dispatcher
         app[EXECUTOR_KEY] = JobExecutor(self, self.history_storage)
         app[WATCHER_KEY] = Watcher(self)
         app[REPUTATION_CALCULATOR_KEY] = ReputationCalculator(self)
         app[HEALTH_CHECKER_KEY] = HealthChecker(self)
+        app[SCHEDULER_KEY] = Scheduler(self)
+        self.task_waiter = TaskWaiter(self.storage)
+        app[TASK_WAITER_KEY] = self.task_waiter
+
+        # Services that must run on one instance at a time are started by the leader.
+        self.leader = LeaderElector(self.storage, self.config.LEADER_LEASE_SECONDS)
+        app[LEADER_ELECTOR_KEY] = self.leader
+        self.leader.add_service(JobStreamTrimmer(self))
+        self.leader.add_service(app[REPUTATION_CALCULATOR_KEY])
+        self.leader.add_service(app[HEALTH_CHECKER_KEY])
+        self.leader.add_service(app[SCHEDULER_KEY])
 
         app[EXECUTOR_TASK_KEY] = create_task(app[EXECUTOR_KEY].run())
         app[WATCHER_TASK_KEY] = create_task(app[WATCHER_KEY].run())
-        app[REPUTATION_CALCULATOR_TASK_KEY] = create_task(app[REPUTATION_CALCULATOR_KEY].run())
-        app[HEALTH_CHECKER_TASK_KEY] = create_task(app[HEALTH_CHECKER_KEY].run())
+        app[TASK_WAITER_TASK_KEY] = create_task(app[TASK_WAITER_KEY].run())
+        app[LEADER_ELECTOR_TASK_KEY] = create_task(app[LEADER_ELECTOR_KEY].run())
 
     async def on_shutdown(self, app: web.Application):
         logger.info("Shutdown sequence started.")
         app[EXECUTOR_KEY].stop()
         app[WATCHER_KEY].stop()
-        app[REPUTATION_CALCULATOR_KEY].stop()
-        app[HEALTH_CHECKER_KEY].stop()
+        # Also stops the singleton services
+        app[LEADER_ELECTOR_KEY].stop()
+        app[TASK_WAITER_KEY].stop()
         logger.info("Background task running flags set to False.")
 
-        if hasattr(self.history_storage, "close"):
-            logger.info("Closing history storage...")
-            await self.history_storage.close()
-            logger.info("History storage closed.")
-
+        # Pushed tasks left unacknowledged go back to the queue or to their lease.
+        await app[DISPATCHER_KEY].wait_for_pushes()
         logger.info("Closing WebSocket connections...")
         await self.ws_manager.close_all()
 
         logger.info("Cancelling background tasks...")
-        app[HEALTH_CHECKER_TASK_KEY].cancel()
+        # The elector stops its services and releases the leader lease when cancelled.
+        app[LEADER_ELECTOR_TASK_KEY].cancel()
+        app[TASK_WAITER_TASK_KEY].cancel()
         app[WATCHER_TASK_KEY].cancel()
-        app[REPUTATION_CALCULATOR_TASK_KEY].cancel()
         app[EXECUTOR_TASK_KEY].cancel()
         logger.info("Background tasks cancelled.")
 
@@ -225,9 +277,9 @@ class OrchestratorEngine:
         try:
             await wait_for(
                 gather(
-                    app[HEALTH_CHECKER_TASK_KEY],
+                    app[LEADER_ELECTOR_TASK_KEY],
+                    app[TASK_WAITER_TASK_KEY],
                     app[WATCHER_TASK_KEY],
-                    app[REPUTATION_CALCULATOR_TASK_KEY],
                     app[EXECUTOR_TASK_KEY],
                     return_exceptions=True,
                 ),
@@ -237,6 +289,18 @@ class OrchestratorEngine:
         except AsyncTimeoutError:
             logger.error("Timed out waiting for background tasks to shut down.")
 
+        # Closed only after the background tasks, so the events they logged while
+        # stopping are still written out.
+        logger.info("Flushing buffered history events...")
+        await self.history_storage.flush()
+        if hasattr(self.history_storage, "close"):
+            logger.info("Closing history storage...")
+            await self.history_storage.close()
+            logger.info("History storage closed.")
+
+        if self.blob_store:
+            await self.blob_store.close()
+
         logger.info("Closing HTTP session...")
         await app[HTTP_SESSION_KEY].close()
         logger.info("HTTP session closed.")
@@ -251,6 +315,13 @@ class OrchestratorEngine:
 
             client_config = request["client_config"]
             carrier = {str(k): v for k, v in request.headers.items()}
+            if self.blob_store:
+                # Store large values (source code, archives) once instead of in every write.
+                initial_data = await offload_blobs(
+                    self.blob_store,
+                    initial_data,
+                    self.config.BLOB_INLINE_THRESHOLD_BYTES,
+                )
 
             job_id = str(uuid4())
             job_state = {
@@ -263,8 +334,7 @@ class OrchestratorEngine:
                 "tracing_context": carrier,
                 "client_config": client_config,
             }
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.enqueue_job(job_id)
+            await self.storage.commit_transition(job_id, job_state, enqueue=True)
             metrics.jobs_total.inc({metrics.LABEL_BLUEPRINT: blueprint.name})
             return web.json_response({"status": "accepted", "job_id": job_id}, status=202)
 
@@ -274,9 +344,14 @@ class OrchestratorEngine:
         job_id = request.match_info.get("job_id")
         if not job_id:
             return web.json_response({"error": "job_id is required in path"}, status=400)
-        job_state = await self.storage.get_job_state(job_id)
+        job_state = await self.storage.get_job_state(job_id, allow_stale=True)
         if not job_state:
             return web.json_response({"error": "Job not found"}, status=404)
+        resolve = request.query.get("resolve_blobs", "").lower() in ("1", "true", "yes")
+        if resolve and self.blob_store and "initial_data" in job_state:
+            # Only on request: status polls would otherwise fetch every blob each time.
+            with suppress(KeyError):
+                job_state["initial_data"] = await resolve_blobs(self.blob_store, job_state["initial_data"])
         return web.json_response(job_state, status=200)
 
     async def _cancel_job_handler(self, request: web.Request) -> web.Response:
@@ -284,7 +359,10 @@ class OrchestratorEngine:
         if not job_id:
             return web.json_response({"error": "job_id is required in path"}, status=400)
 
-        job_state = await self.storage.get_job_state(job_id)
+        job_state = await self.storage.get_job_state(
+            job_id,
+            fields=["status", "task_worker_id", "current_task_id"],
+        )
         if not job_state:
             return web.json_response({"error": "Job not found"}, status=404)
 
@@ -294,23 +372,27 @@ class OrchestratorEngine:
                 status=409,
             )
 
-        worker_id = job_state.get("task_worker_id")
-        if not worker_id:
+        task_id = job_state.get("current_task_id")
+        if not task_id:
             return web.json_response(
-                {"error": "Cannot cancel job: worker_id not found in job state."},
+                {"error": "Cannot cancel job: task_id not found in job state."},
                 status=500,
             )
 
-        worker_info = await self.storage.get_worker_info(worker_id)
-        task_id = job_state.get("current_task_id")
-        if not task_id:
+        worker_id = job_state.get("task_worker_id")
+        if not worker_id and "task_worker_id" not in job_state:
             return web.json_response(
-                {"error": "Cannot cancel job: task_id not found in job state."},
+                {"error": "Cannot cancel job: worker_id not found in job state."},
                 status=500,
             )
 
         # Set Redis flag as a reliable fallback/primary mechanism
         await self.storage.set_task_cancellation_flag(task_id)
+        if not worker_id:
+            # Still waiting in a shared queue: the worker that takes it will see the flag.
+            return web.json_response({"status": "cancellation_request_accepted"})
+
+        worker_info = await self.storage.get_worker_info(worker_id)
 
         # Attempt WebSocket-based cancellation if supported
         if worker_info and worker_info.get("capabilities", {}).get("websockets"):
@@ -348,8 +430,14 @@ class OrchestratorEngine:
             logger.error(error_msg)
             return web.json_response({"error": error_msg}, status=501)
 
+    async def _metrics_handler(self, _request: web.Request) -> web.Response:
+        # Gauges of shared state are read from the storage when scraped.
+        metrics.task_queue_length.set({}, await self.storage.get_job_queue_length())
+        metrics.active_workers.set({}, await self.storage.get_active_worker_count())
+        return web.Response(body=render(), content_type="text/plain")
+
     async def _get_workers_handler(self, request: web.Request) -> web.Response:
-        workers = await self.storage.get_available_workers()
+        workers = await self.storage.get_available_workers(allow_stale=True)
         return web.json_response(workers)
 
     async def _get_jobs_handler(self, request: web.Request) -> web.Response:
@@ -374,8 +462,6 @@ class OrchestratorEngine:
         return web.json_response(dashboard_data)
 
     async def _task_result_handler(self, request: web.Request) -> web.Response:
-        import logging
-
         # Use pre-parsed data from middleware if available, otherwise read the body
         data = request.get("task_result_data")
         if data is None:
@@ -384,11 +470,6 @@ class OrchestratorEngine:
             except Exception:
                 return web.json_response({"error": "Invalid JSON body"}, status=400)
 
-        job_id = data.get("job_id")
-        task_id = data.get("task_id")
-        result = data.get("result", {})
-        result_status = result.get("status", "success")
-        error_message = result.get("error")
         payload_worker_id = data.get("worker_id")
 
         # Security check: Ensure the worker_id from the payload matches the authenticated worker
@@ -406,25 +487,52 @@ class OrchestratorEngine:
                 status=403,
             )
 
+        tracing_context = {str(k): v for k, v in request.headers.items()}
+        response, status = await self._process_task_result(authenticated_worker_id, data, tracing_context)
+        return web.json_response(response, status=status)
+
+    async def _process_task_result(
+        self,
+        authenticated_worker_id: str,
+        data: dict[str, Any],
+        tracing_context: dict[str, Any],
+    ) -> tuple[dict[str, Any], int]:
+        """Applies a task result submitted over HTTP or the worker's WebSocket.
+
+        :return: The response body and HTTP status code.
+        """
+        import logging
+
+        job_id = data.get("job_id")
+        task_id = data.get("task_id")
+        result = data.get("result", {})
+        result_status = result.get("status", "success")
+
         if not job_id or not task_id:
-            return web.json_response({"error": "job_id and task_id are required"}, status=400)
+            return {"error": "job_id and task_id are required"}, 400
+
+        if self.config.TASK_LEASE_SECONDS > 0:
+            # The result arrived, so the task must not be redelivered.
+            await self.storage.ack_task_lease(task_id)
 
         job_state = await self.storage.get_job_state(job_id)
         if not job_state:
-            return web.json_response({"error": "Job not found"}, status=404)
+            return {"error": "Job not found"}, 404
 
         # Handle parallel task completion
         if job_state.get("status") == "waiting_for_parallel_tasks":
+            await record_task_outcome(self.storage, authenticated_worker_id, result_status == "success")
             await self.storage.remove_job_from_watch(f"{job_id}:{task_id}")
             job_state.setdefault("aggregation_results", {})[task_id] = result
             job_state.setdefault("active_branches", []).remove(task_id)
+            job_state.get("branch_task_info", {}).pop(task_id, None)
 
             if not job_state["active_branches"]:
                 logger.info(f"All parallel branches for job {job_id} have completed.")
+                job_state.pop("branch_task_info", None)
                 job_state["status"] = "running"
                 job_state["current_state"] = job_state["aggregation_target"]
-                await self.storage.save_job_state(job_id, job_state)
-                await self.storage.enqueue_job(job_id)
+                await self.storage.commit_transition(job_id, job_state, enqueue=True)
             else:
                 logger.info(
                     f"Branch {task_id} for job {job_id} completed. "
@@ -432,15 +540,15 @@ class OrchestratorEngine:
                 )
                 await self.storage.save_job_state(job_id, job_state)
 
-            return web.json_response({"status": "parallel_branch_result_accepted"}, status=200)
+            return {"status": "parallel_branch_result_accepted"}, 200
 
         await self.storage.remove_job_from_watch(job_id)
 
-        import time
-
-        now = time.monotonic()
+        now = time()
         dispatched_at = job_state.get("task_dispatched_at", now)
         duration_ms = int((now - dispatched_at) * 1000)
+        # Keep the worker's reputation current without re-reading the history
+        await record_task_outcome(self.storage, authenticated_worker_id, result_status == "success", duration_ms)
 
         await self.history_storage.log_job_event(
             {
@@ -453,7 +561,7 @@ class OrchestratorEngine:
             },
         )
 
-        job_state["tracing_context"] = {str(k): v for k, v in request.headers.items()}
+        job_state["tracing_context"] = tracing_context
 
         if result_status == "failure":
             error_details = result.get("error", {})
@@ -481,20 +589,20 @@ class OrchestratorEngine:
             else:  # TRANSIENT_ERROR or any other/unspecified error
                 await self._handle_task_failure(job_state, task_id, error_message)
 
-            return web.json_response({"status": "result_accepted_failure"}, status=200)
+            return {"status": "result_accepted_failure"}, 200
 
         if result_status == "cancelled":
             logging.info(f"Task {task_id} for job {job_id} was cancelled by worker.")
             job_state["status"] = "cancelled"
-            await self.storage.save_job_state(job_id, job_state)
             # Optionally, trigger a specific 'cancelled' transition if defined in the blueprint
             transitions = job_state.get("current_task_transitions", {})
             if next_state := transitions.get("cancelled"):
                 job_state["current_state"] = next_state
                 job_state["status"] = "running"  # It's running the cancellation handler now
+                await self.storage.commit_transition(job_id, job_state, enqueue=True)
+            else:
                 await self.storage.save_job_state(job_id, job_state)
-                await self.storage.enqueue_job(job_id)
-            return web.json_response({"status": "result_accepted_cancelled"}, status=200)
+            return {"status": "result_accepted_cancelled"}, 200
 
         transitions = job_state.get("current_task_transitions", {})
         if next_state := transitions.get(result_status):
@@ -508,24 +616,40 @@ class OrchestratorEngine:
 
             job_state["current_state"] = next_state
             job_state["status"] = "running"
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.enqueue_job(job_id)
+            await self.storage.commit_transition(job_id, job_state, enqueue=True)
         else:
             logging.error(f"Job {job_id} failed. Worker returned unhandled status '{result_status}'.")
             job_state["status"] = "failed"
             job_state["error_message"] = f"Worker returned unhandled status: {result_status}"
             await self.storage.save_job_state(job_id, job_state)
 
-        return web.json_response({"status": "result_accepted_success"}, status=200)
+        return {"status": "result_accepted_success"}, 200
 
-    async def _handle_task_failure(self, job_state: dict, task_id: str, error_message: str | None):
+    async def _handle_task_failure(self, job_state: dict, task_id: str | None, error_message: str | None) -> None:
+        await self._handle_task_failures([job_state], error_message)
+
+    async def _handle_task_failures(self, job_states: list[dict], error_message: str | None) -> None:
+        """Retries the failed tasks of the jobs, or fails or quarantines the jobs whose
+        retries are exhausted, and writes all of their states in one batch.
+        """
         import logging
 
-        job_id = job_state["id"]
-        retry_count = job_state.get("retry_count", 0)
         max_retries = self.config.JOB_MAX_RETRIES
+        watch: dict[str, float] = {}
+        worker_tasks: list[WorkerTask] = []
+        quarantined: list[str] = []
+        dispatch_errors: list[Exception] = []
+
+        for job_state in job_states:
+            job_id = job_state["id"]
+            retry_count = job_state.get("retry_count", 0)
+            if retry_count >= max_retries:
+                logging.critical(f"Job {job_id} has failed {max_retries + 1} times. Moving to quarantine.")
+                job_state["status"] = "quarantined"
+                job_state["error_message"] = f"Task failed after {max_retries + 1} attempts: {error_message}"
+                quarantined.append(job_id)
+                continue
 
-        if retry_count < max_retries:
             job_state["retry_count"] = retry_count + 1
             logging.info(f"Retrying task for job {job_id}. Attempt {retry_count + 1}/{max_retries}.")
 
@@ -534,25 +658,30 @@ class OrchestratorEngine:
                 logging.error(f"Cannot retry job {job_id}: missing 'current_task_info' in job state.")
                 job_state["status"] = "failed"
                 job_state["error_message"] = "Cannot retry: original task info not found."
-                await self.storage.save_job_state(job_id, job_state)
-                return
+                continue
 
-            now = get_running_loop().time()
+            now = time()
             timeout_seconds = task_info.get("timeout_seconds", self.config.WORKER_TIMEOUT_SECONDS)
-            timeout_at = now + timeout_seconds
-
             job_state["status"] = "waiting_for_worker"
             job_state["task_dispatched_at"] = now
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.add_job_to_watch(job_id, timeout_at)
+            # Watched even if no worker can be selected, so that the Watcher fails it later.
+            watch[job_id] = now + timeout_seconds
+            try:
+                worker_tasks.append(await self.dispatcher.prepare_task(job_state, task_info))
+            except Exception as e:
+                dispatch_errors.append(e)
 
-            await self.dispatcher.dispatch(job_state, task_info)
-        else:
-            logging.critical(f"Job {job_id} has failed {max_retries + 1} times. Moving to quarantine.")
-            job_state["status"] = "quarantined"
-            job_state["error_message"] = f"Task failed after {max_retries + 1} attempts: {error_message}"
-            await self.storage.save_job_state(job_id, job_state)
+        await self.storage.commit_transitions(
+            {job_state["id"]: job_state for job_state in job_states},
+            watch=watch,
+            worker_tasks=worker_tasks,
+        )
+        for job_id in quarantined:
             await self.storage.quarantine_job(job_id)
+        if worker_tasks:
+            self.dispatcher.push_tasks(worker_tasks)
+        if dispatch_errors:
+            raise dispatch_errors[0]
 
     async def _human_approval_webhook_handler(self, request: web.Request) -> web.Response:
         job_id = request.match_info.get("job_id")
@@ -576,8 +705,7 @@ class OrchestratorEngine:
             return web.json_response({"error": f"Invalid decision '{decision}' for this job"}, status=400)
         job_state["current_state"] = next_state
         job_state["status"] = "running"
-        await self.storage.save_job_state(job_id, job_state)
-        await self.storage.enqueue_job(job_id)
+        await self.storage.commit_transition(job_id, job_state, enqueue=True)
         return web.json_response({"status": "approval_received", "job_id": job_id})
 
     async def _get_quarantined_jobs_handler(self, request: web.Request) -> web.Response:
@@ -617,7 +745,7 @@ class OrchestratorEngine:
     def _setup_routes(self):
         public_app = web.Application()
         public_app.router.add_get("/status", status_handler)
-        public_app.router.add_get("/metrics", metrics_handler)
+        public_app.router.add_get("/metrics", self._metrics_handler)
         public_app.router.add_post("/webhooks/approval/{job_id}", self._human_approval_webhook_handler)
         public_app.router.add_post("/debug/flush_db", self._flush_db_handler)
         public_app.router.add_get("/docs", self._docs_handler)
@@ -664,9 +792,11 @@ class OrchestratorEngine:
         worker_app = web.Application(middlewares=worker_middlewares)
         worker_app.router.add_post("/workers/register", self._register_worker_handler)
         worker_app.router.add_get("/workers/{worker_id}/tasks/next", self._handle_get_next_task)
+        worker_app.router.add_post("/workers/{worker_id}/tasks/{task_id}/lease", self._extend_task_lease_handler)
         worker_app.router.add_patch("/workers/{worker_id}", self._worker_update_handler)
         worker_app.router.add_post("/tasks/result", self._task_result_handler)
         worker_app.router.add_get("/ws/{worker_id}", self._websocket_handler)
+        worker_app.router.add_get("/blobs/{digest}", self._get_blob_handler)
         self.app.add_subapp("/_worker/", worker_app)
 
     def _register_common_routes(self, app):
@@ -688,36 +818,132 @@ class OrchestratorEngine:
         ws = web.WebSocketResponse()
         await ws.prepare(request)
 
-        await self.ws_manager.register(worker_id, ws)
+        # Workers opt in to receiving tasks over the socket with `?push_tasks=true`.
+        push_tasks = request.query.get("push_tasks", "").lower() in ("1", "true", "yes")
+        await self.ws_manager.register(worker_id, ws, push_tasks=push_tasks)
+        handlers: set[Task] = set()
         try:
             async for msg in ws:
                 if msg.type == WSMsgType.TEXT:
                     try:
                         data = msg.json()
-                        await self.ws_manager.handle_message(worker_id, data)
+                        if data.get("event") in ("task_result", "heartbeat"):
+                            # Processed in the background, so that acks for tasks pushed
+                            # meanwhile (e.g. a retry of this very task) are still read.
+                            handler = create_task(self._handle_websocket_message(worker_id, ws, data))
+                            handlers.add(handler)
+                            handler.add_done_callback(handlers.discard)
+                        else:
+                            await self.ws_manager.handle_message(worker_id, data)
                     except Exception as e:
                         logger.error(f"Error processing WebSocket message from {worker_id}: {e}")
                 elif msg.type == WSMsgType.ERROR:
                     logger.error(f"WebSocket connection for {worker_id} closed with exception {ws.exception()}")
                     break
         finally:
-            await self.ws_manager.unregister(worker_id)
+            await self.ws_manager.unregister(worker_id, ws)
+            if handlers:
+                await gather(*handlers, return_exceptions=True)
         return ws
 
+    async def _handle_websocket_message(self, worker_id: str, ws: web.WebSocketResponse, data: dict[str, Any]):
+        """Handles a task result or heartbeat sent over the worker's WebSocket the same
+        way as its HTTP endpoint, and replies with the would-be HTTP response.
+        """
+        event_type = data.get("event")
+        try:
+            if event_type == "task_result":
+                payload_worker_id = data.get("worker_id")
+                if payload_worker_id and payload_worker_id != worker_id:
+                    response, status = {"error": "Forbidden: cannot submit results for another worker."}, 403
+                else:
+                    response, status = await self._process_task_result(
+                        worker_id, data, data.get("tracing_context") or {}
+                    )
+                reply = {"command": "task_result_ack", "task_id": data.get("task_id"), "code": status}
+            else:
+                response, status = await self._apply_worker_update(worker_id, data.get("data"))
+                reply = {"command": "heartbeat_ack", "code": status}
+            if not ws.closed:
+                await ws.send_json({**reply, "response": response})
+        except Exception:
+            logger.exception(f"Error handling WebSocket '{event_type}' from worker {worker_id}")
+
     async def _handle_get_next_task(self, request: web.Request) -> web.Response:
         worker_id = request.match_info.get("worker_id")
         if not worker_id:
             return web.json_response({"error": "worker_id is required in path"}, status=400)
 
         logger.debug(f"Worker {worker_id} is requesting a new task.")
-        task = await self.storage.dequeue_task_for_worker(worker_id, self.config.WORKER_POLL_TIMEOUT_SECONDS)
+        shared_queues = None
+        if self.config.DISPATCH_MODE == DISPATCH_MODE_SHARED:
+            worker_info = await self.storage.get_worker_info(worker_id)
+            if worker_info:
+                shared_queues = await self.dispatcher.shared_queues_for_worker(worker_info)
+        # Parked in-process: idle workers do not hold a storage connection each.
+        task = await self.task_waiter.wait_for_task(
+            worker_id,
+            self.config.WORKER_POLL_TIMEOUT_SECONDS,
+            shared_queues,
+            self.config.TASK_LEASE_SECONDS,
+        )
 
+        if task and task.get("shared_queue"):
+            # Tasks from shared queues are assigned to the worker that took them.
+            await self.storage.update_job_state(task["job_id"], {"task_worker_id": worker_id})
         if task:
             logger.info(f"Sending task {task.get('task_id')} to worker {worker_id}")
             return web.json_response(task, status=200)
         logger.debug(f"No tasks for worker {worker_id}, responding 204.")
         return web.Response(status=204)
 
+    async def _extend_task_lease_handler(self, request: web.Request) -> web.Response:
+        """Extends the lease on a task the worker is still executing."""
+        worker_id = request.match_info["worker_id"]
+        task_id = request.match_info["task_id"]
+        lease_seconds = self.config.TASK_LEASE_SECONDS
+        if lease_seconds <= 0:
+            return web.json_response({"error": "Task leases are disabled"}, status=404)
+        if not await self.storage.extend_task_lease(worker_id, task_id, lease_seconds):
+            # The lease expired and the task may already be redelivered to another worker.
+            return web.json_response({"error": "Lease not found"}, status=404)
+        return web.json_response({"status": "lease_extended", "lease_seconds": lease_seconds}, status=200)
+
+    async def _get_blob_handler(self, request: web.Request) -> web.StreamResponse:
+        """Streams a blob referenced from a task payload. Supports single `Range`
+        requests, so workers can resume interrupted downloads.
+        """
+        digest = request.match_info.get("digest", "")
+        blob_store = self.blob_store
+        size = await blob_store.size(digest) if blob_store and is_valid_digest(digest) else None
+        if blob_store is None or size is None:
+            return web.json_response({"error": "Blob not found"}, status=404)
+
+        try:
+            byte_range = request.http_range
+        except ValueError:
+            return web.json_response({"error": "Invalid Range header"}, status=416)
+
+        start, end, status = 0, size, 200
+        if byte_range.start is not None or byte_range.stop is not None:
+            start, end, _ = byte_range.indices(size)
+            if start >= end:
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+            status = 206
+
+        response = web.StreamResponse(
+            status=status,
+            headers={"Accept-Ranges": "bytes", "Content-Type": "application/octet-stream", "ETag": f'"{digest}"'},
+        )
+        response.content_length = end - start
+        if status == 206:
+            response.headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        await response.prepare(request)
+        async for chunk in blob_store.iter_chunks(digest, start, end):
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
     async def _worker_update_handler(self, request: web.Request) -> web.Response:
         """
         Handles both full updates and lightweight heartbeats for a worker.
@@ -729,7 +955,6 @@ class OrchestratorEngine:
         if not worker_id:
             return web.json_response({"error": "worker_id is required in path"}, status=400)
 
-        ttl = self.config.WORKER_HEALTH_CHECK_INTERVAL_SECONDS * 2
         update_data = None
 
         # Check for body content without consuming it if it's not JSON
@@ -744,11 +969,24 @@ class OrchestratorEngine:
                     f"Received PATCH from worker {worker_id} with non-JSON body. Treating as TTL-only heartbeat."
                 )
 
+        response, status = await self._apply_worker_update(worker_id, update_data)
+        return web.json_response(response, status=status)
+
+    async def _apply_worker_update(
+        self,
+        worker_id: str,
+        update_data: dict[str, Any] | None,
+    ) -> tuple[dict[str, Any], int]:
+        """Applies a heartbeat received over HTTP or the worker's WebSocket.
+
+        :return: The response body and HTTP status code.
+        """
+        ttl = self.config.WORKER_HEALTH_CHECK_INTERVAL_SECONDS * 2
         if update_data:
             # Full update path
             updated_worker = await self.storage.update_worker_status(worker_id, update_data, ttl)
             if not updated_worker:
-                return web.json_response({"error": "Worker not found"}, status=404)
+                return {"error": "Worker not found"}, 404
 
             await self.history_storage.log_worker_event(
                 {
@@ -757,13 +995,13 @@ class OrchestratorEngine:
                     "worker_info_snapshot": updated_worker,
                 },
             )
-            return web.json_response(updated_worker, status=200)
+            return updated_worker, 200
         else:
             # Lightweight TTL-only heartbeat path
             refreshed = await self.storage.refresh_worker_ttl(worker_id, ttl)
             if not refreshed:
-                return web.json_response({"error": "Worker not found"}, status=404)
-            return web.json_response({"status": "ttl_refreshed"})
+                return {"error": "Worker not found"}, 404
+            return {"status": "ttl_refreshed"}, 200
 
     async def _register_worker_handler(self, request: web.Request) -> web.Response:
         # The worker_registration_data is attached by the auth middleware
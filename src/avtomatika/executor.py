@@ -1,7 +1,8 @@
-from asyncio import CancelledError, Task, create_task, sleep
-from inspect import signature
+from asyncio import FIRST_COMPLETED, CancelledError, Task, create_task, sleep, wait
+from collections import deque
+from copy import deepcopy
 from logging import getLogger
-from time import monotonic
+from time import monotonic, time
 from types import SimpleNamespace
 from typing import TYPE_CHECKING, Any
 from uuid import uuid4
@@ -48,11 +49,15 @@ except ImportError:
     inject = NoOpPropagate().inject
     TraceContextTextMapPropagator = NoOpTraceContextTextMapPropagator  # Keep as class for consistency
 
+from .blobs.base import BlobView
 from .context import ActionFactory
-from .data_types import ClientConfig, JobContext
+from .data_types import ClientConfig, FencingToken, JobContext
 from .history.base import HistoryStorageBase
+from .history.noop import NoOpHistoryStorage
+from .leader import still_leading
 
 if TYPE_CHECKING:
+    from .blueprint import StateMachineBlueprint
     from .engine import OrchestratorEngine
 
 logger = getLogger(
@@ -74,6 +79,13 @@ class JobExecutor:
         self.dispatcher = engine.dispatcher
         self._running = False
         self._processing_messages: set[str] = set()
+        self._active_tasks: set[Task] = set()
+        # Jobs taken over from crashed consumers, started before new jobs are fetched
+        self._reclaimed_jobs: deque[tuple[str, str]] = deque()
+        self._reclaim_cursor = "0-0"
+        # job_id -> the task processing the job's latest message, so messages of a job run in order
+        self._job_tails: dict[str, Task] = {}
+        self._scheduled_messages: set[str] = set()
 
     async def _process_job(self, job_id: str, message_id: str):
         """The core logic for processing a single job dequeued from storage."""
@@ -138,103 +150,129 @@ class JobExecutor:
                     )
                     return
 
-                # Prepare the context and action factory for the handler.
-                action_factory = ActionFactory(job_id)
-                client_config_dict = job_state.get("client_config", {})
-                client_config = ClientConfig(
-                    token=client_config_dict.get("token", ""),
-                    plan=client_config_dict.get("plan", "unknown"),
-                    params=client_config_dict.get("params", {}),
-                )
-                context = JobContext(
-                    job_id=job_id,
-                    current_state=job_state["current_state"],
-                    initial_data=job_state["initial_data"],
-                    state_history=job_state.get("state_history", {}),
-                    client=client_config,
-                    actions=action_factory,
-                    data_stores=SimpleNamespace(**blueprint.data_stores),
-                    tracing_context=tracing_context,
-                    aggregation_results=job_state.get("aggregation_results"),
-                )
-
-                try:
-                    # Find and execute the appropriate handler for the current state.
-                    # It's important to check for aggregator handlers first for states
-                    # that are targets of parallel execution.
-                    is_aggregator_state = job_state.get("aggregation_target") == job_state.get("current_state")
-                    if is_aggregator_state and job_state.get("current_state") in blueprint.aggregator_handlers:
-                        handler = blueprint.aggregator_handlers[job_state["current_state"]]
-                    else:
-                        handler = blueprint.find_handler(context.current_state, context)
-
-                    # Build arguments for the handler dynamically.
-                    handler_signature = signature(handler)
-                    params_to_inject = {}
-
-                    if "context" in handler_signature.parameters:
-                        params_to_inject["context"] = context
-                        if "actions" in handler_signature.parameters:
-                            params_to_inject["actions"] = action_factory
-                    else:
-                        # New injection logic with prioritized lookup.
-                        context_as_dict = context._asdict()
-                        for param_name in handler_signature.parameters:
-                            # Look in JobContext fields first.
-                            if param_name in context_as_dict:
-                                params_to_inject[param_name] = context_as_dict[param_name]
-                            # Then look in state_history (data from previous steps/workers).
-                            elif param_name in context.state_history:
-                                params_to_inject[param_name] = context.state_history[param_name]
-                            # Finally, look in the initial data the job was created with.
-                            elif param_name in context.initial_data:
-                                params_to_inject[param_name] = context.initial_data[param_name]
-
-                    await handler(**params_to_inject)
-
-                    duration_ms = int((monotonic() - start_time) * 1000)
-
-                    # Process the single action requested by the handler.
-                    if action_factory.next_state:
-                        await self._handle_transition(
-                            job_state,
-                            action_factory.next_state,
-                            duration_ms,
-                        )
-                    elif action_factory.task_to_dispatch:
-                        await self._handle_dispatch(
-                            job_state,
-                            action_factory.task_to_dispatch,
-                            duration_ms,
-                        )
-                    elif action_factory.parallel_tasks_to_dispatch:
-                        await self._handle_parallel_dispatch(
-                            job_state,
-                            action_factory.parallel_tasks_to_dispatch,
-                            duration_ms,
-                        )
-                    elif action_factory.sub_blueprint_to_run:
-                        await self._handle_run_blueprint(
-                            job_state,
-                            action_factory.sub_blueprint_to_run,
-                            duration_ms,
-                        )
-
-                except Exception as e:
-                    # This catches errors within the handler's execution.
-                    duration_ms = int((monotonic() - start_time) * 1000)
-                    await self._handle_failure(job_state, e, duration_ms)
+                # With a blob store, handlers see the initial data through a view that
+                # fetches blobs only for the keys that are read.
+                blob_view = None
+                initial_data = job_state["initial_data"]
+                if self.engine.blob_store:
+                    blob_view = BlobView(
+                        self.engine.blob_store,
+                        initial_data,
+                        self.engine.config.BLOB_INLINE_THRESHOLD_BYTES,
+                    )
+                    initial_data = blob_view.data
+
+                # Pure transitions are run in-process up to this many times before the
+                # job goes back through the queue. A limit of 0 disables chaining.
+                max_chained_steps = self.engine.config.EXECUTOR_MAX_CHAINED_STEPS
+                chained_steps = 0
+                while True:
+                    action_factory = ActionFactory(job_id)
+                    context = self._build_context(job_state, initial_data, blueprint, action_factory, tracing_context)
+
+                    try:
+                        # Find and execute the appropriate handler for the current state.
+                        # It's important to check for aggregator handlers first for states
+                        # that are targets of parallel execution.
+                        is_aggregator_state = job_state.get("aggregation_target") == job_state.get("current_state")
+                        if is_aggregator_state and job_state.get("current_state") in blueprint.aggregator_handlers:
+                            handler = blueprint.aggregator_handlers[job_state["current_state"]]
+                        else:
+                            if blob_view:
+                                await blob_view.resolve(blueprint.condition_keys(context.current_state))
+                            handler = blueprint.find_handler(context.current_state, context)
+
+                        # Arguments are bound with the plan precompiled from the handler's signature.
+                        plan = blueprint.handler_plan(handler)
+                        if blob_view:
+                            await blob_view.resolve(plan.data_keys)
+                        await handler(**plan.bind(context))
+                        if blob_view:
+                            # Only values the handler added or changed are offloaded again.
+                            job_state["initial_data"] = await blob_view.store()
+
+                        duration_ms = int((monotonic() - start_time) * 1000)
+
+                        # Process the single action requested by the handler.
+                        if action_factory.next_state:
+                            next_state = action_factory.next_state
+                            if chained_steps < max_chained_steps and next_state not in TERMINAL_STATES:
+                                chained_steps += 1
+                                await self._chain_transition(job_state, next_state, duration_ms)
+                                span.set_attribute("job.chained_steps", chained_steps)
+                                start_time = monotonic()
+                                continue
+                            await self._handle_transition(
+                                job_state,
+                                next_state,
+                                duration_ms,
+                            )
+                        elif action_factory.task_to_dispatch:
+                            await self._handle_dispatch(
+                                job_state,
+                                action_factory.task_to_dispatch,
+                                duration_ms,
+                            )
+                        elif action_factory.parallel_tasks_to_dispatch:
+                            await self._handle_parallel_dispatch(
+                                job_state,
+                                action_factory.parallel_tasks_to_dispatch,
+                                duration_ms,
+                            )
+                        elif action_factory.sub_blueprint_to_run:
+                            await self._handle_run_blueprint(
+                                job_state,
+                                action_factory.sub_blueprint_to_run,
+                                duration_ms,
+                            )
+                        elif chained_steps:
+                            # The chained transitions have not been persisted yet.
+                            await self.storage.commit_transition(job_id, job_state)
+
+                    except Exception as e:
+                        # This catches errors within the handler's execution.
+                        duration_ms = int((monotonic() - start_time) * 1000)
+                        await self._handle_failure(job_state, e, duration_ms)
+                    break
         finally:
             await self.storage.ack_job(message_id)
             if message_id in self._processing_messages:
                 self._processing_messages.remove(message_id)
 
-    async def _handle_transition(
+    @staticmethod
+    def _build_context(
+        job_state: dict[str, Any],
+        initial_data: dict[str, Any],
+        blueprint: "StateMachineBlueprint",
+        action_factory: ActionFactory,
+        tracing_context: dict[str, str],
+    ) -> JobContext:
+        client_config_dict = job_state.get("client_config", {})
+        client_config = ClientConfig(
+            token=client_config_dict.get("token", ""),
+            plan=client_config_dict.get("plan", "unknown"),
+            params=client_config_dict.get("params", {}),
+        )
+        return JobContext(
+            job_id=job_state["id"],
+            current_state=job_state["current_state"],
+            initial_data=initial_data,
+            state_history=job_state.get("state_history", {}),
+            client=client_config,
+            actions=action_factory,
+            data_stores=SimpleNamespace(**blueprint.data_stores),
+            tracing_context=tracing_context,
+            aggregation_results=job_state.get("aggregation_results"),
+        )
+
+    async def _advance_state(
         self,
         job_state: dict[str, Any],
         next_state: str,
         duration_ms: int,
+        snapshot: dict[str, Any] | None = None,
     ):
+        """Logs the end of the current state and moves the job to `next_state` in memory."""
         job_id = job_state["id"]
         previous_state = job_state["current_state"]
         logger.info(f"Job {job_id} transitioning from {previous_state} to {next_state}")
@@ -247,7 +285,7 @@ class JobExecutor:
                 "duration_ms": duration_ms,
                 "previous_state": previous_state,
                 "next_state": next_state,
-                "context_snapshot": job_state,
+                "context_snapshot": snapshot if snapshot is not None else dict(job_state),
             },
         )
 
@@ -255,11 +293,48 @@ class JobExecutor:
         job_state["retry_count"] = 0
         job_state["current_state"] = next_state
         job_state["status"] = "running"
-        await self.storage.save_job_state(job_id, job_state)
 
-        if next_state not in TERMINAL_STATES:
-            await self.storage.enqueue_job(job_id)
-        else:
+    async def _chain_transition(
+        self,
+        job_state: dict[str, Any],
+        next_state: str,
+        duration_ms: int,
+    ):
+        """Moves the job to `next_state` without persisting it, so that the next
+        handler runs in the same worker coroutine. History still records the
+        end of the previous state and the start of the next one.
+        """
+        # The next handler keeps mutating the same state, so history gets a copy of it.
+        # One copy serves both events, and none is taken when history is disabled.
+        snapshot = job_state if isinstance(self.history_storage, NoOpHistoryStorage) else deepcopy(job_state)
+        await self._advance_state(job_state, next_state, duration_ms, snapshot)
+        await self.history_storage.log_job_event(
+            {
+                "job_id": job_state["id"],
+                "state": next_state,
+                "event_type": "state_started",
+                "attempt_number": 1,
+                # The snapshot with the fields `_advance_state` changed
+                "context_snapshot": {
+                    **snapshot,
+                    "retry_count": job_state["retry_count"],
+                    "current_state": job_state["current_state"],
+                    "status": job_state["status"],
+                },
+            },
+        )
+
+    async def _handle_transition(
+        self,
+        job_state: dict[str, Any],
+        next_state: str,
+        duration_ms: int,
+    ):
+        job_id = job_state["id"]
+        await self._advance_state(job_state, next_state, duration_ms)
+        await self.storage.commit_transition(job_id, job_state, enqueue=next_state not in TERMINAL_STATES)
+
+        if next_state in TERMINAL_STATES:
             logger.info(f"Job {job_id} reached terminal state {next_state}")
             await self._check_and_resume_parent(job_state)
 
@@ -290,7 +365,7 @@ class JobExecutor:
         else:
             logger.info(f"Job {job_id} dispatching task: {task_info}")
 
-            now = monotonic()
+            now = time()
             # Safely get timeout, falling back to the global config if not provided in the task.
             # This prevents TypeErrors if 'timeout_seconds' is missing or wrong type.
             timeout_seconds = task_info.get("timeout_seconds") or self.engine.config.WORKER_TIMEOUT_SECONDS
@@ -298,16 +373,20 @@ class JobExecutor:
                 timeout_seconds = int(timeout_seconds) if timeout_seconds else self.engine.config.WORKER_TIMEOUT_SECONDS
             timeout_at = now + timeout_seconds
 
-            # Set status to waiting and add to watch list *before* dispatching
             job_state["status"] = "waiting_for_worker"
             job_state["task_dispatched_at"] = now
             job_state["current_task_info"] = task_info  # Save for retries
             job_state["current_task_transitions"] = task_info.get("transitions", {})
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.add_job_to_watch(job_id, timeout_at)
 
-            # Now, dispatch the task
-            await self.dispatcher.dispatch(job_state, task_info)
+            # Select the worker, then save the state, the watch entry and the task in one commit
+            worker_task = await self.dispatcher.prepare_task(job_state, task_info)
+            await self.storage.commit_transition(
+                job_id,
+                job_state,
+                watch={job_id: timeout_at},
+                worker_tasks=[worker_task],
+            )
+            self.dispatcher.push_tasks([worker_task])
 
     async def _handle_run_blueprint(
         self,
@@ -337,8 +416,7 @@ class JobExecutor:
             "status": "pending",
             "parent_job_id": parent_job_id,
         }
-        await self.storage.save_job_state(child_job_id, child_job_state)
-        await self.storage.enqueue_job(child_job_id)
+        await self.storage.commit_transition(child_job_id, child_job_state, enqueue=True)
 
         parent_job_state["status"] = "waiting_for_sub_job"
         parent_job_state["child_job_id"] = child_job_id
@@ -370,10 +448,13 @@ class JobExecutor:
         job_state["status"] = "waiting_for_parallel_tasks"
         job_state["aggregation_target"] = aggregate_into
         job_state["active_branches"] = branch_task_ids
+        # Save each branch's task for reassignment, like `current_task_info`
+        job_state["branch_task_info"] = dict(zip(branch_task_ids, tasks_to_dispatch, strict=True))
         job_state["aggregation_results"] = {}
-        await self.storage.save_job_state(job_id, job_state)
 
-        # Dispatch each task as a "branch"
+        # Prepare each task as a "branch"
+        watch = {}
+        worker_tasks = []
         for i, task_info in enumerate(tasks_to_dispatch):
             branch_id = branch_task_ids[i]
 
@@ -387,15 +468,16 @@ class JobExecutor:
                 **task_info,
             }
 
-            now = monotonic()
+            now = time()
             timeout_seconds = task_info.get("timeout_seconds") or self.engine.config.WORKER_TIMEOUT_SECONDS
             timeout_at = now + timeout_seconds
 
-            await self.storage.add_job_to_watch(
-                f"{job_id}:{branch_id}",
-                timeout_at,
-            )  # Watch each branch
-            await self.dispatcher.dispatch(job_state, full_task_info)
+            watch[f"{job_id}:{branch_id}"] = timeout_at  # Watch each branch
+            worker_tasks.append(await self.dispatcher.prepare_task(job_state, full_task_info))
+
+        # Save the state and enqueue all branches at once
+        await self.storage.commit_transition(job_id, job_state, watch=watch, worker_tasks=worker_tasks)
+        self.dispatcher.push_tasks(worker_tasks)
 
     async def _handle_failure(
         self,
@@ -434,9 +516,8 @@ class JobExecutor:
             job_state["retry_count"] = current_retries + 1
             job_state["status"] = "awaiting_retry"
             job_state["error_message"] = str(error)
-            await self.storage.save_job_state(job_id, job_state)
             # Re-enqueue the job to try the same state handler again.
-            await self.storage.enqueue_job(job_id)
+            await self.storage.commit_transition(job_id, job_state, enqueue=True)
             logger.warning(
                 f"Job {job_id} failed in-handler, will be retried. Attempt {job_state['retry_count']}.",
             )
@@ -493,8 +574,7 @@ class JobExecutor:
         # Update the parent job to its new state and re-enqueue it.
         parent_job_state["current_state"] = next_state
         parent_job_state["status"] = "running"
-        await self.storage.save_job_state(parent_job_id, parent_job_state)
-        await self.storage.enqueue_job(parent_job_id)
+        await self.storage.commit_transition(parent_job_id, parent_job_state, enqueue=True)
 
     @staticmethod
     def _handle_task_completion(task: Task):
@@ -509,36 +589,136 @@ class JobExecutor:
             # Log any other exceptions that occurred in the task.
             logger.exception("Unhandled exception in job processing task")
 
-    async def run(self):
-        import asyncio
+    async def reclaim_pending_jobs(self, limit: int) -> None:
+        """Takes over the next page of jobs left unacknowledged by other consumers
+        and queues them locally, continuing the scan where the last call stopped.
+        """
+        room = limit - len(self._reclaimed_jobs)
+        if room <= 0:
+            return
+        self._reclaim_cursor, jobs = await self.storage.reclaim_jobs(self._reclaim_cursor, room)
+        queued = self._scheduled_messages | {message_id for _, message_id in self._reclaimed_jobs}
+        for job_id, message_id in jobs:
+            if message_id not in queued:
+                self._reclaimed_jobs.append((job_id, message_id))
+
+    async def _reclaim_loop(self, limit: int) -> None:
+        interval = self.engine.config.EXECUTOR_RECLAIM_INTERVAL_SECONDS
+        while self._running:
+            try:
+                await self.reclaim_pending_jobs(limit)
+                await sleep(interval)
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error reclaiming pending jobs.")
+                await sleep(1)
 
+    async def _partition_loop(self) -> None:
+        ttl = self.engine.config.JOB_STREAM_PARTITION_TTL_SECONDS
+        while self._running:
+            try:
+                await self.storage.refresh_job_stream_partitions(ttl)
+                await sleep(ttl / 3)
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error refreshing job stream partitions.")
+                await sleep(1)
+
+    def _start_job(self, job_id: str, message_id: str) -> None:
+        """Starts processing a message, after the previous message of the same job."""
+        if message_id in self._scheduled_messages:
+            return
+        self._scheduled_messages.add(message_id)
+        previous = self._job_tails.get(job_id)
+        task = create_task(self._process_job_after(previous, job_id, message_id))
+        self._job_tails[job_id] = task
+        self._active_tasks.add(task)
+        task.add_done_callback(self._active_tasks.discard)
+        task.add_done_callback(self._handle_task_completion)
+        task.add_done_callback(lambda _: self._scheduled_messages.discard(message_id))
+        task.add_done_callback(
+            lambda done: self._job_tails.pop(job_id) if self._job_tails.get(job_id) is done else None
+        )
+
+    async def _process_job_after(self, previous: Task | None, job_id: str, message_id: str) -> None:
+        if previous is not None:
+            await wait([previous])
+        await self._process_job(job_id, message_id)
+
+    async def run(self):
         logger.info("JobExecutor started.")
         self._running = True
-        semaphore = asyncio.Semaphore(self.engine.config.EXECUTOR_MAX_CONCURRENT_JOBS)
+        max_concurrent_jobs = self.engine.config.EXECUTOR_MAX_CONCURRENT_JOBS
+        block_ms = self.engine.config.EXECUTOR_DEQUEUE_BLOCK_MS
+        reclaim_task = create_task(self._reclaim_loop(max_concurrent_jobs))
+        partition_task = create_task(self._partition_loop())
 
         while self._running:
             try:
-                # Wait for an available slot before fetching a new job
-                await semaphore.acquire()
-
-                result = await self.storage.dequeue_job()
-                if result:
-                    job_id, message_id = result
-                    task = create_task(self._process_job(job_id, message_id))
-                    task.add_done_callback(self._handle_task_completion)
-                    # Release the semaphore slot when the task is done
-                    task.add_done_callback(lambda _: semaphore.release())
-                else:
-                    # No job found, release the slot and wait a bit
-                    semaphore.release()
-                    # Prevent busy loop if storage returns None immediately
+                free_slots = max_concurrent_jobs - len(self._active_tasks)
+                if free_slots <= 0:
+                    # Wait for at least one running job to finish before fetching more
+                    await wait(self._active_tasks, return_when=FIRST_COMPLETED)
+                    continue
+
+                # Fill all free slots from reclaimed jobs or from a single blocking read
+                started_at = monotonic()
+                reclaimed = [self._reclaimed_jobs.popleft() for _ in range(min(free_slots, len(self._reclaimed_jobs)))]
+                jobs = reclaimed or await self.storage.dequeue_jobs(free_slots, block_ms)
+                for job_id, message_id in jobs:
+                    self._start_job(job_id, message_id)
+
+                if not jobs and monotonic() - started_at < block_ms / 2000:
+                    # The storage returned without blocking (e.g. a backend without
+                    # blocking reads), so prevent a busy loop.
                     await sleep(0.1)
             except CancelledError:
                 break
             except Exception:
                 logger.exception("Error in JobExecutor main loop.")
                 await sleep(1)
+        reclaim_task.cancel()
+        partition_task.cancel()
+        try:
+            await self.storage.release_job_stream_partitions()
+        except Exception:
+            logger.exception("Failed to release job stream partitions.")
         logger.info("JobExecutor stopped.")
 
     def stop(self):
         self._running = False
+
+
+class JobStreamTrimmer:
+    """A background process, run by the leader only, that trims acknowledged entries
+    left behind in the job stream every `WATCHER_INTERVAL_SECONDS`. Acknowledged
+    entries are normally deleted on ack.
+    """
+
+    def __init__(self, engine: "OrchestratorEngine"):
+        self.storage = engine.storage
+        self.interval_seconds = engine.config.WATCHER_INTERVAL_SECONDS
+        self.fencing_token: FencingToken | None = None
+        self._running = False
+
+    async def run(self):
+        logger.info("JobStreamTrimmer started.")
+        self._running = True
+        while self._running:
+            try:
+                if not await still_leading(self.storage, self.fencing_token):
+                    logger.warning("JobStreamTrimmer is not the leader any more, not trimming.")
+                elif trimmed := await self.storage.trim_job_stream():
+                    logger.info(f"Trimmed {trimmed} acknowledged entries from the job stream.")
+                await sleep(self.interval_seconds)
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in JobStreamTrimmer main loop.")
+                await sleep(1)
+        logger.info("JobStreamTrimmer stopped.")
+
+    def stop(self):
+        self._running = False
@@ -1,17 +1,18 @@
-"""This module previously contained an active HealthChecker.
-In the new architecture with heartbeat messages from workers,
-the orchestrator no longer needs to actively poll workers.
+"""Detection of lost workers.
 
-Redis automatically deletes worker keys when their TTL expires,
-and `storage.get_available_workers()` only retrieves active keys.
-
-This file is left as a placeholder in case passive health-check
-logic is needed in the future (e.g., for logging expired workers).
+Workers report their health with heartbeat messages, so the orchestrator does
+not poll them. When a worker stops sending heartbeats, its registration
+expires. The `HealthChecker` then reassigns the tasks still waiting in the
+worker's queue, so jobs do not have to wait for the `Watcher` timeout.
+It also redelivers tasks whose lease expired before the worker returned a result.
 """
 
 from asyncio import CancelledError, sleep
 from logging import getLogger
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
+
+from .data_types import FencingToken
+from .leader import still_leading
 
 if TYPE_CHECKING:
     from .engine import OrchestratorEngine
@@ -20,20 +21,113 @@ logger = getLogger(__name__)
 
 
 class HealthChecker:
+    """A background process that periodically sweeps for workers whose
+    registration has expired and for expired task leases, and re-dispatches
+    the affected tasks. Only one instance may reassign the tasks of a lost
+    worker, so it runs on the leader only (see `LeaderElector`).
+    """
+
     def __init__(self, engine: "OrchestratorEngine"):
+        self.engine = engine
+        self.storage = engine.storage
+        self.config = engine.config
+        self.interval_seconds = self.config.WORKER_LOSS_CHECK_INTERVAL_SECONDS
+        self.fencing_token: FencingToken | None = None
         self._running = False
 
     async def run(self):
-        logger.info("HealthChecker is now passive and will not perform active checks.")
+        logger.info("HealthChecker started.")
         self._running = True
         while self._running:
             try:
-                # Sleep for a long time, as this checker is passive.
-                # The loop exists to allow for a clean shutdown.
-                await sleep(3600)
+                await sleep(self.interval_seconds)
+                if not await still_leading(self.storage, self.fencing_token):
+                    logger.warning("HealthChecker is not the leader any more, skipping the sweep.")
+                    continue
+                await self.check_lost_workers()
+                await self.redeliver_expired_leases()
             except CancelledError:
                 break
+            except Exception:
+                logger.exception("Error in HealthChecker main loop.")
         logger.info("HealthChecker stopped.")
 
     def stop(self):
         self._running = False
+
+    async def check_lost_workers(self):
+        """Reassigns the queued tasks of every worker lost since the previous check."""
+        try:
+            lost_workers = await self.storage.pop_lost_workers()
+        except NotImplementedError:
+            return
+
+        for worker_id in lost_workers:
+            # The worker may have re-registered after its registration expired.
+            if await self.storage.get_worker_info(worker_id):
+                continue
+            try:
+                await self.handle_lost_worker(worker_id)
+            except Exception:
+                logger.exception(f"Failed to reassign the tasks of lost worker {worker_id}.")
+
+    async def redeliver_expired_leases(self):
+        """Re-dispatches the tasks whose lease expired without a result."""
+        for worker_id, payload, priority in await self.storage.pop_expired_task_leases():
+            logger.warning(f"Lease of worker {worker_id} on task {payload.get('task_id')} expired. Redelivering.")
+            try:
+                await self._reassign_task(payload, priority)
+            except Exception:
+                logger.exception(f"Failed to redeliver task {payload.get('task_id')}.")
+
+    async def handle_lost_worker(self, worker_id: str):
+        tasks = await self.storage.drain_worker_tasks(worker_id)
+        logger.warning(f"Worker {worker_id} stopped sending heartbeats. Reassigning {len(tasks)} queued task(s).")
+
+        reassigned = []
+        for payload, priority in tasks:
+            if new_worker_id := await self._reassign_task(payload, priority):
+                reassigned.append({"task_id": payload.get("task_id"), "worker_id": new_worker_id})
+
+        await self.engine.history_storage.log_worker_event(
+            {
+                "worker_id": worker_id,
+                "event_type": "lost",
+                "worker_info_snapshot": {"queued_tasks": len(tasks), "reassigned_tasks": reassigned},
+            },
+        )
+
+    async def _reassign_task(self, payload: dict[str, Any], priority: float) -> str | None:
+        """Dispatches an orphaned or expired task again, if its job is still waiting for it.
+
+        :return: The ID of the new worker, or None if the task was dropped.
+        """
+        job_id = payload.get("job_id")
+        task_id = payload.get("task_id")
+        job_state = await self.storage.get_job_state(job_id) if job_id else None
+        if not job_id or not job_state:
+            logger.warning(f"Dropping orphaned task {task_id}: job {job_id} not found.")
+            return None
+
+        status = job_state.get("status")
+        if status == "waiting_for_worker" and job_state.get("current_task_id") == task_id:
+            # Keep the original requirements and dispatch strategy.
+            task_info = {**job_state.get("current_task_info", {}), "type": payload["type"]}
+        elif status == "waiting_for_parallel_tasks" and task_id in job_state.get("active_branches", []):
+            task_info = {**job_state.get("branch_task_info", {}).get(task_id, {}), "type": payload["type"]}
+        else:
+            logger.info(f"Dropping orphaned task {task_id}: job {job_id} no longer waits for it ({status}).")
+            return None
+        task_info.update({"task_id": task_id, "params": payload.get("params", {}), "priority": priority})
+
+        try:
+            worker_task = await self.engine.dispatcher.prepare_task(job_state, task_info)
+        except Exception as e:
+            # The job stays watched, so the Watcher fails it if no worker shows up in time.
+            logger.warning(f"Could not reassign orphaned task {task_id} of job {job_id}: {e}")
+            return None
+
+        await self.storage.commit_transition(job_id, job_state, worker_tasks=[worker_task])
+        self.engine.dispatcher.push_tasks([worker_task])
+        logger.info(f"Orphaned task {task_id} of job {job_id} reassigned to {worker_task.queue}.")
+        return worker_task.queue
@@ -8,7 +8,7 @@ class HistoryStorageBase(ABC):
     """
 
     @abstractmethod
-    async def initialize(self):
+    async def initialize(self) -> None:
         """Performs initialization, e.g., creating tables in the DB."""
         raise NotImplementedError
 
@@ -22,6 +22,21 @@ class HistoryStorageBase(ABC):
         """Logs an event related to the worker lifecycle."""
         raise NotImplementedError
 
+    async def log_job_events(self, events: list[dict[str, Any]]) -> None:
+        """Logs several job events at once. Backends override this with a bulk insert."""
+        for event_data in events:
+            await self.log_job_event(event_data)
+
+    async def log_worker_events(self, events: list[dict[str, Any]]) -> None:
+        """Logs several worker events at once. Backends override this with a bulk insert."""
+        for event_data in events:
+            await self.log_worker_event(event_data)
+
+    async def flush(self) -> None:
+        """Writes out any buffered events."""
+        # Unbuffered stores write every event right away
+        return None
+
     @abstractmethod
     async def get_job_history(self, job_id: str) -> list[dict[str, Any]]:
         """Gets the full history for the specified job."""
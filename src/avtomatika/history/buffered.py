@@ -0,0 +1,133 @@
+from asyncio import CancelledError, Lock, Queue, QueueEmpty, Task, create_task, wait_for
+from asyncio import TimeoutError as AsyncTimeoutError
+from contextlib import suppress
+from logging import getLogger
+from time import monotonic, time
+from typing import Any
+
+from .base import HistoryStorageBase
+
+logger = getLogger(__name__)
+
+JOB_EVENT = "job"
+WORKER_EVENT = "worker"
+
+
+class BufferedHistoryStorage(HistoryStorageBase):
+    """Puts a bounded queue and a background bulk writer in front of another history store.
+
+    `log_job_event`/`log_worker_event` only enqueue the event, so history writes no
+    longer add to job latency. A background task flushes the queue in batches as soon
+    as `batch_size` events are waiting or `flush_interval` seconds have passed. When
+    the queue is full, logging waits for free space (backpressure) instead of dropping
+    events or growing without bound. Reads flush pending events first, so they see
+    everything that was logged before them.
+    """
+
+    def __init__(
+        self,
+        storage: HistoryStorageBase,
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Queue[tuple[str, dict[str, Any]]] = Queue(maxsize=max_queue_size)
+        self._write_lock = Lock()
+        # Events taken off the queue by the background writer but not written yet.
+        self._pending: list[tuple[str, dict[str, Any]]] = []
+        self._flusher: Task | None = None
+
+    async def initialize(self) -> None:
+        await self.storage.initialize()
+        self._flusher = create_task(self._run())
+
+    async def close(self) -> None:
+        """Stops the background writer, flushes what is left and closes the wrapped store."""
+        # Flush before cancelling, so the writer is never interrupted in the middle of a batch.
+        await self.flush()
+        if self._flusher:
+            self._flusher.cancel()
+            with suppress(CancelledError):
+                await self._flusher
+            self._flusher = None
+        await self.flush()
+        if hasattr(self.storage, "close"):
+            await self.storage.close()
+
+    async def log_job_event(self, event_data: dict[str, Any]) -> None:
+        await self._queue.put((JOB_EVENT, {"timestamp": time(), **event_data}))
+
+    async def log_worker_event(self, event_data: dict[str, Any]) -> None:
+        await self._queue.put((WORKER_EVENT, {"timestamp": time(), **event_data}))
+
+    def _take_batch(self, batch: list[tuple[str, dict[str, Any]]]) -> None:
+        """Moves queued events into `batch` without waiting, up to `batch_size`."""
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except QueueEmpty:
+                return
+
+    async def _write_batch(self, batch: list[tuple[str, dict[str, Any]]]) -> None:
+        job_events = [event for kind, event in batch if kind == JOB_EVENT]
+        worker_events = [event for kind, event in batch if kind == WORKER_EVENT]
+        try:
+            if job_events:
+                await self.storage.log_job_events(job_events)
+            if worker_events:
+                await self.storage.log_worker_events(worker_events)
+        except Exception:
+            logger.exception(f"Failed to write a batch of {len(batch)} history events.")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _run(self) -> None:
+        while True:
+            self._pending.append(await self._queue.get())
+            deadline = monotonic() + self.flush_interval
+            # Keep collecting until the batch is full or the oldest event has waited long enough.
+            while True:
+                self._take_batch(self._pending)
+                remaining = deadline - monotonic()
+                if len(self._pending) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    self._pending.append(await wait_for(self._queue.get(), timeout=remaining))
+                except AsyncTimeoutError:
+                    break
+            async with self._write_lock:
+                batch, self._pending = self._pending, []
+                if batch:
+                    await self._write_batch(batch)
+
+    async def flush(self) -> None:
+        """Writes all pending and queued events to the wrapped store."""
+        async with self._write_lock:
+            while self._pending or not self._queue.empty():
+                batch, self._pending = self._pending, []
+                self._take_batch(batch)
+                await self._write_batch(batch)
+
+    async def get_job_history(self, job_id: str) -> list[dict[str, Any]]:
+        await self.flush()
+        return await self.storage.get_job_history(job_id)
+
+    async def get_jobs(self, limit: int = 100, offset: int = 0) -> list[dict[str, Any]]:
+        await self.flush()
+        return await self.storage.get_jobs(limit=limit, offset=offset)
+
+    async def get_job_summary(self) -> dict[str, int]:
+        await self.flush()
+        return await self.storage.get_job_summary()
+
+    async def get_worker_history(
+        self,
+        worker_id: str,
+        since_days: int,
+    ) -> list[dict[str, Any]]:
+        await self.flush()
+        return await self.storage.get_worker_history(worker_id, since_days)
@@ -41,6 +41,21 @@ CREATE TABLE IF NOT EXISTS worker_history (
 
 CREATE_JOB_ID_INDEX_PG = "CREATE INDEX IF NOT EXISTS idx_job_id ON job_history(job_id);"
 
+JOB_HISTORY_COLUMNS = [
+    "event_id",
+    "job_id",
+    "timestamp",
+    "state",
+    "event_type",
+    "duration_ms",
+    "previous_state",
+    "next_state",
+    "worker_id",
+    "attempt_number",
+    "context_snapshot",
+]
+WORKER_HISTORY_COLUMNS = ["event_id", "worker_id", "timestamp", "event_type", "worker_info_snapshot"]
+
 
 class PostgresHistoryStorage(HistoryStorageBase, ABC):
     """Implementation of the history store based on asyncpg for PostgreSQL."""
@@ -81,6 +96,37 @@ class PostgresHistoryStorage(HistoryStorageBase, ABC):
             await self._pool.close()
             logger.info("PostgreSQL history storage connection pool closed.")
 
+    def _event_time(self, event_data: dict[str, Any]) -> datetime:
+        # Buffered writers stamp the event when it is logged, not when it is flushed.
+        timestamp = event_data.get("timestamp")
+        return datetime.fromtimestamp(timestamp, self.tz) if timestamp else datetime.now(self.tz)
+
+    def _job_event_row(self, event_data: dict[str, Any]) -> tuple:
+        context_snapshot = event_data.get("context_snapshot")
+        return (
+            uuid4(),
+            event_data.get("job_id"),
+            self._event_time(event_data),
+            event_data.get("state"),
+            event_data.get("event_type"),
+            event_data.get("duration_ms"),
+            event_data.get("previous_state"),
+            event_data.get("next_state"),
+            event_data.get("worker_id"),
+            event_data.get("attempt_number"),
+            dumps(context_snapshot).decode("utf-8") if context_snapshot else None,
+        )
+
+    def _worker_event_row(self, event_data: dict[str, Any]) -> tuple:
+        worker_info = event_data.get("worker_info_snapshot")
+        return (
+            uuid4(),
+            event_data.get("worker_id"),
+            self._event_time(event_data),
+            event_data.get("event_type"),
+            dumps(worker_info).decode("utf-8") if worker_info else None,
+        )
+
     async def log_job_event(self, event_data: dict[str, Any]):
         """Logs a job lifecycle event to PostgreSQL."""
         if not self._pool:
@@ -93,29 +139,26 @@ class PostgresHistoryStorage(HistoryStorageBase, ABC):
                 context_snapshot
             ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
         """
-        now = datetime.now(self.tz)
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute(query, *self._job_event_row(event_data))
+        except PostgresError as e:
+            logger.error(f"Failed to log job event to PostgreSQL: {e}")
 
-        context_snapshot = event_data.get("context_snapshot")
-        context_snapshot_json = dumps(context_snapshot).decode("utf-8") if context_snapshot else None
+    async def log_job_events(self, events: list[dict[str, Any]]) -> None:
+        """Logs a batch of job events with a single COPY."""
+        if not self._pool:
+            raise RuntimeError("History storage is not initialized.")
 
-        params = (
-            uuid4(),
-            event_data.get("job_id"),
-            now,
-            event_data.get("state"),
-            event_data.get("event_type"),
-            event_data.get("duration_ms"),
-            event_data.get("previous_state"),
-            event_data.get("next_state"),
-            event_data.get("worker_id"),
-            event_data.get("attempt_number"),
-            context_snapshot_json,
-        )
         try:
             async with self._pool.acquire() as conn:
-                await conn.execute(query, *params)
+                await conn.copy_records_to_table(
+                    "job_history",
+                    records=[self._job_event_row(e) for e in events],
+                    columns=JOB_HISTORY_COLUMNS,
+                )
         except PostgresError as e:
-            logger.error(f"Failed to log job event to PostgreSQL: {e}")
+            logger.error(f"Failed to log {len(events)} job events to PostgreSQL: {e}")
 
     async def log_worker_event(self, event_data: dict[str, Any]):
         """Logs a worker lifecycle event to PostgreSQL."""
@@ -127,23 +170,26 @@ class PostgresHistoryStorage(HistoryStorageBase, ABC):
                 event_id, worker_id, timestamp, event_type, worker_info_snapshot
             ) VALUES ($1, $2, $3, $4, $5)
         """
-        now = datetime.now(self.tz)
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute(query, *self._worker_event_row(event_data))
+        except PostgresError as e:
+            logger.error(f"Failed to log worker event to PostgreSQL: {e}")
 
-        worker_info = event_data.get("worker_info_snapshot")
-        worker_info_json = dumps(worker_info).decode("utf-8") if worker_info else None
+    async def log_worker_events(self, events: list[dict[str, Any]]) -> None:
+        """Logs a batch of worker events with a single COPY."""
+        if not self._pool:
+            raise RuntimeError("History storage is not initialized.")
 
-        params = (
-            uuid4(),
-            event_data.get("worker_id"),
-            now,
-            event_data.get("event_type"),
-            worker_info_json,
-        )
         try:
             async with self._pool.acquire() as conn:
-                await conn.execute(query, *params)
+                await conn.copy_records_to_table(
+                    "worker_history",
+                    records=[self._worker_event_row(e) for e in events],
+                    columns=WORKER_HISTORY_COLUMNS,
+                )
         except PostgresError as e:
-            logger.error(f"Failed to log worker event to PostgreSQL: {e}")
+            logger.error(f"Failed to log {len(events)} worker events to PostgreSQL: {e}")
 
     def _format_row(self, row: dict[str, Any]) -> dict[str, Any]:
         """Helper to format a row from DB: convert timestamp to local TZ and decode JSON."""
@@ -41,6 +41,20 @@ CREATE TABLE IF NOT EXISTS worker_history (
 
 CREATE_JOB_ID_INDEX = "CREATE INDEX IF NOT EXISTS idx_job_id ON job_history(job_id);"
 
+INSERT_JOB_EVENT = """
+INSERT INTO job_history (
+    event_id, job_id, timestamp, state, event_type, duration_ms,
+    previous_state, next_state, worker_id, attempt_number,
+    context_snapshot
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_WORKER_EVENT = """
+INSERT INTO worker_history (
+    event_id, worker_id, timestamp, event_type, worker_info_snapshot
+) VALUES (?, ?, ?, ?, ?)
+"""
+
 
 class SQLiteHistoryStorage(HistoryStorageBase):
     """Implementation of the history store based on aiosqlite.
@@ -91,27 +105,14 @@ class SQLiteHistoryStorage(HistoryStorageBase):
 
         return item
 
-    async def log_job_event(self, event_data: dict[str, Any]):
-        """Logs a job lifecycle event to the job_history table."""
-        if not self._conn:
-            raise RuntimeError("History storage is not initialized.")
-
-        query = """
-            INSERT INTO job_history (
-                event_id, job_id, timestamp, state, event_type, duration_ms,
-                previous_state, next_state, worker_id, attempt_number,
-                context_snapshot
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        now_ts = time()
-
+    @staticmethod
+    def _job_event_row(event_data: dict[str, Any]) -> tuple:
         context_snapshot = event_data.get("context_snapshot")
-        context_snapshot_json = dumps(context_snapshot).decode("utf-8") if context_snapshot else None
-
-        params = (
+        return (
             str(uuid4()),
             event_data.get("job_id"),
-            now_ts,
+            # Buffered writers stamp the event when it is logged, not when it is flushed.
+            event_data.get("timestamp") or time(),
             event_data.get("state"),
             event_data.get("event_type"),
             event_data.get("duration_ms"),
@@ -119,43 +120,63 @@ class SQLiteHistoryStorage(HistoryStorageBase):
             event_data.get("next_state"),
             event_data.get("worker_id"),
             event_data.get("attempt_number"),
-            context_snapshot_json,
+            dumps(context_snapshot).decode("utf-8") if context_snapshot else None,
         )
 
+    @staticmethod
+    def _worker_event_row(event_data: dict[str, Any]) -> tuple:
+        worker_info = event_data.get("worker_info_snapshot")
+        return (
+            str(uuid4()),
+            event_data.get("worker_id"),
+            event_data.get("timestamp") or time(),
+            event_data.get("event_type"),
+            dumps(worker_info).decode("utf-8") if worker_info else None,
+        )
+
+    async def log_job_event(self, event_data: dict[str, Any]):
+        """Logs a job lifecycle event to the job_history table."""
+        if not self._conn:
+            raise RuntimeError("History storage is not initialized.")
+
         try:
-            await self._conn.execute(query, params)
+            await self._conn.execute(INSERT_JOB_EVENT, self._job_event_row(event_data))
             await self._conn.commit()
         except Error as e:
             logger.error(f"Failed to log job event: {e}")
 
+    async def log_job_events(self, events: list[dict[str, Any]]) -> None:
+        """Logs a batch of job events with a single executemany and one commit."""
+        if not self._conn:
+            raise RuntimeError("History storage is not initialized.")
+
+        try:
+            await self._conn.executemany(INSERT_JOB_EVENT, [self._job_event_row(e) for e in events])
+            await self._conn.commit()
+        except Error as e:
+            logger.error(f"Failed to log {len(events)} job events: {e}")
+
     async def log_worker_event(self, event_data: dict[str, Any]):
         """Logs a worker lifecycle event to the worker_history table."""
         if not self._conn:
             raise RuntimeError("History storage is not initialized.")
 
-        query = """
-            INSERT INTO worker_history (
-                event_id, worker_id, timestamp, event_type, worker_info_snapshot
-            ) VALUES (?, ?, ?, ?, ?)
-        """
-        now_ts = time()
-
-        worker_info = event_data.get("worker_info_snapshot")
-        worker_info_json = dumps(worker_info).decode("utf-8") if worker_info else None
+        try:
+            await self._conn.execute(INSERT_WORKER_EVENT, self._worker_event_row(event_data))
+            await self._conn.commit()
+        except Error as e:
+            logger.error(f"Failed to log worker event: {e}")
 
-        params = (
-            str(uuid4()),
-            event_data.get("worker_id"),
-            now_ts,
-            event_data.get("event_type"),
-            worker_info_json,
-        )
+    async def log_worker_events(self, events: list[dict[str, Any]]) -> None:
+        """Logs a batch of worker events with a single executemany and one commit."""
+        if not self._conn:
+            raise RuntimeError("History storage is not initialized.")
 
         try:
-            await self._conn.execute(query, params)
+            await self._conn.executemany(INSERT_WORKER_EVENT, [self._worker_event_row(e) for e in events])
             await self._conn.commit()
         except Error as e:
-            logger.error(f"Failed to log worker event: {e}")
+            logger.error(f"Failed to log {len(events)} worker events: {e}")
 
     async def get_job_history(self, job_id: str) -> list[dict[str, Any]]:
         """Gets the full history for the specified job, sorted by time."""
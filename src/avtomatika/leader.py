@@ -0,0 +1,141 @@
+"""Leader election among orchestrator instances.
+
+Some background services must run on one instance at a time. They used to take
+a global lock with a fixed TTL on every iteration, so a pass that took longer
+than its lock could run on two instances at once. The `LeaderElector` instead
+holds a single lease that it renews while the instance is alive, and runs the
+singleton services only while it is the leader. When the lease is lost, the
+services are stopped before another instance can take it over. When the leader
+dies, its lease expires and another instance starts the services; on a clean
+shutdown the lease is released right away.
+
+A leader that stalls for longer than its lease can still overlap with the next
+one for a moment. Every election therefore comes with a fencing token, larger
+than any earlier leader's, which the services check before their writes (see
+`still_leading`). The writes of a stale leader are refused.
+"""
+
+from asyncio import CancelledError, Task, create_task, gather, sleep, timeout
+from logging import getLogger
+from time import monotonic
+from typing import Any
+from uuid import uuid4
+
+from .data_types import FencingToken
+from .storage.base import StorageBackend
+
+logger = getLogger(__name__)
+
+LEADER_LOCK_KEY = "leader"
+
+
+class LeaderElector:
+    """Campaigns for the leader lease and runs the singleton services while it holds it.
+
+    A service is any object with a `run()` coroutine and a `stop()` method, like the
+    other background processes, and a `fencing_token` attribute, which is set to
+    the token of the term before the service is started.
+    """
+
+    def __init__(self, storage: StorageBackend, lease_seconds: int = 15):
+        self.storage = storage
+        self.lease_seconds = lease_seconds
+        self._running = False
+        self._instance_id = str(uuid4())
+        self._services: list[Any] = []
+        self._service_tasks: list[Task] = []
+        self._fencing_token: int | None = None
+        # When the lease ends at the latest. Measured from before the request that
+        # set it, so it never ends later here than in the storage.
+        self._lease_expires_at = 0.0
+
+    def add_service(self, service: Any) -> None:
+        self._services.append(service)
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fencing_token is not None and monotonic() < self._lease_expires_at
+
+    @property
+    def fencing_token(self) -> FencingToken | None:
+        """The token of the current term, larger than that of any earlier leader,
+        or None if this instance is not the leader.
+        """
+        if self._fencing_token is None or not self.is_leader:
+            return None
+        return FencingToken(LEADER_LOCK_KEY, self._fencing_token)
+
+    async def run(self):
+        logger.info(f"LeaderElector started (Instance ID: {self._instance_id}).")
+        self._running = True
+        while self._running:
+            try:
+                await self._campaign()
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in LeaderElector main loop.")
+            if self._fencing_token is not None and not self.is_leader:
+                logger.warning("Leader lease could not be renewed in time. Stepping down.")
+                await self._step_down()
+            try:
+                await sleep(self.lease_seconds / 3)
+            except CancelledError:
+                break
+        await self._step_down()
+        logger.info("LeaderElector stopped.")
+
+    def stop(self):
+        self._running = False
+        for service in self._services:
+            service.stop()
+
+    async def _campaign(self):
+        """Renews the lease of the leader, or tries to acquire it if there is none."""
+        started_at = monotonic()
+        # A request that takes longer than this would let the lease run out anyway.
+        request_timeout = self.lease_seconds / 3
+        if self._fencing_token is not None:
+            async with timeout(request_timeout):
+                renewed = await self.storage.extend_lock(LEADER_LOCK_KEY, self._instance_id, self.lease_seconds)
+            if renewed:
+                self._lease_expires_at = started_at + self.lease_seconds
+                return
+            logger.warning("Leader lease was lost.")
+            await self._step_down()
+            started_at = monotonic()
+        async with timeout(request_timeout):
+            token = await self.storage.acquire_lock_with_token(LEADER_LOCK_KEY, self._instance_id, self.lease_seconds)
+        if token is None:
+            return
+        self._fencing_token = token
+        self._lease_expires_at = started_at + self.lease_seconds
+        logger.info(f"Elected leader (fencing token {token}). Starting {len(self._services)} singleton services.")
+        for service in self._services:
+            service.fencing_token = FencingToken(LEADER_LOCK_KEY, token)
+        self._service_tasks = [create_task(service.run()) for service in self._services]
+
+    async def _step_down(self):
+        """Stops the singleton services, then releases the lease for the next leader."""
+        if self._fencing_token is None:
+            return
+        for service in self._services:
+            service.stop()
+        for task in self._service_tasks:
+            task.cancel()
+        await gather(*self._service_tasks, return_exceptions=True)
+        self._service_tasks = []
+        try:
+            await self.storage.release_lock(LEADER_LOCK_KEY, self._instance_id)
+        except Exception:
+            logger.exception("Failed to release the leader lease.")
+        logger.info(f"Stepped down as leader (fencing token {self._fencing_token}).")
+        self._fencing_token = None
+
+
+async def still_leading(storage: StorageBackend, fence: FencingToken | None) -> bool:
+    """Whether a singleton service may still write: no other instance has been elected
+    since `fence` was issued. A service started without an elector has no token and
+    is not fenced.
+    """
+    return fence is None or await storage.check_fencing_token(fence)
@@ -3,6 +3,7 @@ from aioprometheus.collectors import REGISTRY
 
 # Constants for labels
 LABEL_BLUEPRINT = "blueprint"
+LABEL_POOL = "pool"
 
 # Global variables for metrics
 jobs_total: Counter
@@ -10,6 +11,7 @@ jobs_failed_total: Counter
 job_duration_seconds: Summary
 task_queue_length: Gauge
 active_workers: Gauge
+redis_pool_wait_seconds: Summary
 
 
 def init_metrics():
@@ -18,6 +20,7 @@ def init_metrics():
     Uses a registry check for idempotency, which is important for tests.
     """
     global jobs_total, jobs_failed_total, job_duration_seconds, task_queue_length, active_workers
+    global redis_pool_wait_seconds
 
     if "orchestrator_jobs_total" in REGISTRY.collectors:
         # Get existing metrics if they are already registered
@@ -26,6 +29,7 @@ def init_metrics():
         job_duration_seconds = REGISTRY.collectors["orchestrator_job_duration_seconds"]
         task_queue_length = REGISTRY.collectors["orchestrator_task_queue_length"]
         active_workers = REGISTRY.collectors["orchestrator_active_workers"]
+        redis_pool_wait_seconds = REGISTRY.collectors["orchestrator_redis_pool_wait_seconds"]
         return
 
     jobs_total = Counter(
@@ -51,3 +55,8 @@ def init_metrics():
         "orchestrator_active_workers",
         "Number of active workers reporting to the orchestrator.",
     )
+    redis_pool_wait_seconds = Summary(
+        "orchestrator_redis_pool_wait_seconds",
+        "Time spent waiting for a connection from a Redis connection pool.",
+        const_labels={LABEL_POOL: ""},
+    )
@@ -1,10 +1,15 @@
 from asyncio import CancelledError, sleep
+from datetime import datetime
 from logging import getLogger
 from typing import TYPE_CHECKING
-from uuid import uuid4
+
+from .data_types import FencingToken, WorkerTaskStats
+from .leader import still_leading
+from .storage.base import stats_day
 
 if TYPE_CHECKING:
     from .engine import OrchestratorEngine
+    from .storage.base import StorageBackend
 
 logger = getLogger(__name__)
 
@@ -12,31 +17,60 @@ logger = getLogger(__name__)
 REPUTATION_HISTORY_DAYS = 30
 
 
+def reputation_from_stats(stats: WorkerTaskStats) -> float | None:
+    """Reputation is the share of successful tasks, or None if there were no tasks."""
+    return round(stats.successes / stats.total, 4) if stats.total else None
+
+
+async def record_task_outcome(
+    storage: "StorageBackend",
+    worker_id: str,
+    success: bool,
+    duration_ms: int | None = None,
+) -> float | None:
+    """Updates the worker's outcome counters with a finished task and stores the
+    resulting reputation. Called for every task result, so reputation is kept up
+    to date without re-reading the history.
+
+    :return: The new reputation, or None if the worker is no longer registered.
+    """
+    stats = await storage.record_worker_task_outcome(worker_id, success, duration_ms, REPUTATION_HISTORY_DAYS)
+    reputation = reputation_from_stats(stats)
+    if await storage.update_worker_data(worker_id, {"reputation": reputation}) is None:
+        return None
+    return reputation
+
+
 class ReputationCalculator:
-    """A background process for periodically recalculating worker reputations."""
+    """A background process that keeps worker reputations in line with the
+    windowed outcome counters (e.g. when old buckets expire for idle workers).
+    The counters themselves are updated as task results arrive.
+
+    Runs on the leader only (see `LeaderElector`), which stops it when it loses
+    the lease. Its writes carry the leader's fencing token, so a leader that
+    stalled past its lease cannot overwrite what the next one computed.
+    """
 
     def __init__(self, engine: "OrchestratorEngine", interval_seconds: int = 3600):
         self.engine = engine
         self.storage = engine.storage
         self.history_storage = engine.history_storage
         self.interval_seconds = interval_seconds
+        self.fencing_token: FencingToken | None = None
         self._running = False
-        self._instance_id = str(uuid4())
 
     async def run(self):
         """The main loop that periodically triggers reputation recalculation."""
-        logger.info(f"ReputationCalculator started (Instance ID: {self._instance_id}).")
+        logger.info("ReputationCalculator started.")
         self._running = True
+        backfilled = False
         while self._running:
             try:
-                # Attempt to acquire lock
-                if await self.storage.acquire_lock("global_reputation_lock", self._instance_id, 300):
-                    try:
-                        await self.calculate_all_reputations()
-                    finally:
-                        await self.storage.release_lock("global_reputation_lock", self._instance_id)
-                else:
-                    logger.debug("ReputationCalculator lock held by another instance. Skipping.")
+                if not backfilled:
+                    # Workers without counters (e.g. right after an upgrade) get them from history once.
+                    await self.backfill_from_history()
+                    backfilled = True
+                await self.calculate_all_reputations()
             except CancelledError:
                 break
             except Exception:
@@ -49,8 +83,8 @@ class ReputationCalculator:
     def stop(self):
         self._running = False
 
-    async def calculate_all_reputations(self):
-        """Calculates and updates the reputation for all active workers."""
+    async def calculate_all_reputations(self) -> None:
+        """Updates the reputation of all active workers from their outcome counters."""
         logger.info("Starting reputation calculation for all workers...")
         workers = await self.storage.get_available_workers()
         if not workers:
@@ -62,38 +96,56 @@ class ReputationCalculator:
             if not worker_id:
                 continue
 
-            history = await self.history_storage.get_worker_history(
-                worker_id,
-                since_days=REPUTATION_HISTORY_DAYS,
-            )
-
-            # Count only task completion events
-            task_finished_events = [event for event in history if event.get("event_type") == "task_finished"]
-
-            if not task_finished_events:
-                # If there is no history, the reputation does not change (remains 1.0 by default)
+            stats = await self.storage.get_worker_task_stats(worker_id, REPUTATION_HISTORY_DAYS)
+            new_reputation = reputation_from_stats(stats)
+            # Without finished tasks in the window, the reputation does not change
+            if new_reputation is None or new_reputation == worker.get("reputation"):
                 continue
 
-            successful_tasks = 0
-            for event in task_finished_events:
-                # Extract the result from the snapshot
-                snapshot = event.get("context_snapshot", {})
-                result = snapshot.get("result", {})
-                if result.get("status") == "success":
-                    successful_tasks += 1
-
-            total_tasks = len(task_finished_events)
-            new_reputation = successful_tasks / total_tasks if total_tasks > 0 else 1.0
-
-            # Round for cleanliness
-            new_reputation = round(new_reputation, 4)
-
             logger.info(
                 f"Updating reputation for worker {worker_id}: {worker.get('reputation')} -> {new_reputation}",
             )
             await self.storage.update_worker_data(
                 worker_id,
                 {"reputation": new_reputation},
+                fence=self.fencing_token,
             )
 
         logger.info("Reputation calculation finished.")
+
+    async def backfill_from_history(self, only_missing: bool = True) -> None:
+        """Rebuilds the outcome counters of active workers from the job history,
+        e.g. after an upgrade or after the counters were lost. Days that have
+        `task_finished` events in the history are overwritten; other days are kept.
+
+        :param only_missing: Only backfill workers that have no counters in the window.
+        """
+        logger.info("Backfilling worker task statistics from history...")
+        for worker in await self.storage.get_available_workers():
+            worker_id = worker.get("worker_id")
+            if not worker_id:
+                continue
+            if only_missing and (await self.storage.get_worker_task_stats(worker_id, REPUTATION_HISTORY_DAYS)).total:
+                continue
+
+            history = await self.history_storage.get_worker_history(
+                worker_id,
+                since_days=REPUTATION_HISTORY_DAYS,
+            )
+            buckets: dict[int, WorkerTaskStats] = {}
+            for event in history:
+                if event.get("event_type") != "task_finished":
+                    continue
+                timestamp = event.get("timestamp")
+                day = stats_day(timestamp.timestamp() if isinstance(timestamp, datetime) else timestamp)
+                success = event.get("context_snapshot", {}).get("result", {}).get("status") == "success"
+                buckets[day] = buckets.get(day, WorkerTaskStats()).add(success, event.get("duration_ms"))
+
+            if not await still_leading(self.storage, self.fencing_token):
+                logger.warning("Not the leader any more, stopping the backfill.")
+                return
+            for day, stats in buckets.items():
+                await self.storage.set_worker_task_stats(worker_id, day, stats, REPUTATION_HISTORY_DAYS)
+
+        await self.calculate_all_reputations()
+        logger.info("Backfill of worker task statistics finished.")
@@ -4,6 +4,8 @@ from logging import getLogger
 from typing import TYPE_CHECKING
 from zoneinfo import ZoneInfo
 
+from .data_types import FencingToken
+from .leader import still_leading
 from .scheduler_config_loader import ScheduledJobConfig, load_schedules_from_file
 
 if TYPE_CHECKING:
@@ -17,6 +19,7 @@ class Scheduler:
         self.engine = engine
         self.config = engine.config
         self.storage = engine.storage
+        self.fencing_token: FencingToken | None = None
         self._running = False
         self.schedules: list[ScheduledJobConfig] = []
         self.timezone = ZoneInfo(self.config.TZ)
@@ -43,6 +46,10 @@ class Scheduler:
 
         while self._running:
             try:
+                if not await still_leading(self.storage, self.fencing_token):
+                    logger.warning("Scheduler is not the leader any more, not triggering jobs.")
+                    await sleep(1)
+                    continue
                 now_utc = datetime.now(ZoneInfo("UTC"))
                 now_tz = now_utc.astimezone(self.timezone)
 
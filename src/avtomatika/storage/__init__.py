@@ -9,3 +9,8 @@ with suppress(ImportError):
     from .redis import RedisStorage  # noqa: F401
 
     __all__.append("RedisStorage")
+
+with suppress(ImportError):
+    from .redis_cluster import RedisClusterStorage  # noqa: F401
+
+    __all__.append("RedisClusterStorage")
@@ -1,17 +1,121 @@
 from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import AsyncIterator, Iterable
+from hashlib import blake2b
+from time import time
 from typing import Any
 
+from ..data_types import FencingToken, WorkerTask, WorkerTaskStats
+
+# Number of points each member has on the hash ring of `assign_shards`
+SHARD_RING_POINTS = 64
+
+
+def _ring_position(value: str) -> int:
+    return int.from_bytes(blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def assign_shards(members: Iterable[str], shard_count: int) -> dict[str, set[int]]:
+    """Splits shards among members by consistent hashing. Each member has
+    `SHARD_RING_POINTS` points on a hash ring, and a shard belongs to the member with
+    the first point at or after the shard's own position. When a member joins or
+    leaves, only the shards next to its points change hands.
+    """
+    members = sorted(set(members))
+    assignment: dict[str, set[int]] = {member: set() for member in members}
+    ring = sorted(
+        (_ring_position(f"{member}#{point}"), member) for member in members for point in range(SHARD_RING_POINTS)
+    )
+    if not ring:
+        return assignment
+    positions = [position for position, _ in ring]
+    for shard in range(shard_count):
+        index = bisect_left(positions, _ring_position(f"shard#{shard}")) % len(ring)
+        assignment[ring[index][1]].add(shard)
+    return assignment
+
+
+def stats_day(timestamp: float | None = None) -> int:
+    """Returns the daily bucket of worker task statistics (days since the Unix epoch, UTC)."""
+    return int((time() if timestamp is None else timestamp) // 86400)
+
+
+def worker_index_terms(worker_info: dict[str, Any]) -> set[str]:
+    """Returns the secondary index terms a worker is listed under.
+
+    Terms have the form ``kind:value`` (e.g. ``task:image_generation``, ``status:idle``,
+    ``gpu:NVIDIA T4``, ``model:stable-diffusion-1.5``). A worker without an explicit
+    status is indexed as idle for backward compatibility.
+    """
+    terms = {f"status:{worker_info.get('status', 'idle')}"}
+    terms.update(f"task:{task}" for task in worker_info.get("supported_tasks", []))
+
+    gpu_info = (worker_info.get("resources") or {}).get("gpu_info")
+    if gpu_info and gpu_info.get("model"):
+        terms.add(f"gpu:{gpu_info['model']}")
+
+    for model in worker_info.get("installed_models", []):
+        if isinstance(model, dict) and model.get("name"):
+            terms.add(f"model:{model['name']}")
+    return terms
+
+
+def worker_query_terms(
+    task_type: str | None = None,
+    status: str | None = None,
+    resource_requirements: dict[str, Any] | None = None,
+) -> tuple[set[str], str | None]:
+    """Translates a worker query into the index terms every match must have.
+
+    :return: A tuple of (required terms, GPU model substring or None). The GPU model is
+        matched as a substring, as in `Dispatcher._is_worker_compliant`, so it cannot be
+        expressed as a single exact term.
+    """
+    terms = set()
+    if task_type:
+        terms.add(f"task:{task_type}")
+    if status:
+        terms.add(f"status:{status}")
+
+    gpu_model = None
+    if resource_requirements:
+        gpu_model = (resource_requirements.get("gpu_info") or {}).get("model")
+        terms.update(f"model:{name}" for name in resource_requirements.get("installed_models") or [])
+    return terms, gpu_model
+
 
 class StorageBackend(ABC):
     """Abstract base class for job state stores.
     Defines the interface that all stores must implement.
     """
 
+    # Told about the watch entries this instance adds and removes, through its
+    # `add(watch_id, timeout_at)` and `remove(watch_id)` methods (the `Watcher`).
+    deadline_listener: Any = None
+
+    def _watch_added(self, watch: dict[str, float]) -> None:
+        if self.deadline_listener is not None:
+            for watch_id, timeout_at in watch.items():
+                self.deadline_listener.add(watch_id, timeout_at)
+
+    def _watch_removed(self, watch_id: str) -> None:
+        if self.deadline_listener is not None:
+            self.deadline_listener.remove(watch_id)
+
     @abstractmethod
-    async def get_job_state(self, job_id: str) -> dict[str, Any] | None:
-        """Get the full state of a job by its ID.
+    async def get_job_state(
+        self,
+        job_id: str,
+        fields: list[str] | None = None,
+        allow_stale: bool = False,
+    ) -> dict[str, Any] | None:
+        """Get the state of a job by its ID.
 
         :param job_id: Unique identifier for the job.
+        :param fields: Optional projection. If given, only these top-level fields are
+            returned (fields missing from the job are omitted).
+        :param allow_stale: The state is only displayed, not modified, so it may be read
+            from a replica that lags slightly behind. Never set on read-modify-write paths.
         :return: A dictionary with the job state or None if the job is not found.
         """
         raise NotImplementedError
@@ -21,13 +125,17 @@ class StorageBackend(ABC):
         self,
         worker_id: str,
         update_data: dict[str, Any],
+        fence: FencingToken | None = None,
     ) -> dict[str, Any] | None:
         """Partially update worker information without affecting its TTL.
         Used for background processes like the reputation calculator.
 
         :param worker_id: Unique identifier for the worker.
         :param update_data: A dictionary with the fields to update (e.g., 'reputation').
-        :return: The updated full state of the worker or None if the worker is not found.
+        :param fence: If given, the update is only written while this is the latest
+            token of its lock (see `check_fencing_token`).
+        :return: The updated full state of the worker, or None if the worker is not
+            found or the fencing token is stale.
         """
         raise NotImplementedError
 
@@ -76,6 +184,34 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    async def commit_transition(
+        self,
+        job_id: str,
+        state: dict[str, Any],
+        enqueue: bool = False,
+        watch: dict[str, float] | None = None,
+        worker_tasks: list[WorkerTask] | None = None,
+    ) -> None:
+        """Persist everything a single job step produces as one unit.
+        Backends should apply all writes atomically and in a single round trip, so a
+        crash can never leave a job saved but not enqueued (or vice versa).
+
+        The default implementation issues the individual calls one after another.
+
+        :param job_id: Unique identifier for the job.
+        :param state: The full state of the job to save.
+        :param enqueue: Whether to add the job to the execution queue.
+        :param watch: Timeout tracking entries to add, as {watch_id: timeout_at}.
+        :param worker_tasks: Tasks to put into the workers' priority queues.
+        """
+        await self.save_job_state(job_id, state)
+        for watch_id, timeout_at in (watch or {}).items():
+            await self.add_job_to_watch(watch_id, timeout_at)
+        for task in worker_tasks or []:
+            await self.enqueue_task_for_worker(task.queue, task.payload, task.priority)
+        if enqueue:
+            await self.enqueue_job(job_id)
+
     @abstractmethod
     async def update_job_state(
         self,
@@ -90,6 +226,45 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    async def get_job_states(
+        self,
+        job_ids: list[str],
+        fields: list[str] | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        """Get the states (or a projection of their fields) of several jobs at once.
+        The default implementation reads them one by one.
+
+        :return: A dictionary {job_id: state}. Jobs that are not found are omitted.
+        """
+        states = {}
+        for job_id in job_ids:
+            if (state := await self.get_job_state(job_id, fields)) is not None:
+                states[job_id] = state
+        return states
+
+    async def commit_transitions(
+        self,
+        states: dict[str, dict[str, Any]],
+        watch: dict[str, float] | None = None,
+        worker_tasks: list[WorkerTask] | None = None,
+    ) -> None:
+        """Persist the steps of several jobs at once, e.g. a batch of timed out jobs
+        sent down the retry path. Like `commit_transition`, backends should write
+        everything in a single round trip; none of the jobs is enqueued.
+
+        The default implementation issues the individual calls one after another.
+
+        :param states: The full states of the jobs to save, as {job_id: state}.
+        :param watch: Timeout tracking entries to add, as {watch_id: timeout_at}.
+        :param worker_tasks: Tasks to put into the workers' priority queues.
+        """
+        for job_id, state in states.items():
+            await self.save_job_state(job_id, state)
+        for watch_id, timeout_at in (watch or {}).items():
+            await self.add_job_to_watch(watch_id, timeout_at)
+        for task in worker_tasks or []:
+            await self.enqueue_task_for_worker(task.queue, task.payload, task.priority)
+
     @abstractmethod
     async def register_worker(
         self,
@@ -125,36 +300,213 @@ class StorageBackend(ABC):
         self,
         worker_id: str,
         timeout: int,
+        shared_queues: list[str] | None = None,
+        lease_seconds: float = 0,
     ) -> dict[str, Any] | None:
         """Retrieves the highest priority task from the queue for a worker (blocking operation).
 
         :param worker_id: The ID of the worker for whom to retrieve the task.
         :param timeout: The maximum time to wait for a task in seconds.
+        :param shared_queues: Shared task-type queues the worker may also take tasks from.
+            The worker's own queue is checked first, then the shared queues in order.
+        :param lease_seconds: If positive, the task is leased to the worker for this long
+            instead of being removed for good. Unless the lease is extended or acknowledged
+            in time, it is returned by `pop_expired_task_leases` for redelivery.
         :return: A dictionary with the task data or None if the timeout has expired.
         """
         raise NotImplementedError
 
+    async def pop_task_for_worker(
+        self,
+        worker_id: str,
+        shared_queues: list[str] | None = None,
+        lease_seconds: float = 0,
+    ) -> dict[str, Any] | None:
+        """Non-blocking variant of `dequeue_task_for_worker`.
+
+        :return: A dictionary with the task data or None if the queues are empty.
+        """
+        raise NotImplementedError
+
+    def listen_task_wakeups(self) -> AsyncIterator[str | None]:
+        """Subscribes to notifications about tasks added to task queues, so one
+        subscription can serve all long-polling workers of an instance.
+
+        :return: An async iterator yielding the name of each queue that received a task,
+            and None whenever the subscription is established, since notifications
+            sent before that are missed.
+        """
+        raise NotImplementedError
+
+    async def extend_task_lease(self, worker_id: str, task_id: str, lease_seconds: float) -> bool:
+        """Moves the deadline of a task lease to `lease_seconds` from now.
+
+        :param worker_id: The ID of the worker the task is leased to.
+        :param task_id: The ID of the task.
+        :param lease_seconds: The new duration of the lease.
+        :return: False if the worker does not hold a lease on the task (e.g. it expired
+            and the task was redelivered).
+        """
+        return False
+
+    async def ack_task_lease(self, task_id: str) -> None:
+        """Releases the lease on a task whose result has been received, or which
+        was put back into a queue.
+
+        :param task_id: The ID of the task.
+        """
+        # Backends without leases have nothing to release.
+        return None
+
+    async def pop_expired_task_leases(self, limit: int = 100) -> list[tuple[str, dict[str, Any], float]]:
+        """Removes and returns the task leases whose deadline has passed. Each expired
+        lease is returned to only one caller.
+
+        :param limit: The maximum number of leases to return.
+        :return: A list of (worker ID, task payload, priority).
+        """
+        return []
+
+    async def claim_worker_task(
+        self,
+        worker_id: str,
+        task_payload: dict[str, Any],
+        lease_seconds: float = 0,
+    ) -> bool:
+        """Removes a specific task from the worker's queue, e.g. to deliver it over
+        another channel. Only one caller (this or `dequeue_task_for_worker`) can get it.
+
+        :param worker_id: The ID of the worker the task was queued for.
+        :param task_payload: The payload exactly as it was enqueued.
+        :param lease_seconds: If positive, the task is leased to the worker, like in
+            `dequeue_task_for_worker`.
+        :return: True if the task was removed by this call. Backends that cannot
+            remove a single task return False, so the task stays in the queue.
+        """
+        return False
+
+    async def pop_lost_workers(self) -> list[str]:
+        """Returns the workers whose registration expired (they stopped sending
+        heartbeats) since the previous call. Each lost worker is returned to only one
+        caller, so several orchestrator instances can poll this safely.
+
+        :return: A list of worker IDs.
+        """
+        raise NotImplementedError
+
+    async def drain_worker_tasks(self, worker_id: str) -> list[tuple[dict[str, Any], float]]:
+        """Atomically removes and returns all tasks waiting in a worker's queue.
+
+        :param worker_id: The ID of the worker.
+        :return: A list of (task payload, priority), highest priority first.
+        """
+        raise NotImplementedError
+
+    async def register_task_queue_class(
+        self,
+        task_type: str,
+        class_id: str,
+        requirements: dict[str, Any],
+    ) -> None:
+        """Records a requirement class of a task type, i.e. one shared queue that
+        workers supporting the task type may take tasks from.
+
+        :param task_type: The task type.
+        :param class_id: A stable identifier of the requirements.
+        :param requirements: What a worker needs to take tasks of this class
+            (`resource_requirements` and `max_cost`).
+        """
+        raise NotImplementedError
+
+    async def get_task_queue_classes(self, task_types: list[str]) -> dict[str, dict[str, dict[str, Any]]]:
+        """Returns the requirement classes registered for the given task types.
+
+        :param task_types: The task types to look up.
+        :return: A dictionary {task_type: {class_id: requirements}}.
+        """
+        raise NotImplementedError
+
     @abstractmethod
-    async def get_available_workers(self) -> list[dict[str, Any]]:
+    async def get_available_workers(self, allow_stale: bool = False) -> list[dict[str, Any]]:
         """Get a list of all active (not expired) workers.
 
+        :param allow_stale: The list is only displayed, so it may be read from a replica.
         :return: A list of dictionaries, where each dictionary represents information about a worker.
         """
         raise NotImplementedError
 
+    async def find_workers(
+        self,
+        task_type: str | None = None,
+        status: str | None = None,
+        resource_requirements: dict[str, Any] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Get active workers matching the given criteria.
+        Backends with secondary indexes override this to avoid loading every worker.
+
+        The result is a pre-selection: the GPU model and installed models are checked,
+        but numeric requirements (e.g. VRAM) must still be verified by the caller.
+
+        :param task_type: Only return workers that support this task type.
+        :param status: Only return workers with this status (missing status counts as 'idle').
+        :param resource_requirements: Requirements in the format used by `dispatch_task`.
+        :return: A list of worker information dictionaries.
+        """
+        terms, gpu_model = worker_query_terms(task_type, status, resource_requirements)
+        workers = []
+        for worker in await self.get_available_workers():
+            worker_terms = worker_index_terms(worker)
+            if not terms.issubset(worker_terms):
+                continue
+            if gpu_model and not any(t.startswith("gpu:") and gpu_model in t[4:] for t in worker_terms):
+                continue
+            workers.append(worker)
+        return workers
+
     @abstractmethod
     async def add_job_to_watch(self, job_id: str, timeout_at: float) -> None:
         """Add a job to the list for timeout tracking.
 
         :param job_id: The job identifier.
-        :param timeout_at: The time (timestamp) when the job will be considered overdue.
+        :param timeout_at: The wall-clock time (Unix timestamp, as returned by `time.time()`)
+            when the job will be considered overdue. All instances share this clock.
         """
         raise NotImplementedError
 
+    def watch_shard(self, watch_id: str) -> int:
+        """Returns the shard of the timeout tracking list that holds the watch entry.
+        Storages with a single list have only shard 0.
+        """
+        return 0
+
+    async def refresh_watch_shards(self, member_id: str, ttl: int) -> set[int]:
+        """Renews the membership of an instance among those sharing the timeout
+        tracking list, for `ttl` seconds, and returns the shards it owns. The shards
+        are split among the live members with `assign_shards`, so ownership moves when
+        an instance joins, leaves or expires.
+        """
+        return {0}
+
+    async def release_watch_shards(self, member_id: str) -> None:
+        """Ends the membership of an instance, so the others take its shards over."""
+        # Backends with a single shard keep no membership.
+        return None
+
+    async def get_next_watch_deadline(self, shards: Iterable[int] | None = None) -> float | None:
+        """Returns the earliest deadline in the timeout tracking list, or None if it is
+        empty. Lets an instance learn about deadlines set by other instances.
+
+        :param shards: Only look at these shards (all if None).
+        """
+        return None
+
     @abstractmethod
-    async def get_timed_out_jobs(self) -> list[str]:
-        """Get a list of job IDs that are overdue and remove them from the tracking list.
+    async def get_timed_out_jobs(self, limit: int = 1000, shards: Iterable[int] | None = None) -> list[str]:
+        """Get the IDs of up to `limit` overdue jobs, earliest deadline first within each
+        shard, and remove them from the tracking list. Claiming is atomic, so each
+        overdue job is returned to exactly one caller.
 
+        :param shards: Only claim jobs from these shards (all if None).
         :return: A list of overdue job IDs.
         """
         raise NotImplementedError
@@ -172,6 +524,31 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    async def dequeue_jobs(self, max_count: int, block_ms: int) -> list[tuple[str, str]]:
+        """Retrieve a batch of jobs from the execution queue in one call.
+        Waits up to `block_ms` for the first job and returns whatever is available
+        at that moment, so callers can fill several free slots at once.
+
+        Backends without batch support fall back to a single `dequeue_job` call.
+
+        :param max_count: The maximum number of jobs to return.
+        :param block_ms: The maximum time to wait for a job in milliseconds.
+        :return: A list of (job_id, message_id) tuples, empty if the timeout has expired.
+        """
+        result = await self.dequeue_job()
+        return [result] if result else []
+
+    async def reclaim_jobs(self, cursor: str = "0-0", count: int = 100) -> tuple[str, list[tuple[str, str]]]:
+        """Takes over jobs that other consumers received but did not acknowledge in time.
+        Scans the pending jobs in pages, so each call only looks at the next `count`.
+
+        :param cursor: Where to continue the scan, as returned by the previous call.
+        :param count: The maximum number of pending jobs to look at.
+        :return: The cursor for the next call ("0-0" once the scan wrapped around)
+            and a list of reclaimed (job_id, message_id) tuples.
+        """
+        return "0-0", []
+
     @abstractmethod
     async def ack_job(self, message_id: str) -> None:
         """Acknowledge successful processing of a job from the queue.
@@ -180,6 +557,29 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    async def refresh_job_stream_partitions(self, ttl: int) -> None:
+        """Renews this instance's share of a partitioned job queue and rebalances the
+        partitions across the live instances. Called periodically by the executor.
+        Backends with a single queue do nothing.
+
+        :param ttl: How long the instance and its partitions stay assigned without renewal.
+        """
+        # A single queue has no partitions to renew.
+        return None
+
+    async def release_job_stream_partitions(self) -> None:
+        """Gives up this instance's share of a partitioned job queue, e.g. on shutdown."""
+        # A single queue has no partitions to release.
+        return None
+
+    async def trim_job_stream(self) -> int:
+        """Removes queue entries that every consumer has acknowledged, e.g. entries
+        left over from before acknowledged entries were deleted.
+
+        :return: The number of removed entries.
+        """
+        return 0
+
     @abstractmethod
     async def quarantine_job(self, job_id: str) -> None:
         """Move a job ID to the quarantine queue."""
@@ -230,8 +630,8 @@ class StorageBackend(ABC):
 
     @abstractmethod
     async def get_job_queue_length(self) -> int:
-        """Get the current length of the main job queue.
-        Used for metrics.
+        """Get the number of jobs waiting in the main job queue, including jobs taken
+        by an executor but not yet acknowledged. Used for metrics.
         """
         raise NotImplementedError
 
@@ -273,6 +673,40 @@ class StorageBackend(ABC):
         """Returns the number of currently active workers."""
         raise NotImplementedError
 
+    async def record_worker_task_outcome(
+        self,
+        worker_id: str,
+        success: bool,
+        duration_ms: int | None,
+        window_days: int,
+    ) -> WorkerTaskStats:
+        """Adds a finished task to today's bucket of the worker's outcome counters
+        and returns the totals over the last `window_days` days.
+
+        :param worker_id: The worker that executed the task.
+        :param success: Whether the task succeeded.
+        :param duration_ms: The task duration, or None if it is unknown.
+        :param window_days: How many daily buckets are kept and summed up.
+        """
+        raise NotImplementedError
+
+    async def get_worker_task_stats(self, worker_id: str, window_days: int) -> WorkerTaskStats:
+        """Returns the worker's task outcome totals over the last `window_days` days."""
+        raise NotImplementedError
+
+    async def set_worker_task_stats(
+        self,
+        worker_id: str,
+        day: int,
+        stats: WorkerTaskStats,
+        window_days: int,
+    ) -> None:
+        """Overwrites one daily bucket of the worker's outcome counters (used for backfilling).
+
+        :param day: The bucket, as the number of days since the Unix epoch (UTC).
+        """
+        raise NotImplementedError
+
     async def set_nx_ttl(self, key: str, value: str, ttl: int) -> bool:
         """
         Atomically sets key to value if it does not exist.
@@ -302,6 +736,43 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    async def acquire_lock_with_token(self, key: str, holder_id: str, ttl: int) -> int | None:
+        """
+        Acquires a distributed lock like `acquire_lock` and returns a fencing token:
+        a number larger than the one returned by any earlier acquisition of the same
+        lock, so the current holder can be told from one whose lock expired.
+        The lock is renewed with `extend_lock` and released with `release_lock`.
+
+        :param key: The unique key of the lock (e.g., 'leader').
+        :param holder_id: A unique identifier for the caller (e.g., UUID).
+        :param ttl: Time-to-live for the lock in seconds.
+        :return: The fencing token, or None if the lock is held by another caller.
+        """
+        raise NotImplementedError
+
+    async def check_fencing_token(self, fence: FencingToken) -> bool:
+        """
+        Checks that no one has acquired the lock since the token was issued, i.e. that
+        it is still the latest token of its lock. Holders check it right before their
+        writes, so a holder whose lock expired while it stalled cannot overwrite the
+        work of its successor.
+
+        :param fence: The token returned when the lock was acquired.
+        :return: True if the token is still the latest one.
+        """
+        raise NotImplementedError
+
+    async def extend_lock(self, key: str, holder_id: str, ttl: int) -> bool:
+        """
+        Resets the TTL of a distributed lock if it is held by the specified holder_id.
+
+        :param key: The unique key of the lock.
+        :param holder_id: The identifier of the caller who presumably holds the lock.
+        :param ttl: The new time-to-live for the lock in seconds.
+        :return: True if the lock is held by holder_id and was extended, otherwise False.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     async def release_lock(self, key: str, holder_id: str) -> bool:
         """
@@ -1,66 +1,184 @@
-from asyncio import Lock, PriorityQueue, Queue, QueueEmpty, wait_for
+from asyncio import FIRST_COMPLETED, PriorityQueue, Queue, QueueEmpty, create_task, wait, wait_for
 from asyncio import TimeoutError as AsyncTimeoutError
-from time import monotonic
+from collections.abc import AsyncIterator, Iterable
+from heapq import heapify, heappop, heappush
+from itertools import count
+from time import monotonic, time
 from typing import Any
 
-from .base import StorageBackend
+from ..data_types import FencingToken, WorkerTask, WorkerTaskStats
+from .base import StorageBackend, assign_shards, stats_day, worker_index_terms, worker_query_terms
+
+
+class DeadlineHeap:
+    """Deadlines by key, with a min-heap to find the due ones without a full scan.
+
+    Updated or removed keys leave stale heap entries behind, which are skipped
+    when they reach the top. The heap is rebuilt when they make up most of it.
+    """
+
+    def __init__(self) -> None:
+        self._deadlines: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._deadlines
+
+    def __setitem__(self, key: str, deadline: float) -> None:
+        self._deadlines[key] = deadline
+        heappush(self._heap, (deadline, key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+            heapify(self._heap)
+
+    def get(self, key: str, default: float | None = None) -> float | None:
+        return self._deadlines.get(key, default)
+
+    def pop(self, key: str, default: float | None = None) -> float | None:
+        return self._deadlines.pop(key, default)
+
+    def clear(self) -> None:
+        self._deadlines.clear()
+        self._heap.clear()
+
+    def _drop_stale(self) -> None:
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heappop(self._heap)
+
+    def next_deadline(self) -> float | None:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float, limit: int | None = None) -> list[str]:
+        """Removes and returns the keys due at `now`, earliest first."""
+        due: list[str] = []
+        while limit is None or len(due) < limit:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, key = heappop(self._heap)
+            del self._deadlines[key]
+            due.append(key)
+        return due
 
 
 class MemoryStorage(StorageBackend):
     """In-memory implementation of StorageBackend.
     Intended for local execution and testing without Redis.
     Not persistent.
+
+    There is no lock: no method awaits between reading and writing its data, so
+    on the single-threaded event loop every method is atomic.
     """
 
-    def __init__(self):
+    def __init__(self) -> None:
         self._jobs: dict[str, dict[str, Any]] = {}
         self._workers: dict[str, dict[str, Any]] = {}
-        self._worker_ttls: dict[str, float] = {}
-        self._worker_task_queues: dict[str, PriorityQueue] = {}
-        self._job_queue = Queue()
+        self._worker_ttls = DeadlineHeap()
+        self._lost_workers: set[str] = set()
+        # task_id -> (worker_id, payload, priority) of tasks delivered under a lease, and their deadlines
+        self._task_leases: dict[str, tuple[str, dict[str, Any], float]] = {}
+        self._task_lease_deadlines = DeadlineHeap()
+        # Entries are (-priority, sequence number, payload).
+        self._worker_task_queues: dict[str, PriorityQueue[tuple[float, int, dict[str, Any]]]] = {}
+        # Tie-breaker for tasks of equal priority: FIFO, and payloads are never compared.
+        self._task_sequence = count()
+        self._task_queue_classes: dict[str, dict[str, dict[str, Any]]] = {}
+        # One queue per `listen_task_wakeups` subscriber, receiving the names of task queues
+        self._task_wakeup_listeners: set[Queue] = set()
+        # Secondary indexes: index term -> worker IDs, and worker ID -> its terms.
+        self._worker_index: dict[str, set[str]] = {}
+        self._worker_terms: dict[str, set[str]] = {}
+        self._job_queue: Queue[str] = Queue()
+        self._message_ids = count(1)
         self._quarantine_queue: list[str] = []
-        self._watched_jobs: dict[str, float] = {}
+        self._watched_jobs = DeadlineHeap()
+        # member ID -> expiry of the instances sharing the (single shard of the) watch list
+        self._watch_members: dict[str, float] = {}
         self._client_configs: dict[str, dict[str, Any]] = {}
         self._quotas: dict[str, int] = {}
         self._worker_tokens: dict[str, str] = {}
         self._generic_keys: dict[str, Any] = {}
-        self._generic_key_ttls: dict[str, float] = {}
+        self._generic_key_ttls = DeadlineHeap()
         self._locks: dict[str, tuple[str, float]] = {}
+        # lock key -> the last fencing token issued for it
+        self._lock_tokens: dict[str, int] = {}
+        # worker ID -> {day: task outcome counters of that day}
+        self._worker_stats: dict[str, dict[int, WorkerTaskStats]] = {}
 
-        self._lock = Lock()
-
-    async def get_job_state(self, job_id: str) -> dict[str, Any] | None:
-        async with self._lock:
-            return self._jobs.get(job_id)
+    async def get_job_state(
+        self,
+        job_id: str,
+        fields: list[str] | None = None,
+        allow_stale: bool = False,
+    ) -> dict[str, Any] | None:
+        state = self._jobs.get(job_id)
+        if state is None or fields is None:
+            return state
+        return {field: state[field] for field in fields if field in state}
 
-    async def _clean_expired(self):
-        """Helper to remove expired keys."""
+    def _clean_expired(self) -> None:
+        """Helper to remove expired keys and workers."""
         now = monotonic()
-
-        expired_generic = [k for k, t in self._generic_key_ttls.items() if t < now]
-        for k in expired_generic:
-            self._generic_key_ttls.pop(k, None)
+        for k in self._generic_key_ttls.pop_due(now):
             self._generic_keys.pop(k, None)
 
-        expired_workers = [k for k, t in self._worker_ttls.items() if t < now]
-        for k in expired_workers:
-            self._worker_ttls.pop(k, None)
+        for k in self._worker_ttls.pop_due(now):
             self._workers.pop(k, None)
+            self._unindex_worker(k)
+            self._lost_workers.add(k)
+
+    def _index_worker(self, worker_id: str, worker_info: dict[str, Any]):
+        """Brings the secondary indexes of a worker up to date."""
+        new_terms = worker_index_terms(worker_info)
+        old_terms = self._worker_terms.get(worker_id, set())
+        for term in old_terms - new_terms:
+            self._worker_index.get(term, set()).discard(worker_id)
+        for term in new_terms - old_terms:
+            self._worker_index.setdefault(term, set()).add(worker_id)
+        self._worker_terms[worker_id] = new_terms
+
+    def _unindex_worker(self, worker_id: str):
+        for term in self._worker_terms.pop(worker_id, set()):
+            self._worker_index.get(term, set()).discard(worker_id)
 
     async def save_job_state(self, job_id: str, state: dict[str, Any]):
-        async with self._lock:
-            self._jobs[job_id] = state
+        self._jobs[job_id] = state
+
+    async def commit_transition(
+        self,
+        job_id: str,
+        state: dict[str, Any],
+        enqueue: bool = False,
+        watch: dict[str, float] | None = None,
+        worker_tasks: list[WorkerTask] | None = None,
+    ) -> None:
+        """Applies all writes without yielding to the event loop, so no other
+        coroutine can observe a partially committed step.
+        """
+        self._jobs[job_id] = state
+        for watch_id, timeout_at in (watch or {}).items():
+            self._watched_jobs[watch_id] = timeout_at
+        for task in worker_tasks or []:
+            queue = self._worker_task_queues.setdefault(task.queue, PriorityQueue())
+            queue.put_nowait((-task.priority, next(self._task_sequence), task.payload))
+            self._notify_task_wakeup(task.queue)
+        if enqueue:
+            self._job_queue.put_nowait(job_id)
+        self._watch_added(watch or {})
 
     async def update_job_state(
         self,
         job_id: str,
         update_data: dict[str, Any],
     ) -> dict[str, Any]:
-        async with self._lock:
-            if job_id not in self._jobs:
-                self._jobs[job_id] = {}
-            self._jobs[job_id].update(update_data)
-            return self._jobs[job_id]
+        if job_id not in self._jobs:
+            self._jobs[job_id] = {}
+        self._jobs[job_id].update(update_data)
+        return self._jobs[job_id]
 
     async def register_worker(
         self,
@@ -69,13 +187,13 @@ class MemoryStorage(StorageBackend):
         ttl: int,
     ) -> None:
         """Registers a worker and creates a task queue for it."""
-        async with self._lock:
-            # Set default reputation for new workers
-            worker_info.setdefault("reputation", 1.0)
-            self._workers[worker_id] = worker_info
-            self._worker_ttls[worker_id] = monotonic() + ttl
-            if worker_id not in self._worker_task_queues:
-                self._worker_task_queues[worker_id] = PriorityQueue()
+        # Set default reputation for new workers
+        worker_info.setdefault("reputation", 1.0)
+        self._workers[worker_id] = worker_info
+        self._worker_ttls[worker_id] = monotonic() + ttl
+        self._index_worker(worker_id, worker_info)
+        if worker_id not in self._worker_task_queues:
+            self._worker_task_queues[worker_id] = PriorityQueue()
 
     async def enqueue_task_for_worker(
         self,
@@ -84,35 +202,167 @@ class MemoryStorage(StorageBackend):
         priority: float,
     ) -> None:
         """Puts a task on the priority queue for a worker."""
-        async with self._lock:
-            if worker_id not in self._worker_task_queues:
-                self._worker_task_queues[worker_id] = PriorityQueue()
-        await self._worker_task_queues[worker_id].put((-priority, task_payload))
+        if worker_id not in self._worker_task_queues:
+            self._worker_task_queues[worker_id] = PriorityQueue()
+        await self._worker_task_queues[worker_id].put((-priority, next(self._task_sequence), task_payload))
+        self._notify_task_wakeup(worker_id)
+
+    def _notify_task_wakeup(self, queue_name: str):
+        for listener in self._task_wakeup_listeners:
+            listener.put_nowait(queue_name)
 
     async def dequeue_task_for_worker(
         self,
         worker_id: str,
         timeout: int,
+        shared_queues: list[str] | None = None,
+        lease_seconds: float = 0,
     ) -> dict[str, Any] | None:
-        """Retrieves a task from the worker's priority queue with a timeout."""
-        queue = None
-        async with self._lock:
-            if worker_id not in self._worker_task_queues:
-                self._worker_task_queues[worker_id] = PriorityQueue()
-            queue = self._worker_task_queues[worker_id]
+        """Retrieves a task from the worker's priority queue (or one of the shared
+        queues) with a timeout.
+        """
+        entry = await self._get_task_entry(worker_id, timeout, shared_queues)
+        return await self._lease_task(worker_id, entry, lease_seconds)
 
+    async def pop_task_for_worker(
+        self,
+        worker_id: str,
+        shared_queues: list[str] | None = None,
+        lease_seconds: float = 0,
+    ) -> dict[str, Any] | None:
+        for name in [worker_id, *(shared_queues or [])]:
+            queue = self._worker_task_queues.get(name)
+            if queue is not None and not queue.empty():
+                entry = queue.get_nowait()
+                break
+        else:
+            return None
+        return await self._lease_task(worker_id, entry, lease_seconds)
+
+    async def _lease_task(
+        self,
+        worker_id: str,
+        entry: tuple[float, int, dict[str, Any]] | None,
+        lease_seconds: float,
+    ) -> dict[str, Any] | None:
+        if entry is None:
+            return None
+        negative_priority, _, payload = entry
+        if lease_seconds > 0:
+            self._task_leases[payload["task_id"]] = (worker_id, payload, -negative_priority)
+            self._task_lease_deadlines[payload["task_id"]] = monotonic() + lease_seconds
+        return payload
+
+    async def listen_task_wakeups(self) -> AsyncIterator[str | None]:
+        listener: Queue = Queue()
+        self._task_wakeup_listeners.add(listener)
         try:
-            _, task_payload = await wait_for(queue.get(), timeout=timeout)
-            return task_payload
-        except AsyncTimeoutError:
+            yield None
+            while True:
+                yield await listener.get()
+        finally:
+            self._task_wakeup_listeners.discard(listener)
+
+    async def _get_task_entry(
+        self,
+        worker_id: str,
+        timeout: int,
+        shared_queues: list[str] | None,
+    ) -> tuple[float, int, dict[str, Any]] | None:
+        queues = [
+            self._worker_task_queues.setdefault(name, PriorityQueue()) for name in [worker_id, *(shared_queues or [])]
+        ]
+
+        for queue in queues:
+            try:
+                return queue.get_nowait()
+            except QueueEmpty:
+                pass
+
+        if len(queues) == 1:
+            try:
+                return await wait_for(queues[0].get(), timeout=timeout)
+            except AsyncTimeoutError:
+                return None
+
+        getters = [create_task(queue.get()) for queue in queues]
+        done, pending = await wait(getters, timeout=timeout, return_when=FIRST_COMPLETED)
+        for getter in pending:
+            getter.cancel()
+        entries = [(queue, getter.result()) for queue, getter in zip(queues, getters, strict=True) if getter in done]
+        if not entries:
             return None
+        # Several queues may have delivered at once: keep the first, return the rest.
+        for queue, entry in entries[1:]:
+            queue.put_nowait(entry)
+        return entries[0][1]
+
+    async def extend_task_lease(self, worker_id: str, task_id: str, lease_seconds: float) -> bool:
+        lease = self._task_leases.get(task_id)
+        if lease is None or lease[0] != worker_id:
+            return False
+        self._task_lease_deadlines[task_id] = monotonic() + lease_seconds
+        return True
 
-    async def refresh_worker_ttl(self, worker_id: str, ttl: int) -> bool:
-        async with self._lock:
-            if worker_id in self._workers:
-                self._worker_ttls[worker_id] = monotonic() + ttl
-                return True
+    async def ack_task_lease(self, task_id: str) -> None:
+        self._task_leases.pop(task_id, None)
+        self._task_lease_deadlines.pop(task_id)
+
+    async def pop_expired_task_leases(self, limit: int = 100) -> list[tuple[str, dict[str, Any], float]]:
+        expired = self._task_lease_deadlines.pop_due(monotonic(), limit)
+        return [self._task_leases.pop(task_id) for task_id in expired]
+
+    async def claim_worker_task(
+        self,
+        worker_id: str,
+        task_payload: dict[str, Any],
+        lease_seconds: float = 0,
+    ) -> bool:
+        queue = self._worker_task_queues.get(worker_id)
+        if queue is None:
             return False
+        entries = queue._queue  # type: ignore[attr-defined]
+        for index, entry in enumerate(entries):
+            if entry[2] == task_payload:
+                entries.pop(index)
+                heapify(entries)
+                await self._lease_task(worker_id, entry, lease_seconds)
+                return True
+        return False
+
+    async def pop_lost_workers(self) -> list[str]:
+        self._clean_expired()
+        lost, self._lost_workers = sorted(self._lost_workers), set()
+        return lost
+
+    async def drain_worker_tasks(self, worker_id: str) -> list[tuple[dict[str, Any], float]]:
+        queue = self._worker_task_queues.get(worker_id)
+        if queue is None:
+            return []
+        entries = sorted(queue._queue)  # type: ignore[attr-defined]
+        queue._queue.clear()  # type: ignore[attr-defined]
+        return [(payload, -negative_priority) for negative_priority, _, payload in entries]
+
+    async def register_task_queue_class(
+        self,
+        task_type: str,
+        class_id: str,
+        requirements: dict[str, Any],
+    ) -> None:
+        self._task_queue_classes.setdefault(task_type, {})[class_id] = requirements
+
+    async def get_task_queue_classes(self, task_types: list[str]) -> dict[str, dict[str, dict[str, Any]]]:
+        return {
+            task_type: dict(self._task_queue_classes[task_type])
+            for task_type in task_types
+            if task_type in self._task_queue_classes
+        }
+
+    async def refresh_worker_ttl(self, worker_id: str, ttl: int) -> bool:
+        if worker_id in self._workers:
+            self._worker_ttls[worker_id] = monotonic() + ttl
+            return True
+        return False
 
     async def update_worker_status(
         self,
@@ -120,108 +370,178 @@ class MemoryStorage(StorageBackend):
         status_update: dict[str, Any],
         ttl: int,
     ) -> dict[str, Any] | None:
-        async with self._lock:
-            if worker_id in self._workers:
-                self._workers[worker_id].update(status_update)
-                self._worker_ttls[worker_id] = monotonic() + ttl
-                return self._workers[worker_id]
-            return None
+        if worker_id in self._workers:
+            self._workers[worker_id].update(status_update)
+            self._worker_ttls[worker_id] = monotonic() + ttl
+            self._index_worker(worker_id, self._workers[worker_id])
+            return self._workers[worker_id]
+        return None
 
     async def update_worker_data(
         self,
         worker_id: str,
         update_data: dict[str, Any],
+        fence: FencingToken | None = None,
     ) -> dict[str, Any] | None:
-        async with self._lock:
-            if worker_id in self._workers:
-                self._workers[worker_id].update(update_data)
-                return self._workers[worker_id]
+        if fence is not None and not await self.check_fencing_token(fence):
             return None
+        if worker_id in self._workers:
+            self._workers[worker_id].update(update_data)
+            self._index_worker(worker_id, self._workers[worker_id])
+            return self._workers[worker_id]
+        return None
 
-    async def get_available_workers(self) -> list[dict[str, Any]]:
-        async with self._lock:
-            now = monotonic()
-            active_workers = []
-            active_workers.extend(
-                worker_info
-                for worker_id, worker_info in self._workers.items()
-                if self._worker_ttls.get(worker_id, 0) > now
-            )
-            return active_workers
+    async def get_available_workers(self, allow_stale: bool = False) -> list[dict[str, Any]]:
+        self._clean_expired()
+        return list(self._workers.values())
+
+    async def find_workers(
+        self,
+        task_type: str | None = None,
+        status: str | None = None,
+        resource_requirements: dict[str, Any] | None = None,
+    ) -> list[dict[str, Any]]:
+        self._clean_expired()
+        terms, gpu_model = worker_query_terms(task_type, status, resource_requirements)
+        if terms:
+            worker_ids = set.intersection(*(self._worker_index.get(term, set()) for term in terms))
+        else:
+            worker_ids = set(self._workers)
+
+        if gpu_model:
+            gpu_ids: set[str] = set()
+            for term, ids in self._worker_index.items():
+                if term.startswith("gpu:") and gpu_model in term[4:]:
+                    gpu_ids |= ids
+            worker_ids &= gpu_ids
+
+        return [self._workers[worker_id] for worker_id in sorted(worker_ids)]
 
     async def add_job_to_watch(self, job_id: str, timeout_at: float) -> None:
-        async with self._lock:
-            self._watched_jobs[job_id] = timeout_at
+        self._watched_jobs[job_id] = timeout_at
+        self._watch_added({job_id: timeout_at})
 
     async def remove_job_from_watch(self, job_id: str) -> None:
-        async with self._lock:
-            self._watched_jobs.pop(job_id, None)
+        self._watched_jobs.pop(job_id, None)
+        self._watch_removed(job_id)
+
+    async def refresh_watch_shards(self, member_id: str, ttl: int) -> set[int]:
+        now = time()
+        self._watch_members[member_id] = now + ttl
+        self._watch_members = {member: expiry for member, expiry in self._watch_members.items() if expiry > now}
+        return assign_shards(self._watch_members, 1)[member_id]
+
+    async def release_watch_shards(self, member_id: str) -> None:
+        self._watch_members.pop(member_id, None)
 
-    async def get_timed_out_jobs(self) -> list[str]:
-        async with self._lock:
-            now = monotonic()
-            timed_out_ids = [job_id for job_id, timeout_at in self._watched_jobs.items() if timeout_at <= now]
-            for job_id in timed_out_ids:
-                self._watched_jobs.pop(job_id, None)
-            return timed_out_ids
+    async def get_next_watch_deadline(self, shards: Iterable[int] | None = None) -> float | None:
+        if shards is not None and 0 not in shards:
+            return None
+        return self._watched_jobs.next_deadline()
+
+    async def get_timed_out_jobs(self, limit: int = 1000, shards: Iterable[int] | None = None) -> list[str]:
+        if shards is not None and 0 not in shards:
+            return []
+        return self._watched_jobs.pop_due(time(), limit)
 
     async def enqueue_job(self, job_id: str) -> None:
         await self._job_queue.put(job_id)
 
     async def dequeue_job(self) -> tuple[str, str] | None:
         """Waits indefinitely for a job ID from the queue and returns it.
-        Returns a tuple of (job_id, message_id). In MemoryStorage, message_id is dummy.
+        Returns a tuple of (job_id, message_id). In MemoryStorage, message_id is a local counter.
         """
         job_id = await self._job_queue.get()
         self._job_queue.task_done()
-        return job_id, "memory-msg-id"
+        return job_id, f"memory-msg-{next(self._message_ids)}"
+
+    async def dequeue_jobs(self, max_count: int, block_ms: int) -> list[tuple[str, str]]:
+        """Waits up to `block_ms` for the first job, then drains up to `max_count` without waiting."""
+        try:
+            job_ids = [await wait_for(self._job_queue.get(), timeout=block_ms / 1000)]
+        except AsyncTimeoutError:
+            return []
+        while len(job_ids) < max_count:
+            try:
+                job_ids.append(self._job_queue.get_nowait())
+            except QueueEmpty:
+                break
+
+        for _ in job_ids:
+            self._job_queue.task_done()
+        return [(job_id, f"memory-msg-{next(self._message_ids)}") for job_id in job_ids]
 
     async def ack_job(self, message_id: str) -> None:
         """No-op for MemoryStorage as it doesn't support persistent streams."""
         pass
 
     async def quarantine_job(self, job_id: str) -> None:
-        async with self._lock:
-            self._quarantine_queue.append(job_id)
+        self._quarantine_queue.append(job_id)
 
     async def get_quarantined_jobs(self) -> list[str]:
-        async with self._lock:
-            return list(self._quarantine_queue)
+        return list(self._quarantine_queue)
 
     async def deregister_worker(self, worker_id: str) -> None:
-        async with self._lock:
-            self._workers.pop(worker_id, None)
-            self._worker_ttls.pop(worker_id, None)
-            self._worker_task_queues.pop(worker_id, None)
+        self._workers.pop(worker_id, None)
+        self._worker_ttls.pop(worker_id, None)
+        self._worker_task_queues.pop(worker_id, None)
+        self._unindex_worker(worker_id)
 
     async def increment_key_with_ttl(self, key: str, ttl: int) -> int:
-        async with self._lock:
-            now = monotonic()
-            if key not in self._generic_keys or self._generic_key_ttls.get(key, 0) < now:
-                self._generic_keys[key] = 0
+        now = monotonic()
+        if key not in self._generic_keys or (self._generic_key_ttls.get(key) or 0) < now:
+            self._generic_keys[key] = 0
 
-            self._generic_keys[key] += 1
-            self._generic_key_ttls[key] = now + ttl
-            return self._generic_keys[key]
+        self._generic_keys[key] += 1
+        self._generic_key_ttls[key] = now + ttl
+        return self._generic_keys[key]
 
     async def save_client_config(self, token: str, config: dict[str, Any]) -> None:
-        async with self._lock:
-            self._client_configs[token] = config
+        self._client_configs[token] = config
 
     async def get_client_config(self, token: str) -> dict[str, Any] | None:
-        async with self._lock:
-            return self._client_configs.get(token)
+        return self._client_configs.get(token)
 
     async def initialize_client_quota(self, token: str, quota: int) -> None:
-        async with self._lock:
-            self._quotas[token] = quota
+        self._quotas[token] = quota
 
     async def check_and_decrement_quota(self, token: str) -> bool:
-        async with self._lock:
-            if self._quotas.get(token, 0) > 0:
-                self._quotas[token] -= 1
-                return True
-            return False
+        if self._quotas.get(token, 0) > 0:
+            self._quotas[token] -= 1
+            return True
+        return False
+
+    def _sum_worker_stats(self, worker_id: str, window_days: int) -> WorkerTaskStats:
+        buckets = self._worker_stats.get(worker_id, {})
+        first_day = stats_day() - window_days + 1
+        for day in [d for d in buckets if d < first_day]:
+            del buckets[day]
+        totals = [sum(values) for values in zip(*buckets.values(), strict=True)]
+        return WorkerTaskStats(*totals) if totals else WorkerTaskStats()
+
+    async def record_worker_task_outcome(
+        self,
+        worker_id: str,
+        success: bool,
+        duration_ms: int | None,
+        window_days: int,
+    ) -> WorkerTaskStats:
+        buckets = self._worker_stats.setdefault(worker_id, {})
+        day = stats_day()
+        buckets[day] = buckets.get(day, WorkerTaskStats()).add(success, duration_ms)
+        return self._sum_worker_stats(worker_id, window_days)
+
+    async def get_worker_task_stats(self, worker_id: str, window_days: int) -> WorkerTaskStats:
+        return self._sum_worker_stats(worker_id, window_days)
+
+    async def set_worker_task_stats(
+        self,
+        worker_id: str,
+        day: int,
+        stats: WorkerTaskStats,
+        window_days: int,
+    ) -> None:
+        self._worker_stats.setdefault(worker_id, {})[day] = stats
 
     async def flush_all(self):
         """
@@ -229,67 +549,67 @@ class MemoryStorage(StorageBackend):
         This is a destructive operation intended for use in tests to ensure
         a clean state between test runs.
         """
-        async with self._lock:
-            self._jobs.clear()
-            self._workers.clear()
-            self._worker_ttls.clear()
-            self._worker_task_queues.clear()
-            while not self._job_queue.empty():
-                try:
-                    self._job_queue.get_nowait()
-                except QueueEmpty:
-                    break
-            self._quarantine_queue.clear()
-            self._watched_jobs.clear()
-            self._client_configs.clear()
-            self._quotas.clear()
-            self._generic_keys.clear()
-            self._generic_key_ttls.clear()
-            self._locks.clear()
+        self._jobs.clear()
+        self._workers.clear()
+        self._worker_ttls.clear()
+        self._lost_workers.clear()
+        self._task_leases.clear()
+        self._task_lease_deadlines.clear()
+        self._worker_task_queues.clear()
+        self._worker_index.clear()
+        self._worker_terms.clear()
+        self._worker_stats.clear()
+        self._task_queue_classes.clear()
+        while not self._job_queue.empty():
+            try:
+                self._job_queue.get_nowait()
+            except QueueEmpty:
+                break
+        self._quarantine_queue.clear()
+        self._watched_jobs.clear()
+        self._watch_members.clear()
+        self._client_configs.clear()
+        self._quotas.clear()
+        self._generic_keys.clear()
+        self._generic_key_ttls.clear()
+        self._locks.clear()
 
     async def get_job_queue_length(self) -> int:
         return self._job_queue.qsize()
 
     async def get_active_worker_count(self) -> int:
-        async with self._lock:
-            await self._clean_expired()
-            return len(self._workers)
+        self._clean_expired()
+        return len(self._workers)
 
     async def set_nx_ttl(self, key: str, value: str, ttl: int) -> bool:
-        async with self._lock:
-            await self._clean_expired()
-            if key in self._generic_keys:
-                return False
+        self._clean_expired()
+        if key in self._generic_keys:
+            return False
 
-            self._generic_keys[key] = value
-            self._generic_key_ttls[key] = monotonic() + ttl
-            return True
+        self._generic_keys[key] = value
+        self._generic_key_ttls[key] = monotonic() + ttl
+        return True
 
     async def get_str(self, key: str) -> str | None:
-        async with self._lock:
-            await self._clean_expired()
-            val = self._generic_keys.get(key)
-            return str(val) if val is not None else None
+        self._clean_expired()
+        val = self._generic_keys.get(key)
+        return str(val) if val is not None else None
 
     async def set_str(self, key: str, value: str, ttl: int | None = None) -> None:
-        async with self._lock:
-            self._generic_keys[key] = value
-            if ttl:
-                self._generic_key_ttls[key] = monotonic() + ttl
-            else:
-                self._generic_key_ttls.pop(key, None)
+        self._generic_keys[key] = value
+        if ttl:
+            self._generic_key_ttls[key] = monotonic() + ttl
+        else:
+            self._generic_key_ttls.pop(key, None)
 
     async def get_worker_info(self, worker_id: str) -> dict[str, Any] | None:
-        async with self._lock:
-            return self._workers.get(worker_id)
+        return self._workers.get(worker_id)
 
     async def set_worker_token(self, worker_id: str, token: str) -> None:
-        async with self._lock:
-            self._worker_tokens[worker_id] = token
+        self._worker_tokens[worker_id] = token
 
     async def get_worker_token(self, worker_id: str) -> str | None:
-        async with self._lock:
-            return self._worker_tokens.get(worker_id)
+        return self._worker_tokens.get(worker_id)
 
     async def set_task_cancellation_flag(self, task_id: str) -> None:
         key = f"task_cancel:{task_id}"
@@ -312,20 +632,38 @@ class MemoryStorage(StorageBackend):
         }
 
     async def acquire_lock(self, key: str, holder_id: str, ttl: int) -> bool:
-        async with self._lock:
-            now = monotonic()
-            current_lock = self._locks.get(key)
-            if current_lock and current_lock[1] > now:
-                return False
-            self._locks[key] = (holder_id, now + ttl)
-            return True
+        now = monotonic()
+        current_lock = self._locks.get(key)
+        if current_lock and current_lock[1] > now:
+            return False
+        self._locks[key] = (holder_id, now + ttl)
+        return True
 
-    async def release_lock(self, key: str, holder_id: str) -> bool:
-        async with self._lock:
-            current_lock = self._locks.get(key)
-            if current_lock:
-                owner, expiry = current_lock
-                if owner == holder_id:
-                    del self._locks[key]
-                    return True
+    async def acquire_lock_with_token(self, key: str, holder_id: str, ttl: int) -> int | None:
+        now = monotonic()
+        current_lock = self._locks.get(key)
+        if current_lock and current_lock[1] > now:
+            return None
+        self._locks[key] = (holder_id, now + ttl)
+        self._lock_tokens[key] = self._lock_tokens.get(key, 0) + 1
+        return self._lock_tokens[key]
+
+    async def check_fencing_token(self, fence: FencingToken) -> bool:
+        return self._lock_tokens.get(fence.lock_key) == fence.token
+
+    async def extend_lock(self, key: str, holder_id: str, ttl: int) -> bool:
+        now = monotonic()
+        current_lock = self._locks.get(key)
+        if not current_lock or current_lock[0] != holder_id or current_lock[1] <= now:
             return False
+        self._locks[key] = (holder_id, now + ttl)
+        return True
+
+    async def release_lock(self, key: str, holder_id: str) -> bool:
+        current_lock = self._locks.get(key)
+        if current_lock:
+            owner, expiry = current_lock
+            if owner == holder_id:
+                del self._locks[key]
+                return True
+        return False
@@ -1,20 +1,88 @@
-from asyncio import CancelledError, get_running_loop
+from asyncio import CancelledError, sleep
+from collections import OrderedDict
+from hashlib import blake2b
 from logging import getLogger
 from os import getenv
 from socket import gethostname
-from typing import Any
+from time import monotonic, time
+from typing import Any, AsyncIterator, Iterable
 
 from msgpack import packb, unpackb
 from redis import Redis, WatchError
-from redis.exceptions import NoScriptError, ResponseError
+from redis.asyncio import BlockingConnectionPool
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import NoScriptError, RedisError, ResponseError
 
-from .base import StorageBackend
+from .. import metrics
+from ..data_types import FencingToken, WorkerTask, WorkerTaskStats
+from .base import StorageBackend, assign_shards, stats_day, worker_index_terms, worker_query_terms
 
 logger = getLogger(__name__)
 
+# Sorted set of worker IDs scored by the wall-clock time their registration expires.
+WORKERS_ALIVE_KEY = "orchestrator:worker:alive"
+# Workers whose registration expired and whose queued tasks have not been reassigned yet
+WORKERS_LOST_KEY = "orchestrator:worker:lost"
+LOST_WORKERS_BATCH_SIZE = 100
+# Sorted set of leased task IDs scored by the wall-clock lease deadline, and the hash
+# holding the worker, payload and priority of each leased task for redelivery.
+TASK_LEASES_KEY = "orchestrator:task_leases"
+TASK_LEASE_DATA_KEY = "orchestrator:task_lease_data"
+# Pub/sub channel announcing the name of each task queue a task was added to.
+TASK_WAKEUP_CHANNEL = "orchestrator:task_wakeups"
+# How often `dequeue_task_for_worker` polls the queues when it cannot block on them.
+TASK_POLL_INTERVAL_SECONDS = 0.5
+# Set of all GPU model names seen in registrations, used for substring matching.
+WORKER_GPU_MODELS_KEY = "orchestrator:worker:gpu_models"
+# Sorted set of orchestrator instances consuming the job stream partitions, scored by expiry.
+JOB_STREAM_CONSUMERS_KEY = "orchestrator:job_stream_consumers"
+# Sorted set of orchestrator instances sharing the watch list shards, scored by expiry.
+WATCH_MEMBERS_KEY = "orchestrator:watch_members"
+# Upper bound on the number of jobs whose field digests are remembered for delta writes.
+JOB_FIELD_CACHE_SIZE = 10000
+# How long the result of a replica freshness check is reused.
+REPLICA_CHECK_INTERVAL_SECONDS = 1.0
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """A connection pool with a size limit that waits for a free connection
+    (up to `timeout` seconds) and records the wait time per pool.
+    """
+
+    def __init__(self, *args: Any, pool_name: str, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.pool_name = pool_name
+
+    async def get_connection(self, *args: Any, **kwargs: Any) -> Any:
+        start = monotonic()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        finally:
+            metrics.redis_pool_wait_seconds.observe({metrics.LABEL_POOL: self.pool_name}, monotonic() - start)
+
 
 class RedisStorage(StorageBackend):
-    """Implementation of the state store based on Redis."""
+    """Implementation of the state store based on Redis.
+
+    Commands that block a connection on the server (BZPOPMAX, blocking XREADGROUP,
+    Pub/Sub subscriptions) are sent through `blocking_client`, so they cannot use up
+    the connections needed by the short commands of `redis_client`. Without it,
+    both kinds share `redis_client`.
+
+    Reads that only display data (`allow_stale=True`) and the queue statistics are
+    served by `replica_client`, if given, as long as the replica's link to the primary
+    is up and it last heard from it at most `replica_max_lag_seconds` ago. Otherwise,
+    and for all writes and read-modify-write paths, the primary is used.
+    """
+
+    # Key names of the worker registry and the task leases. `RedisClusterStorage`
+    # replaces them with hash-tagged ones, so their multi-key commands stay in one slot.
+    _worker_key_prefix = "orchestrator:worker"
+    _workers_alive_key = WORKERS_ALIVE_KEY
+    _workers_lost_key = WORKERS_LOST_KEY
+    _worker_gpu_models_key = WORKER_GPU_MODELS_KEY
+    _task_leases_key = TASK_LEASES_KEY
+    _task_lease_data_key = TASK_LEASE_DATA_KEY
 
     def __init__(
         self,
@@ -23,18 +91,197 @@ class RedisStorage(StorageBackend):
         group_name: str = "orchestrator_group",
         consumer_name: str | None = None,
         min_idle_time_ms: int = 60000,
+        blocking_client: Redis | None = None,
+        stream_partitions: int = 1,
+        replica_client: Redis | None = None,
+        replica_max_lag_seconds: float = 5.0,
+        watch_shards: int = 1,
     ):
         self._redis = redis_client
+        self._blocking_redis = blocking_client or redis_client
+        self._pubsub_redis = self._blocking_redis
+        self._replica_redis = replica_client
+        self._replica_max_lag_seconds = replica_max_lag_seconds
+        self._replica_fresh = False
+        self._replica_checked_at = float("-inf")
         self._prefix = prefix
         self._stream_key = "orchestrator:job_stream"
         self._group_name = group_name
-        self._consumer_name = consumer_name or getenv("INSTANCE_ID", gethostname())
+        self._consumer_name: str = consumer_name or getenv("INSTANCE_ID") or gethostname()
         self._group_created = False
         self._min_idle_time_ms = min_idle_time_ms
+        self._stream_partitions = stream_partitions
+        self._watch_shards = watch_shards
+        # Partitions whose lease this instance holds, and those of them it reads new jobs
+        # from. A partition that is handed over is no longer read, but stays owned until
+        # its in-flight jobs are acknowledged, so they never overlap with the next owner's.
+        self._owned_partitions: set[int] = {0} if stream_partitions == 1 else set()
+        self._read_partitions: set[int] = set(self._owned_partitions)
+        self._inflight_jobs: dict[int, set[str]] = {}
+        # Jobs already delivered to this instance but not returned yet: those left pending
+        # in partitions taken over from another instance, and those read beyond `max_count`
+        self._buffered_jobs: list[tuple[str, str]] = []
+        # job_id -> {field: digest of the packed value} as last read or written by this instance
+        self._job_field_digests: OrderedDict[str, dict[str, bytes]] = OrderedDict()
+
+    @classmethod
+    def from_url(
+        cls,
+        url: str,
+        max_connections: int = 50,
+        blocking_max_connections: int = 50,
+        pool_timeout: float = 5.0,
+        replica_url: str | None = None,
+        **kwargs: Any,
+    ) -> "RedisStorage":
+        """Creates a storage with separate, size-limited connection pools for short
+        and for blocking commands.
+
+        :param url: The Redis URL, e.g. `redis://localhost:6379/0`.
+        :param max_connections: The size of the pool for short commands (and for the replica).
+        :param blocking_max_connections: The size of the pool for blocking commands.
+        :param pool_timeout: How long a command waits for a free connection before failing.
+        :param replica_url: The URL of a replica serving reads that tolerate staleness.
+        :param kwargs: Passed on to the `RedisStorage` constructor.
+        """
+        pools = {
+            name: InstrumentedConnectionPool.from_url(
+                pool_url, max_connections=size, timeout=pool_timeout, pool_name=name
+            )
+            for name, pool_url, size in (
+                ("default", url, max_connections),
+                ("blocking", url, blocking_max_connections),
+                ("replica", replica_url, max_connections),
+            )
+            if pool_url
+        }
+        return cls(
+            AsyncRedis(connection_pool=pools["default"]),
+            blocking_client=AsyncRedis(connection_pool=pools["blocking"]),
+            replica_client=AsyncRedis(connection_pool=pools["replica"]) if replica_url else None,
+            **kwargs,
+        )
+
+    async def close(self) -> None:
+        """Closes the clients and disconnects their connection pools."""
+        await self._redis.aclose()
+        if self._blocking_redis is not self._redis:
+            await self._blocking_redis.aclose()
+        if self._replica_redis is not None:
+            await self._replica_redis.aclose()
+
+    async def _read_client(self, allow_stale: bool = True) -> Any:
+        """Returns the client for a read: the replica if the read allows stale data and
+        the replica is fresh enough, the primary otherwise. The replica's freshness is
+        checked with INFO at most once per `REPLICA_CHECK_INTERVAL_SECONDS`.
+        """
+        if not allow_stale or self._replica_redis is None:
+            return self._redis
+        now = monotonic()
+        if now - self._replica_checked_at >= REPLICA_CHECK_INTERVAL_SECONDS:
+            self._replica_checked_at = now
+            try:
+                self._replica_fresh = await self._replica_is_fresh(self._replica_redis)
+            except RedisError:
+                logger.warning("Could not check the Redis replica, reading from the primary.")
+                self._replica_fresh = False
+        return self._replica_redis if self._replica_fresh else self._redis
+
+    async def _replica_is_fresh(self, replica: Redis) -> bool:
+        info = await replica.info("replication")
+        return self._replication_is_fresh(info)
+
+    def _replication_is_fresh(self, info: dict[str, Any]) -> bool:
+        """Whether the `INFO replication` of a replica shows an up-to-date link to the primary."""
+        return bool(
+            info.get("master_link_status") == "up"
+            and info.get("master_last_io_seconds_ago", float("inf")) <= self._replica_max_lag_seconds
+        )
 
     def _get_key(self, job_id: str) -> str:
         return f"{self._prefix}:{job_id}"
 
+    def _worker_info_key(self, worker_id: str) -> str:
+        return f"{self._worker_key_prefix}:info:{worker_id}"
+
+    def _worker_index_key(self, term: str) -> str:
+        return f"{self._worker_key_prefix}:index:{term}"
+
+    def _worker_terms_key(self, worker_id: str) -> str:
+        return f"{self._worker_key_prefix}:terms:{worker_id}"
+
+    @staticmethod
+    def _decode_set(members: Iterable[bytes | str]) -> set[str]:
+        return {m.decode("utf-8") if isinstance(m, bytes) else m for m in members}
+
+    async def _get_worker_terms(self, worker_id: str, client: Any = None) -> set[str]:
+        """Returns the index terms the worker is currently listed under."""
+        client = client or self._redis
+        return self._decode_set(await client.smembers(self._worker_terms_key(worker_id)))
+
+    def _stage_worker_index(
+        self,
+        pipe: Any,
+        worker_id: str,
+        worker_info: dict[str, Any],
+        old_terms: set[str],
+        ttl: int | None,
+    ) -> None:
+        """Queues the commands that bring the secondary indexes of a worker up to date.
+        Only the difference between the old and the new terms is written.
+        """
+        new_terms = worker_index_terms(worker_info)
+        for term in old_terms - new_terms:
+            pipe.srem(self._worker_index_key(term), worker_id)
+        for term in new_terms - old_terms:
+            pipe.sadd(self._worker_index_key(term), worker_id)
+            if term.startswith("gpu:"):
+                pipe.sadd(self._worker_gpu_models_key, term[4:])
+        if new_terms != old_terms:
+            terms_key = self._worker_terms_key(worker_id)
+            pipe.delete(terms_key)
+            if new_terms:
+                pipe.sadd(terms_key, *new_terms)
+        if ttl is not None:
+            pipe.zadd(self._workers_alive_key, {worker_id: time() + ttl})
+
+    async def _prune_workers(self, worker_ids: list[str]) -> None:
+        """Removes workers whose info key has expired from all secondary indexes."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for worker_id in worker_ids:
+                pipe.exists(self._worker_info_key(worker_id))
+                pipe.smembers(self._worker_terms_key(worker_id))
+            results = await pipe.execute()
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for i, worker_id in enumerate(worker_ids):
+                exists, terms = results[2 * i], results[2 * i + 1]
+                if exists:
+                    # The worker re-registered in the meantime.
+                    continue
+                for term in self._decode_set(terms):
+                    pipe.srem(self._worker_index_key(term), worker_id)
+                pipe.delete(self._worker_terms_key(worker_id))
+                pipe.zrem(self._workers_alive_key, worker_id)
+                pipe.sadd(self._workers_lost_key, worker_id)
+            await pipe.execute()
+        logger.debug(f"Pruned expired workers from the registry indexes: {worker_ids}")
+
+    async def _load_workers(self, worker_ids: Iterable[bytes | str], client: Any = None) -> list[dict[str, Any]]:
+        """Fetches worker info for the given IDs, pruning the ones that have expired
+        (unless reading from a replica, which cannot be written to).
+        """
+        client = client or self._redis
+        ids = sorted(self._decode_set(worker_ids))
+        if not ids:
+            return []
+
+        worker_data_list = await client.mget([self._worker_info_key(worker_id) for worker_id in ids])
+        stale_ids = [worker_id for worker_id, data in zip(ids, worker_data_list, strict=True) if not data]
+        if stale_ids and client is self._redis:
+            await self._prune_workers(stale_ids)
+        return [self._unpack(data) for data in worker_data_list if data]
+
     @staticmethod
     def _pack(data: Any) -> bytes:
         return packb(data, use_bin_type=True)
@@ -43,18 +290,92 @@ class RedisStorage(StorageBackend):
     def _unpack(data: bytes) -> Any:
         return unpackb(data, raw=False)
 
-    async def get_job_state(self, job_id: str) -> dict[str, Any] | None:
-        """Get the job state from Redis."""
+    @staticmethod
+    def _decode_hash_fields(raw: dict[bytes | str, bytes]) -> dict[str, bytes]:
+        return {(k.decode("utf-8") if isinstance(k, bytes) else k): v for k, v in raw.items()}
+
+    @staticmethod
+    def _field_digest(data: bytes) -> bytes:
+        return blake2b(data, digest_size=16).digest()
+
+    def _remember_job_fields(self, job_id: str, digests: dict[str, bytes]) -> None:
+        self._job_field_digests[job_id] = digests
+        self._job_field_digests.move_to_end(job_id)
+        while len(self._job_field_digests) > JOB_FIELD_CACHE_SIZE:
+            self._job_field_digests.popitem(last=False)
+
+    def _stage_job_state(self, pipe: Any, job_id: str, state: dict[str, Any]) -> None:
+        """Queues the commands that write the job state as a hash with one field per
+        top-level key. If this instance has fully read the job since its last write,
+        only the fields changed since that read are rewritten and the removed ones
+        deleted, so large fields such as `initial_data` are not sent again on every
+        status change. The cached digests are used up by the write: another instance
+        may change the job afterwards, so the next delta needs a fresh read.
+        """
         key = self._get_key(job_id)
-        data = await self._redis.get(key)
-        return self._unpack(data) if data else None
+        packed = {field: self._pack(value) for field, value in state.items()}
+        digests = {field: self._field_digest(data) for field, data in packed.items()}
+
+        known = self._job_field_digests.pop(job_id, None)
+        if known is None:
+            # Not read since the last write: replace the whole hash (this also migrates legacy blob keys).
+            pipe.delete(key)
+            if packed:
+                pipe.hset(key, mapping=packed)
+            return
+
+        if changed := {field: packed[field] for field, digest in digests.items() if known.get(field) != digest}:
+            pipe.hset(key, mapping=changed)
+        if removed := [field for field in known if field not in digests]:
+            pipe.hdel(key, *removed)
+
+    async def _get_legacy_job_state(self, job_id: str, fields: list[str] | None) -> dict[str, Any] | None:
+        """Reads a job stored as a single msgpack blob by an older version."""
+        data = await self._redis.get(self._get_key(job_id))
+        if not data:
+            return None
+        state = self._unpack(data)
+        return state if fields is None else {field: state[field] for field in fields if field in state}
+
+    async def get_job_state(
+        self,
+        job_id: str,
+        fields: list[str] | None = None,
+        allow_stale: bool = False,
+    ) -> dict[str, Any] | None:
+        """Get the job state (or a projection of its fields) from the job hash in Redis."""
+        key = self._get_key(job_id)
+        client = await self._read_client(allow_stale)
+        try:
+            if fields is None:
+                raw = await client.hgetall(key)
+                exists = bool(raw)
+            else:
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.exists(key)
+                    pipe.hmget(key, fields)
+                    exists, values = await pipe.execute()
+                raw = {field: value for field, value in zip(fields, values, strict=True) if value is not None}
+        except ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                raise
+            return await self._get_legacy_job_state(job_id, fields)
+
+        if not exists:
+            return None
+        raw = self._decode_hash_fields(raw)
+        if fields is None and client is self._redis:
+            # A replica may lag behind, so what it returns cannot be the base of delta writes.
+            self._remember_job_fields(job_id, {field: self._field_digest(data) for field, data in raw.items()})
+        return {field: self._unpack(data) for field, data in raw.items()}
 
     async def get_priority_queue_stats(self, task_type: str) -> dict[str, Any]:
         """Gets statistics for the priority queue (Sorted Set) for a given task type."""
         worker_type = task_type
         key = f"orchestrator:task_queue:{worker_type}"
 
-        pipe = self._redis.pipeline()
+        client = await self._read_client()
+        pipe = client.pipeline()
         pipe.zcard(key)  # Get the number of elements
         # Get the top 3 highest priority bids (scores)
         pipe.zrange(key, -3, -1, withscores=True, score_cast_func=float)
@@ -67,7 +388,7 @@ class RedisStorage(StorageBackend):
         bottom_bids = [score for _, score in bottom_bids_raw]
 
         # Simple average calculation, can be improved for large queues
-        all_scores = [s for _, s in await self._redis.zrange(key, 0, -1, withscores=True, score_cast_func=float)]
+        all_scores = [s for _, s in await client.zrange(key, 0, -1, withscores=True, score_cast_func=float)]
         avg_bid = sum(all_scores) / len(all_scores) if all_scores else 0
 
         return {
@@ -84,34 +405,134 @@ class RedisStorage(StorageBackend):
         await self._redis.set(key, "1", ex=3600)
 
     async def save_job_state(self, job_id: str, state: dict[str, Any]) -> None:
-        """Save the job state to Redis."""
-        key = self._get_key(job_id)
-        await self._redis.set(key, self._pack(state))
+        """Save the job state to Redis, writing only the fields that changed."""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            self._stage_job_state(pipe, job_id, state)
+            await pipe.execute()
+
+    async def commit_transition(
+        self,
+        job_id: str,
+        state: dict[str, Any],
+        enqueue: bool = False,
+        watch: dict[str, float] | None = None,
+        worker_tasks: list[WorkerTask] | None = None,
+    ) -> None:
+        """Writes the job state, watch entries, worker tasks and the stream entry
+        in a single MULTI/EXEC transaction (one round trip).
+        """
+        async with self._redis.pipeline(transaction=True) as pipe:
+            self._stage_job_state(pipe, job_id, state)
+            self._stage_transition_effects(pipe, job_id, enqueue, watch, worker_tasks)
+            await pipe.execute()
+        self._watch_added(watch or {})
+
+    def _stage_transition_effects(
+        self,
+        pipe: Any,
+        job_id: str,
+        enqueue: bool,
+        watch: dict[str, float] | None,
+        worker_tasks: list[WorkerTask] | None,
+    ) -> None:
+        """Queues the writes of a transition other than the job state itself."""
+        self._stage_watch_and_tasks(pipe, watch, worker_tasks)
+        if enqueue:
+            pipe.xadd(self._partition_key(self._job_partition(job_id)), {"job_id": job_id})
+
+    def _stage_watch_and_tasks(
+        self, pipe: Any, watch: dict[str, float] | None, worker_tasks: list[WorkerTask] | None
+    ) -> None:
+        for shard, entries in self._watch_entries_by_shard(watch or {}).items():
+            pipe.zadd(self._watch_key(shard), entries)
+        for task in worker_tasks or []:
+            pipe.zadd(f"orchestrator:task_queue:{task.queue}", {self._pack(task.payload): task.priority})
+            pipe.publish(TASK_WAKEUP_CHANNEL, task.queue)
+
+    async def commit_transitions(
+        self,
+        states: dict[str, dict[str, Any]],
+        watch: dict[str, float] | None = None,
+        worker_tasks: list[WorkerTask] | None = None,
+    ) -> None:
+        """Writes the states of all jobs, the watch entries and the worker tasks in a
+        single MULTI/EXEC transaction.
+        """
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for job_id, state in states.items():
+                self._stage_job_state(pipe, job_id, state)
+            self._stage_watch_and_tasks(pipe, watch, worker_tasks)
+            await pipe.execute()
+        self._watch_added(watch or {})
 
     async def update_job_state(
         self,
         job_id: str,
         update_data: dict[str, Any],
     ) -> dict[Any, Any] | None | Any:
-        """Atomically update the job state in Redis using a transaction."""
-        key = self._get_key(job_id)
+        """Update only the given fields of the job hash and return the merged state.
+        HSET is atomic per call, so no optimistic locking is needed.
+        """
+        if not update_data:
+            return await self.get_job_state(job_id) or {}
 
-        async with self._redis.pipeline(transaction=True) as pipe:
-            while True:
-                try:
-                    await pipe.watch(key)
-                    current_state_raw = await pipe.get(key)
-                    current_state = self._unpack(current_state_raw) if current_state_raw else {}
-
-                    # Simple dictionary merge. For nested structures, a deep merge may be required.
-                    current_state.update(update_data)
-
-                    pipe.multi()
-                    pipe.set(key, self._pack(current_state))
-                    await pipe.execute()
-                    return current_state
-                except WatchError:
-                    continue
+        key = self._get_key(job_id)
+        packed = {field: self._pack(value) for field, value in update_data.items()}
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping=packed)
+                pipe.hgetall(key)
+                _, raw = await pipe.execute()
+        except ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                raise
+            # Legacy blob key: merge and rewrite it as a hash.
+            current_state = await self._get_legacy_job_state(job_id, None) or {}
+            current_state.update(update_data)
+            self._job_field_digests.pop(job_id, None)
+            await self.save_job_state(job_id, current_state)
+            return current_state
+
+        raw = self._decode_hash_fields(raw)
+        self._remember_job_fields(job_id, {field: self._field_digest(data) for field, data in raw.items()})
+        return {field: self._unpack(data) for field, data in raw.items()}
+
+    async def get_job_states(
+        self,
+        job_ids: list[str],
+        fields: list[str] | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        """Reads the hashes of all jobs in one pipeline. Full reads refresh the field
+        cache, like `get_job_state`.
+        """
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                key = self._get_key(job_id)
+                pipe.exists(key)
+                if fields is None:
+                    pipe.hgetall(key)
+                else:
+                    pipe.hmget(key, fields)
+            results = await pipe.execute(raise_on_error=False)
+
+        states = {}
+        for i, job_id in enumerate(job_ids):
+            exists, raw = results[2 * i], results[2 * i + 1]
+            if not exists:
+                continue
+            if isinstance(raw, ResponseError):
+                # Legacy blob key (WRONGTYPE)
+                if (state := await self.get_job_state(job_id, fields)) is not None:
+                    states[job_id] = state
+            elif fields is None:
+                raw = self._decode_hash_fields(raw)
+                self._remember_job_fields(job_id, {field: self._field_digest(data) for field, data in raw.items()})
+                states[job_id] = {field: self._unpack(data) for field, data in raw.items()}
+            else:
+                states[job_id] = {
+                    field: self._unpack(data) for field, data in zip(fields, raw, strict=True) if data is not None
+                }
+        return states
 
     async def register_worker(
         self,
@@ -121,8 +542,12 @@ class RedisStorage(StorageBackend):
     ) -> None:
         """Registers a worker in Redis."""
         worker_info.setdefault("reputation", 1.0)
-        key = f"orchestrator:worker:info:{worker_id}"
-        await self._redis.set(key, self._pack(worker_info), ex=ttl)
+        key = self._worker_info_key(worker_id)
+        old_terms = await self._get_worker_terms(worker_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(key, self._pack(worker_info), ex=ttl)
+            self._stage_worker_index(pipe, worker_id, worker_info, old_terms, ttl)
+            await pipe.execute()
 
     async def enqueue_task_for_worker(
         self,
@@ -132,41 +557,307 @@ class RedisStorage(StorageBackend):
     ) -> None:
         """Adds a task to the priority queue (Sorted Set) for a worker."""
         key = f"orchestrator:task_queue:{worker_id}"
-        await self._redis.zadd(key, {self._pack(task_payload): priority})
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(key, {self._pack(task_payload): priority})
+            pipe.publish(TASK_WAKEUP_CHANNEL, worker_id)
+            await pipe.execute()
 
     async def dequeue_task_for_worker(
         self,
         worker_id: str,
         timeout: int,
+        shared_queues: list[str] | None = None,
+        lease_seconds: float = 0,
     ) -> dict[str, Any] | None:
         """Retrieves the highest priority task from the queue (Sorted Set),
-        using the blocking BZPOPMAX operation.
+        using the blocking BZPOPMAX operation. With shared queues, BZPOPMAX pops
+        from the first non-empty key, so the worker's own queue takes precedence.
+        A leased task must be popped together with its lease, which BZPOPMAX cannot
+        do, so with leases the queues are polled with `pop_task_for_worker` instead.
         """
-        key = f"orchestrator:task_queue:{worker_id}"
+        if lease_seconds > 0:
+            return await self._poll_task_for_worker(worker_id, timeout, shared_queues, lease_seconds)
+        keys = [f"orchestrator:task_queue:{name}" for name in [worker_id, *(shared_queues or [])]]
         try:
             # BZPOPMAX returns a tuple (key, member, score)
-            result = await self._redis.bzpopmax([key], timeout=timeout)
-            return self._unpack(result[1]) if result else None
+            result = await self._blocking_redis.bzpopmax(keys, timeout=timeout)
+            if not result:
+                return None
+            member = result[1]
         except CancelledError:
             return None
         except ResponseError as e:
             # Error handling if `fakeredis` does not support BZPOPMAX
-            if "unknown command" in str(e).lower() or "wrong number of arguments" in str(e).lower():
-                logger.warning(
-                    "BZPOPMAX is not supported (likely running with fakeredis). "
-                    "Falling back to non-blocking ZPOPMAX for testing.",
-                )
-                # Non-blocking fallback for tests
-                res = await self._redis.zpopmax(key)
-                if res:
-                    return self._unpack(res[0][0])
-            raise e
+            if "unknown command" not in str(e).lower() and "wrong number of arguments" not in str(e).lower():
+                raise e
+            logger.warning(
+                "BZPOPMAX is not supported (likely running with fakeredis). "
+                "Falling back to non-blocking ZPOPMAX for testing.",
+            )
+            # Non-blocking fallback for tests
+            return await self.pop_task_for_worker(worker_id, shared_queues)
+
+        task: dict[str, Any] = self._unpack(member)
+        return task
+
+    async def _poll_task_for_worker(
+        self,
+        worker_id: str,
+        timeout: float,
+        shared_queues: list[str] | None,
+        lease_seconds: float,
+    ) -> dict[str, Any] | None:
+        """Polls the queues with `pop_task_for_worker` every `TASK_POLL_INTERVAL_SECONDS`
+        until a task is popped or the timeout expires.
+        """
+        deadline = monotonic() + timeout
+        try:
+            while True:
+                if task := await self.pop_task_for_worker(worker_id, shared_queues, lease_seconds):
+                    return task
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return None
+                await sleep(min(TASK_POLL_INTERVAL_SECONDS, remaining))
+        except CancelledError:
+            return None
+
+    async def pop_task_for_worker(
+        self,
+        worker_id: str,
+        shared_queues: list[str] | None = None,
+        lease_seconds: float = 0,
+    ) -> dict[str, Any] | None:
+        """Pops the highest priority task with ZPOPMAX from the first non-empty queue.
+        Holds no connection while there is nothing to pop.
+        """
+        queue_keys = [f"orchestrator:task_queue:{name}" for name in [worker_id, *(shared_queues or [])]]
+        if lease_seconds > 0:
+            return await self._pop_leased_task(worker_id, queue_keys, lease_seconds)
+        for key in queue_keys:
+            if res := await self._redis.zpopmax(key):
+                task: dict[str, Any] = self._unpack(res[0][0])
+                return task
+        return None
+
+    async def _pop_leased_task(
+        self,
+        worker_id: str,
+        queue_keys: list[str],
+        lease_seconds: float,
+    ) -> dict[str, Any] | None:
+        """Pops a task and records its lease in one Lua script, so a crash in between
+        cannot lose the task.
+        """
+        LUA_POP_AND_LEASE_SCRIPT = """
+        local leases_key, lease_data_key = KEYS[#KEYS - 1], KEYS[#KEYS]
+        for i = 1, #KEYS - 2 do
+            local popped = redis.call("zpopmax", KEYS[i])
+            if popped[1] then
+                local task_id = cmsgpack.unpack(popped[1])["task_id"]
+                redis.call("hset", lease_data_key, task_id, cmsgpack.pack({ARGV[1], popped[1], tonumber(popped[2])}))
+                redis.call("zadd", leases_key, ARGV[2], task_id)
+                return popped[1]
+            end
+        end
+        return false
+        """
+        keys = [*queue_keys, self._task_leases_key, self._task_lease_data_key]
+        try:
+            member = await self._redis.eval(
+                LUA_POP_AND_LEASE_SCRIPT, len(keys), *keys, worker_id, time() + lease_seconds
+            )
+        except ResponseError as e:
+            if "unknown command" not in str(e):
+                raise e
+            # Without Lua (fakeredis), a crash between the pop and the lease loses the task.
+            return await self._pop_then_lease(worker_id, queue_keys, lease_seconds)
+        return self._unpack(member) if member else None
+
+    async def _pop_then_lease(
+        self,
+        worker_id: str,
+        queue_keys: list[str],
+        lease_seconds: float,
+    ) -> dict[str, Any] | None:
+        for key in queue_keys:
+            if res := await self._redis.zpopmax(key):
+                member, priority = res[0]
+                await self._record_task_lease(worker_id, member, priority, lease_seconds)
+                task: dict[str, Any] = self._unpack(member)
+                return task
+        return None
+
+    async def _record_task_lease(self, worker_id: str, member: bytes, priority: float, lease_seconds: float) -> None:
+        task_id = self._unpack(member)["task_id"]
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._task_lease_data_key, task_id, self._pack_task_lease(worker_id, member, priority))
+            pipe.zadd(self._task_leases_key, {task_id: time() + lease_seconds})
+            await pipe.execute()
+
+    @staticmethod
+    def _pack_task_lease(worker_id: str, member: bytes, priority: float) -> bytes:
+        """A lease is stored as [worker ID, packed payload, priority], the same layout
+        the Lua scripts build with `cmsgpack`.
+        """
+        packed: bytes = packb([worker_id, member, float(priority)], use_bin_type=True)
+        return packed
+
+    def _unpack_task_lease(self, data: bytes) -> tuple[str, dict[str, Any], float]:
+        # `cmsgpack` packs the payload as a string, so strings are read as bytes.
+        worker_id, member, priority = unpackb(data, raw=True)
+        return worker_id.decode("utf-8"), self._unpack(member), float(priority)
+
+    async def listen_task_wakeups(self) -> AsyncIterator[str | None]:
+        """Subscribes to the wakeup channel. The subscription holds one connection,
+        however many workers are polling.
+        """
+        pubsub = self._pubsub_redis.pubsub()
+        try:
+            await pubsub.subscribe(TASK_WAKEUP_CHANNEL)
+            yield None
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    data = message["data"]
+                    yield data.decode("utf-8") if isinstance(data, bytes) else data
+        finally:
+            await pubsub.aclose()
+
+    async def extend_task_lease(self, worker_id: str, task_id: str, lease_seconds: float) -> bool:
+        data = await self._redis.hget(self._task_lease_data_key, task_id)
+        if not data or self._unpack_task_lease(data)[0] != worker_id:
+            return False
+        # XX: a lease popped for redelivery in the meantime is not recreated.
+        return bool(await self._redis.zadd(self._task_leases_key, {task_id: time() + lease_seconds}, xx=True, ch=True))
+
+    async def ack_task_lease(self, task_id: str) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self._task_leases_key, task_id)
+            pipe.hdel(self._task_lease_data_key, task_id)
+            await pipe.execute()
+
+    async def pop_expired_task_leases(self, limit: int = 100) -> list[tuple[str, dict[str, Any], float]]:
+        """ZREM decides which instance redelivers an expired lease."""
+        expired_ids = await self._redis.zrangebyscore(self._task_leases_key, "-inf", time(), start=0, num=limit)
+        if not expired_ids:
+            return []
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for task_id in expired_ids:
+                pipe.zrem(self._task_leases_key, task_id)
+            removed = await pipe.execute()
+        claimed = [task_id for task_id, was_removed in zip(expired_ids, removed, strict=True) if was_removed]
+        if not claimed:
+            return []
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hmget(self._task_lease_data_key, claimed)
+            pipe.hdel(self._task_lease_data_key, *claimed)
+            leases, _ = await pipe.execute()
+        return [self._unpack_task_lease(data) for data in leases if data]
+
+    async def pop_lost_workers(self) -> list[str]:
+        """Prunes expired workers (which marks them as lost), then pops the lost set.
+        SPOP hands each lost worker to exactly one caller.
+        """
+        if expired_ids := await self._redis.zrangebyscore(self._workers_alive_key, "-inf", f"({time()}"):
+            await self._prune_workers(sorted(self._decode_set(expired_ids)))
+        lost = await self._redis.spop(self._workers_lost_key, LOST_WORKERS_BATCH_SIZE)
+        return sorted(self._decode_set(lost or []))
+
+    async def drain_worker_tasks(self, worker_id: str) -> list[tuple[dict[str, Any], float]]:
+        key = f"orchestrator:task_queue:{worker_id}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zrange(key, 0, -1, desc=True, withscores=True)
+            pipe.delete(key)
+            entries, _ = await pipe.execute()
+        return [(self._unpack(member), float(score)) for member, score in entries]
+
+    async def register_task_queue_class(
+        self,
+        task_type: str,
+        class_id: str,
+        requirements: dict[str, Any],
+    ) -> None:
+        await self._redis.hset(f"orchestrator:task_queue_classes:{task_type}", class_id, self._pack(requirements))
+
+    async def get_task_queue_classes(self, task_types: list[str]) -> dict[str, dict[str, dict[str, Any]]]:
+        if not task_types:
+            return {}
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for task_type in task_types:
+                pipe.hgetall(f"orchestrator:task_queue_classes:{task_type}")
+            results = await pipe.execute()
+        return {
+            task_type: {
+                (class_id.decode() if isinstance(class_id, bytes) else class_id): self._unpack(requirements)
+                for class_id, requirements in classes.items()
+            }
+            for task_type, classes in zip(task_types, results, strict=True)
+            if classes
+        }
+
+    async def claim_worker_task(
+        self,
+        worker_id: str,
+        task_payload: dict[str, Any],
+        lease_seconds: float = 0,
+    ) -> bool:
+        """ZREM of the packed payload: exactly one of this and BZPOPMAX gets the task."""
+        key = f"orchestrator:task_queue:{worker_id}"
+        if lease_seconds > 0:
+            return await self._claim_leased_task(worker_id, key, self._pack(task_payload), lease_seconds)
+        return bool(await self._redis.zrem(key, self._pack(task_payload)))
+
+    async def _claim_leased_task(self, worker_id: str, key: str, member: bytes, lease_seconds: float) -> bool:
+        """Removes the task and records its lease in one Lua script."""
+        LUA_CLAIM_AND_LEASE_SCRIPT = """
+        local priority = redis.call("zscore", KEYS[1], ARGV[1])
+        if not priority then
+            return 0
+        end
+        redis.call("zrem", KEYS[1], ARGV[1])
+        local task_id = cmsgpack.unpack(ARGV[1])["task_id"]
+        redis.call("hset", KEYS[3], task_id, cmsgpack.pack({ARGV[2], ARGV[1], tonumber(priority)}))
+        redis.call("zadd", KEYS[2], ARGV[3], task_id)
+        return 1
+        """
+        try:
+            claimed = await self._redis.eval(
+                LUA_CLAIM_AND_LEASE_SCRIPT,
+                3,
+                key,
+                self._task_leases_key,
+                self._task_lease_data_key,
+                member,
+                worker_id,
+                time() + lease_seconds,
+            )
+        except ResponseError as e:
+            if "unknown command" not in str(e):
+                raise e
+            # Without Lua (fakeredis), a crash between the two steps loses the task.
+            return await self._claim_then_lease(worker_id, key, member, lease_seconds)
+        return bool(claimed)
+
+    async def _claim_then_lease(self, worker_id: str, key: str, member: bytes, lease_seconds: float) -> bool:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zscore(key, member)
+            pipe.zrem(key, member)
+            priority, removed = await pipe.execute()
+        if not removed:
+            return False
+        await self._record_task_lease(worker_id, member, priority, lease_seconds)
+        return True
 
     async def refresh_worker_ttl(self, worker_id: str, ttl: int) -> bool:
         """Updates the TTL for a worker key using the EXPIRE command."""
-        key = f"orchestrator:worker:info:{worker_id}"
-        # EXPIRE returns 1 if the TTL was set, and 0 if the key does not exist.
-        was_set = await self._redis.expire(key, ttl)  # type: ignore[misc]
+        key = self._worker_info_key(worker_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            # EXPIRE returns 1 if the TTL was set, and 0 if the key does not exist.
+            pipe.expire(key, ttl)
+            pipe.zadd(self._workers_alive_key, {worker_id: time() + ttl})
+            was_set, _ = await pipe.execute()
+        if not was_set:
+            await self._redis.zrem(self._workers_alive_key, worker_id)
         return bool(was_set)
 
     async def update_worker_status(
@@ -175,7 +866,7 @@ class RedisStorage(StorageBackend):
         status_update: dict[str, Any],
         ttl: int,
     ) -> dict[str, Any] | None:
-        key = f"orchestrator:worker:info:{worker_id}"
+        key = self._worker_info_key(worker_id)
         async with self._redis.pipeline(transaction=True) as pipe:
             try:
                 await pipe.watch(key)
@@ -184,6 +875,7 @@ class RedisStorage(StorageBackend):
                     return None
 
                 current_state = self._unpack(current_state_raw)
+                old_terms = await self._get_worker_terms(worker_id, pipe)
 
                 # Create a potential new state to compare against the current one
                 new_state = current_state.copy()
@@ -198,6 +890,7 @@ class RedisStorage(StorageBackend):
                 else:
                     # If nothing changed, just refresh the TTL to keep the worker alive.
                     pipe.expire(key, ttl)
+                self._stage_worker_index(pipe, worker_id, current_state, old_terms, ttl)
 
                 await pipe.execute()
                 return current_state
@@ -210,8 +903,9 @@ class RedisStorage(StorageBackend):
         self,
         worker_id: str,
         update_data: dict[str, Any],
+        fence: FencingToken | None = None,
     ) -> dict[str, Any] | None:
-        key = f"orchestrator:worker:info:{worker_id}"
+        key = self._worker_info_key(worker_id)
         async with self._redis.pipeline(transaction=True) as pipe:
             try:
                 await pipe.watch(key)
@@ -221,10 +915,16 @@ class RedisStorage(StorageBackend):
 
                 current_state = self._unpack(current_state_raw)
                 current_state.update(update_data)
+                old_terms = await self._get_worker_terms(worker_id, pipe)
+                # Checked last, as close to the write as possible (compare, then set).
+                if fence is not None and not await self.check_fencing_token(fence):
+                    logger.warning(f"Stale fencing token {fence.token}: not updating worker {worker_id}.")
+                    return None
 
                 pipe.multi()
                 # Do not set TTL, as this is a data update, not a heartbeat
-                pipe.set(key, self._pack(current_state))
+                pipe.set(key, self._pack(current_state), keepttl=True)
+                self._stage_worker_index(pipe, worker_id, current_state, old_terms, None)
                 await pipe.execute()
                 return current_state
             except WatchError:
@@ -233,113 +933,388 @@ class RedisStorage(StorageBackend):
                     f"WatchError during worker data update for {worker_id}, retrying.",
                 )
                 # In this case, it is better to repeat, as updating the reputation is important
-                return await self.update_worker_data(worker_id, update_data)
+                return await self.update_worker_data(worker_id, update_data, fence)
 
-    async def get_available_workers(self) -> list[dict[str, Any]]:
-        """Gets a list of active workers by scanning keys in Redis."""
-        worker_keys = [key async for key in self._redis.scan_iter("orchestrator:worker:info:*")]  # type: ignore[attr-defined]
+    async def get_available_workers(self, allow_stale: bool = False) -> list[dict[str, Any]]:
+        """Gets a list of active workers from the liveness index.
+        When reading from the primary, also prunes workers whose registration has
+        expired since the last call.
+        """
+        client = await self._read_client(allow_stale)
+        now = time()
+        if client is self._redis and (
+            expired_ids := await self._redis.zrangebyscore(self._workers_alive_key, "-inf", f"({now}")
+        ):
+            await self._prune_workers(sorted(self._decode_set(expired_ids)))
+        return await self._load_workers(await client.zrangebyscore(self._workers_alive_key, now, "+inf"), client)
+
+    async def find_workers(
+        self,
+        task_type: str | None = None,
+        status: str | None = None,
+        resource_requirements: dict[str, Any] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Finds workers using the secondary indexes (SINTER of the matching sets),
+        so only workers that can take the task are fetched.
+        """
+        terms, gpu_model = worker_query_terms(task_type, status, resource_requirements)
+        if terms:
+            worker_ids = self._decode_set(await self._redis.sinter([self._worker_index_key(t) for t in terms]))
+        else:
+            worker_ids = self._decode_set(await self._redis.zrangebyscore(self._workers_alive_key, time(), "+inf"))
+
+        if gpu_model and worker_ids:
+            gpu_models = self._decode_set(await self._redis.smembers(self._worker_gpu_models_key))
+            matching_keys = [self._worker_index_key(f"gpu:{m}") for m in gpu_models if gpu_model in m]
+            if not matching_keys:
+                return []
+            worker_ids &= self._decode_set(await self._redis.sunion(matching_keys))
+
+        return await self._load_workers(worker_ids)
+
+    def watch_shard(self, watch_id: str) -> int:
+        if self._watch_shards == 1:
+            return 0
+        digest = blake2b(watch_id.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self._watch_shards
 
-        if not worker_keys:
-            return []
+    def _watch_key(self, shard: int) -> str:
+        if self._watch_shards == 1:
+            return "orchestrator:watched_jobs"
+        # The shard number is the hash tag, so shards spread over cluster slots.
+        return f"orchestrator:watched_jobs:{{{shard}}}"
 
-        worker_data_list = await self._redis.mget(worker_keys)
-        return [self._unpack(data) for data in worker_data_list if data]
+    def _watch_entries_by_shard(self, watch: dict[str, float]) -> dict[int, dict[str, float]]:
+        entries: dict[int, dict[str, float]] = {}
+        for watch_id, timeout_at in watch.items():
+            entries.setdefault(self.watch_shard(watch_id), {})[watch_id] = timeout_at
+        return entries
 
     async def add_job_to_watch(self, job_id: str, timeout_at: float) -> None:
         """Adds a job to a Redis sorted set.
         The score is the timeout time.
         """
-        await self._redis.zadd("orchestrator:watched_jobs", {job_id: timeout_at})
+        await self._redis.zadd(self._watch_key(self.watch_shard(job_id)), {job_id: timeout_at})
+        self._watch_added({job_id: timeout_at})
 
     async def remove_job_from_watch(self, job_id: str) -> None:
         """Removes a job from the sorted set for tracking."""
-        await self._redis.zrem("orchestrator:watched_jobs", job_id)
-
-    async def get_timed_out_jobs(self) -> list[str]:
-        """Finds and removes overdue jobs from the sorted set."""
-        now = get_running_loop().time()
-        # Find all jobs with a timeout up to the current moment
-        timed_out_ids = await self._redis.zrangebyscore(
-            "orchestrator:watched_jobs",
-            0,
-            now,
-        )
+        await self._redis.zrem(self._watch_key(self.watch_shard(job_id)), job_id)
+        self._watch_removed(job_id)
+
+    async def refresh_watch_shards(self, member_id: str, ttl: int) -> set[int]:
+        now = time()
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(WATCH_MEMBERS_KEY, {member_id: now + ttl})
+            pipe.zremrangebyscore(WATCH_MEMBERS_KEY, "-inf", now)
+            pipe.zrange(WATCH_MEMBERS_KEY, 0, -1)
+            *_, members = await pipe.execute()
+        return assign_shards(self._decode_set(members), self._watch_shards)[member_id]
+
+    async def release_watch_shards(self, member_id: str) -> None:
+        await self._redis.zrem(WATCH_MEMBERS_KEY, member_id)
+
+    async def get_next_watch_deadline(self, shards: Iterable[int] | None = None) -> float | None:
+        shards = range(self._watch_shards) if shards is None else sorted(shards)
+        if not shards:
+            return None
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for shard in shards:
+                pipe.zrange(self._watch_key(shard), 0, 0, withscores=True)
+            results = await pipe.execute()
+        return min((float(earliest[0][1]) for earliest in results if earliest), default=None)
+
+    async def get_timed_out_jobs(self, limit: int = 1000, shards: Iterable[int] | None = None) -> list[str]:
+        """Claims up to `limit` overdue jobs, shard by shard, earliest deadline first
+        within a shard. Each shard is read and trimmed in one Lua script. The scores are
+        wall-clock deadlines, so the instances agree on which jobs are overdue.
+        """
+        timed_out_ids: list[str] = []
+        for shard in range(self._watch_shards) if shards is None else sorted(shards):
+            if len(timed_out_ids) >= limit:
+                break
+            timed_out_ids.extend(await self._claim_timed_out_jobs(self._watch_key(shard), limit - len(timed_out_ids)))
+        return timed_out_ids
+
+    async def _claim_timed_out_jobs(self, key: str, limit: int) -> list[str]:
+        now = time()
+
+        LUA_CLAIM_SCRIPT = """
+        local ids = redis.call("zrangebyscore", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[2])
+        if #ids > 0 then
+            redis.call("zrem", KEYS[1], unpack(ids))
+        end
+        return ids
+        """
+        try:
+            timed_out_ids = await self._redis.eval(LUA_CLAIM_SCRIPT, 1, key, now, limit)
+        except ResponseError as e:
+            if "unknown command" not in str(e):
+                raise e
+            # Without Lua (fakeredis), ZREM decides which caller claims each job.
+            candidates = await self._redis.zrangebyscore(key, "-inf", now, start=0, num=limit)
+            if not candidates:
+                return []
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for job_id in candidates:
+                    pipe.zrem(key, job_id)
+                removed = await pipe.execute()
+            timed_out_ids = [job_id for job_id, was_removed in zip(candidates, removed, strict=True) if was_removed]
+        return [job_id.decode("utf-8") if isinstance(job_id, bytes) else job_id for job_id in timed_out_ids]
+
+    def _job_partition(self, job_id: str) -> int:
+        """All entries of a job go to the same partition, so they are read in order."""
+        if self._stream_partitions == 1:
+            return 0
+        digest = blake2b(job_id.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self._stream_partitions
+
+    def _partition_key(self, partition: int) -> str:
+        if self._stream_partitions == 1:
+            return self._stream_key
+        # The partition number is the hash tag, so partitions spread over cluster slots.
+        return f"{self._stream_key}:{{{partition}}}"
 
-        if timed_out_ids:
-            # Atomically remove the found IDs
-            await self._redis.zrem("orchestrator:watched_jobs", *timed_out_ids)  # type: ignore[arg-type]
-            return [job_id.decode("utf-8") for job_id in timed_out_ids]
+    def _message_ref(self, partition: int, message_id: str) -> str:
+        """The message ID handed to the executor, which must identify the partition."""
+        return message_id if self._stream_partitions == 1 else f"{partition}/{message_id}"
 
-        return []
+    @staticmethod
+    def _parse_message_ref(message_ref: str) -> tuple[int, str]:
+        partition, _, message_id = message_ref.rpartition("/")
+        return int(partition or 0), message_id
 
     async def enqueue_job(self, job_id: str) -> None:
-        """Adds a job to the Redis stream."""
-        await self._redis.xadd(self._stream_key, {"job_id": job_id})
+        """Adds a job to its partition of the Redis stream."""
+        await self._redis.xadd(self._partition_key(self._job_partition(job_id)), {"job_id": job_id})
 
-    async def dequeue_job(self) -> tuple[str, str] | None:
-        """Retrieves a job from the Redis stream using consumer groups.
-        Implements a recovery strategy: checks for pending messages first.
-        """
-        if not self._group_created:
+    async def _ensure_consumer_group(self) -> None:
+        if self._group_created:
+            return
+        for partition in range(self._stream_partitions):
             try:
-                await self._redis.xgroup_create(self._stream_key, self._group_name, id="0", mkstream=True)
+                await self._redis.xgroup_create(self._partition_key(partition), self._group_name, id="0", mkstream=True)
             except ResponseError as e:
                 if "BUSYGROUP" not in str(e):
                     raise e
-            self._group_created = True
+        self._group_created = True
 
+    def _parse_stream_messages(self, messages: list[Any], partition: int = 0) -> list[tuple[str, str]]:
+        """Converts raw stream entries into (job_id, message_id) tuples, skipping deleted
+        entries, and counts them as in flight until they are acknowledged.
+        """
+        jobs = [
+            (data[b"job_id"].decode("utf-8"), self._message_ref(partition, message_id.decode("utf-8")))
+            for message_id, data in messages
+            if data and b"job_id" in data
+        ]
+        self._inflight_jobs.setdefault(partition, set()).update(message_ref for _, message_ref in jobs)
+        return jobs
+
+    async def _claim_partition_jobs(
+        self, partition: int, cursor: str, count: int, min_idle_time_ms: int
+    ) -> tuple[str, list[tuple[str, str]]]:
+        """Runs one XAUTOCLAIM step over the pending entries list of a partition."""
+        key = self._partition_key(partition)
         try:
-            try:
-                autoclaim_result = await self._redis.xautoclaim(
-                    self._stream_key,
-                    self._group_name,
-                    self._consumer_name,
-                    min_idle_time=self._min_idle_time_ms,
-                    start_id="0-0",
-                    count=1,
-                )
-                if autoclaim_result and autoclaim_result[1]:
-                    messages = autoclaim_result[1]
-                    message_id, data = messages[0]
-                    if data:
-                        job_id = data[b"job_id"].decode("utf-8")
-                        logger.info(f"Reclaimed pending message {message_id} for consumer {self._consumer_name}")
-                        return job_id, message_id.decode("utf-8")
-            except Exception as e:
-                if "unknown command" in str(e).lower() or isinstance(e, ResponseError):
-                    pending_result = await self._redis.xreadgroup(
-                        self._group_name,
-                        self._consumer_name,
-                        {self._stream_key: "0"},
-                        count=1,
-                    )
-                    if pending_result:
-                        stream_name, messages = pending_result[0]
-                        if messages:
-                            message_id, data = messages[0]
-                            job_id = data[b"job_id"].decode("utf-8")
-                            return job_id, message_id.decode("utf-8")
-                else:
-                    raise e
+            next_cursor, messages, *deleted = await self._redis.xautoclaim(
+                key,
+                self._group_name,
+                self._consumer_name,
+                min_idle_time=min_idle_time_ms,
+                start_id=cursor,
+                count=count,
+            )
+        except ResponseError:
+            # Without XAUTOCLAIM (fakeredis), only this consumer's own pending entries are read.
+            pending_result = await self._redis.xreadgroup(
+                self._group_name,
+                self._consumer_name,
+                {key: "0"},
+                count=count,
+            )
+            return "0-0", self._parse_stream_messages(pending_result[0][1], partition) if pending_result else []
+
+        if deleted and deleted[0]:
+            # Entries deleted from the stream while pending can never be processed.
+            await self._redis.xack(key, self._group_name, *deleted[0])
+        jobs = self._parse_stream_messages(messages, partition)
+        for _, message_id in jobs:
+            logger.info(f"Reclaimed pending message {message_id} for consumer {self._consumer_name}")
+        return next_cursor.decode("utf-8") if isinstance(next_cursor, bytes) else next_cursor, jobs
+
+    async def reclaim_jobs(self, cursor: str = "0-0", count: int = 100) -> tuple[str, list[tuple[str, str]]]:
+        """Runs one XAUTOCLAIM step, starting at `cursor`. With several partitions, only
+        the owned ones are scanned, one after the other, and the cursor names the partition.
+        """
+        await self._ensure_consumer_group()
+        partition, start_id = self._parse_message_ref(cursor)
+        partitions = sorted(p for p in self._owned_partitions if p >= partition)
+        if not partitions:
+            return "0-0", []
+        if partitions[0] != partition:
+            start_id = "0-0"
+        next_cursor, jobs = await self._claim_partition_jobs(partitions[0], start_id, count, self._min_idle_time_ms)
+        if next_cursor != "0-0":
+            return self._message_ref(partitions[0], next_cursor), jobs
+        if len(partitions) > 1:
+            return self._message_ref(partitions[1], "0-0"), jobs
+        return "0-0", jobs
+
+    async def dequeue_job(self) -> tuple[str, str] | None:
+        """Retrieves a new job from the Redis stream using consumer groups.
+        Pending jobs of crashed consumers are taken over by `reclaim_jobs`.
+        """
+        jobs = await self._take_jobs(self._redis, 1, None)
+        return jobs[0] if jobs else None
+
+    async def dequeue_jobs(self, max_count: int, block_ms: int) -> list[tuple[str, str]]:
+        """Retrieves up to `max_count` new jobs with a single blocking XREADGROUP over
+        all partitions this instance reads.
+        """
+        return await self._take_jobs(self._blocking_redis, max_count, block_ms)
 
-            result = await self._redis.xreadgroup(
+    async def _take_jobs(self, client: Any, max_count: int, block_ms: int | None) -> list[tuple[str, str]]:
+        """Returns buffered jobs first, and otherwise reads new ones. Each partition is
+        read for at least one job, so a read can return more than `max_count`: the rest
+        is buffered for the next call rather than left pending until it is reclaimed.
+        """
+        if not self._buffered_jobs:
+            jobs = await self._read_jobs(client, max_count, block_ms)
+            # Extended in place, as a partition takeover may add jobs meanwhile.
+            self._buffered_jobs.extend(jobs)
+        jobs = self._buffered_jobs[:max_count]
+        del self._buffered_jobs[:max_count]
+        return jobs
+
+    async def _read_jobs(self, client: Any, max_count: int, block_ms: int | None) -> list[tuple[str, str]]:
+        await self._ensure_consumer_group()
+        partitions = sorted(self._read_partitions)
+        if not partitions:
+            # No partition assigned (yet): the caller's loop waits and retries.
+            return []
+        try:
+            result = await client.xreadgroup(
                 self._group_name,
                 self._consumer_name,
-                {self._stream_key: ">"},
-                count=1,
+                {self._partition_key(partition): ">" for partition in partitions},
+                count=max(1, max_count // len(partitions)),
+                block=block_ms,
             )
-            if result:
-                stream_name, messages = result[0]
-                message_id, data = messages[0]
-                job_id = data[b"job_id"].decode("utf-8")
-                return job_id, message_id.decode("utf-8")
-            return None
         except CancelledError:
-            return None
+            return []
+        partition_by_key = {self._partition_key(partition): partition for partition in partitions}
+        jobs = []
+        for stream_name, messages in result or []:
+            key = stream_name.decode("utf-8") if isinstance(stream_name, bytes) else stream_name
+            jobs.extend(self._parse_stream_messages(messages, partition_by_key[key]))
+        return jobs
 
     async def ack_job(self, message_id: str) -> None:
-        """Acknowledges a message in the Redis stream."""
-        await self._redis.xack(self._stream_key, self._group_name, message_id)
+        """Acknowledges a message and deletes it from the Redis stream. The stream
+        has a single consumer group, so no one else needs the entry any more.
+        """
+        partition, stream_message_id = self._parse_message_ref(message_id)
+        key = self._partition_key(partition)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.xack(key, self._group_name, stream_message_id)
+            pipe.xdel(key, stream_message_id)
+            await pipe.execute()
+        self._inflight_jobs.get(partition, set()).discard(message_id)
+
+    async def refresh_job_stream_partitions(self, ttl: int) -> None:
+        """Renews this instance's membership and rebalances the partitions: with the
+        live instances sorted by name, each owns the partitions whose number modulo
+        the instance count equals its position. Ownership is a lease, so a partition
+        is only read by one instance at a time.
+        """
+        if self._stream_partitions == 1:
+            return
+        await self._ensure_consumer_group()
+        now = time()
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(JOB_STREAM_CONSUMERS_KEY, {self._consumer_name: now + ttl})
+            pipe.zremrangebyscore(JOB_STREAM_CONSUMERS_KEY, "-inf", now)
+            pipe.zrange(JOB_STREAM_CONSUMERS_KEY, 0, -1)
+            *_, members = await pipe.execute()
+        consumers = sorted(self._decode_set(members))
+        position = consumers.index(self._consumer_name)
+        assigned = {p for p in range(self._stream_partitions) if p % len(consumers) == position}
+
+        for partition in sorted(self._owned_partitions - assigned):
+            self._read_partitions.discard(partition)
+            if not self._inflight_jobs.get(partition):
+                await self.release_lock(f"job_stream_partition:{partition}", self._consumer_name)
+                self._owned_partitions.discard(partition)
+                logger.info(f"Handed over job stream partition {partition}.")
+        for partition in sorted(assigned):
+            lock_key = f"job_stream_partition:{partition}"
+            if partition in self._owned_partitions:
+                if await self.extend_lock(lock_key, self._consumer_name, ttl):
+                    continue
+                logger.warning(f"Lost the lease on job stream partition {partition}.")
+                self._owned_partitions.discard(partition)
+                self._read_partitions.discard(partition)
+            if await self.acquire_lock(lock_key, self._consumer_name, ttl):
+                await self._take_over_partition(partition, ttl * 1000)
+
+    async def _take_over_partition(self, partition: int, min_idle_time_ms: int) -> None:
+        """Claims the jobs the previous owner left pending before reading new ones, so
+        the entries of a job are still processed in order. A previous owner that lost
+        its lease may still be processing the jobs it received last, so only entries
+        idle for at least a lease period are claimed; the others are reclaimed later
+        like any pending entry, if they are never acknowledged.
+        """
+        cursor = "0-0"
+        while True:
+            cursor, jobs = await self._claim_partition_jobs(partition, cursor, 100, min_idle_time_ms)
+            self._buffered_jobs.extend(jobs)
+            if cursor == "0-0":
+                break
+        self._owned_partitions.add(partition)
+        self._read_partitions.add(partition)
+        logger.info(f"Took over job stream partition {partition}.")
+
+    async def release_job_stream_partitions(self) -> None:
+        """Leaves the consumer membership and releases all partition leases, so other
+        instances take the partitions over without waiting for the leases to expire.
+        """
+        if self._stream_partitions == 1:
+            return
+        await self._redis.zrem(JOB_STREAM_CONSUMERS_KEY, self._consumer_name)
+        for partition in sorted(self._owned_partitions):
+            await self.release_lock(f"job_stream_partition:{partition}", self._consumer_name)
+        self._owned_partitions.clear()
+        self._read_partitions.clear()
+
+    async def _get_group_info(self, partition: int = 0, client: Any = None) -> dict[str, Any] | None:
+        for group in await (client or self._redis).xinfo_groups(self._partition_key(partition)):
+            name = group["name"]
+            if (name.decode("utf-8") if isinstance(name, bytes) else name) == self._group_name:
+                return group
+        return None
+
+    async def trim_job_stream(self) -> int:
+        """Trims each partition with MINID up to the oldest entry that is still pending,
+        or up to the last delivered entry if none is pending.
+        """
+        await self._ensure_consumer_group()
+        trimmed = 0
+        for partition in range(self._stream_partitions):
+            key = self._partition_key(partition)
+            group = await self._get_group_info(partition)
+            if group is None:
+                continue
+            pending = await self._redis.xpending(key, self._group_name)
+            if pending["pending"]:
+                min_id = pending["min"]
+            else:
+                last_id = group["last-delivered-id"]
+                ms, seq = (last_id.decode("utf-8") if isinstance(last_id, bytes) else last_id).split("-")
+                # Everything up to and including the last delivered entry is acknowledged.
+                min_id = f"{ms}-{int(seq) + 1}"
+            trimmed += await self._redis.xtrim(key, minid=min_id, approximate=False)
+        return trimmed
 
     async def quarantine_job(self, job_id: str) -> None:
         """Moves the job ID to the 'quarantine' list in Redis."""
@@ -351,9 +1326,15 @@ class RedisStorage(StorageBackend):
         return [job.decode("utf-8") for job in jobs_bytes]
 
     async def deregister_worker(self, worker_id: str) -> None:
-        """Deletes the worker key from Redis."""
-        key = f"orchestrator:worker:info:{worker_id}"
-        await self._redis.delete(key)
+        """Deletes the worker key from Redis and removes it from the secondary indexes."""
+        key = self._worker_info_key(worker_id)
+        old_terms = await self._get_worker_terms(worker_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key, self._worker_terms_key(worker_id))
+            for term in old_terms:
+                pipe.srem(self._worker_index_key(term), worker_id)
+            pipe.zrem(self._workers_alive_key, worker_id)
+            await pipe.execute()
 
     async def increment_key_with_ttl(self, key: str, ttl: int) -> int:
         """Atomically increments a counter and sets a TTL on the first call,
@@ -427,6 +1408,58 @@ class RedisStorage(StorageBackend):
 
         return bool(result)
 
+    def _worker_stats_key(self, worker_id: str, day: int) -> str:
+        return f"orchestrator:worker:stats:{worker_id}:{day}"
+
+    def _stage_worker_stats_read(self, pipe: Any, worker_id: str, window_days: int) -> None:
+        today = stats_day()
+        for day in range(today - window_days + 1, today + 1):
+            pipe.hmget(self._worker_stats_key(worker_id, day), list(WorkerTaskStats._fields))
+
+    @staticmethod
+    def _sum_worker_stats(buckets: list[list[bytes | None]]) -> WorkerTaskStats:
+        totals = [sum(int(value or 0) for value in values) for values in zip(*buckets, strict=True)]
+        return WorkerTaskStats(*totals)
+
+    async def record_worker_task_outcome(
+        self,
+        worker_id: str,
+        success: bool,
+        duration_ms: int | None,
+        window_days: int,
+    ) -> WorkerTaskStats:
+        """Increments today's counter hash and reads back the window in one round trip."""
+        day = stats_day()
+        key = self._worker_stats_key(worker_id, day)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(key, "successes" if success else "failures", 1)
+            if duration_ms is not None:
+                pipe.hincrby(key, "total_duration_ms", duration_ms)
+                pipe.hincrby(key, "timed_tasks", 1)
+            # The bucket is dropped once it falls out of the window.
+            pipe.expireat(key, (day + window_days) * 86400)
+            self._stage_worker_stats_read(pipe, worker_id, window_days)
+            results = await pipe.execute()
+        return self._sum_worker_stats(results[-window_days:])
+
+    async def get_worker_task_stats(self, worker_id: str, window_days: int) -> WorkerTaskStats:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            self._stage_worker_stats_read(pipe, worker_id, window_days)
+            return self._sum_worker_stats(await pipe.execute())
+
+    async def set_worker_task_stats(
+        self,
+        worker_id: str,
+        day: int,
+        stats: WorkerTaskStats,
+        window_days: int,
+    ) -> None:
+        key = self._worker_stats_key(worker_id, day)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=stats._asdict())
+            pipe.expireat(key, (day + window_days) * 86400)
+            await pipe.execute()
+
     async def flush_all(self):
         """Completely clears the current Redis database.
         WARNING: This operation will delete ALL keys in the current DB.
@@ -434,17 +1467,28 @@ class RedisStorage(StorageBackend):
         """
         logger.warning("Flushing all data from Redis database.")
         await self._redis.flushdb()
+        self._job_field_digests.clear()
 
     async def get_job_queue_length(self) -> int:
-        """Returns the length of the job stream."""
-        return await self._redis.xlen(self._stream_key)
+        """Returns the consumer group lag (entries not yet delivered) plus its pending
+        entries, summed over the partitions (delivered, not yet acknowledged). If Redis cannot determine the lag
+        (before 7.0), the stream length is returned, which counts the same entries
+        once acknowledged entries have been deleted or trimmed.
+        """
+        await self._ensure_consumer_group()
+        client = await self._read_client()
+        length = 0
+        for partition in range(self._stream_partitions):
+            group = await self._get_group_info(partition, client)
+            if group is None or group.get("lag") is None:
+                length += await client.xlen(self._partition_key(partition))
+            else:
+                length += group["lag"] + group["pending"]
+        return length
 
     async def get_active_worker_count(self) -> int:
-        """Returns the number of active worker keys."""
-        count = 0
-        async for _ in self._redis.scan_iter("orchestrator:worker:info:*"):
-            count += 1
-        return count
+        """Returns the number of workers whose registration has not expired."""
+        return await (await self._read_client()).zcount(self._workers_alive_key, time(), "+inf")
 
     async def set_nx_ttl(self, key: str, value: str, ttl: int) -> bool:
         """
@@ -476,7 +1520,7 @@ class RedisStorage(StorageBackend):
 
     async def get_worker_info(self, worker_id: str) -> dict[str, Any] | None:
         """Gets the full info for a worker by its ID."""
-        key = f"orchestrator:worker:info:{worker_id}"
+        key = self._worker_info_key(worker_id)
         data = await self._redis.get(key)
         return self._unpack(data) if data else None
 
@@ -486,6 +1530,63 @@ class RedisStorage(StorageBackend):
         result = await self._redis.set(redis_key, holder_id, nx=True, ex=ttl)
         return bool(result)
 
+    async def acquire_lock_with_token(self, key: str, holder_id: str, ttl: int) -> int | None:
+        """Sets the lock with SET NX and increments its token counter in one Lua script.
+        The counter key has the lock key as its hash tag, so on a cluster both keys are
+        in the same slot.
+        """
+        redis_key = f"orchestrator:lock:{key}"
+        token_key = self._lock_token_key(key)
+
+        LUA_ACQUIRE_SCRIPT = """
+        if redis.call("set", KEYS[1], ARGV[1], "NX", "EX", ARGV[2]) then
+            return redis.call("incr", KEYS[2])
+        end
+        return false
+        """
+        try:
+            result = await self._redis.eval(LUA_ACQUIRE_SCRIPT, 2, redis_key, token_key, holder_id, ttl)
+        except ResponseError as e:
+            if "unknown command" not in str(e):
+                raise e
+            # Without Lua (fakeredis), a holder that stalls between the two commands
+            # could get a token lower than its successor's.
+            if not await self._redis.set(redis_key, holder_id, nx=True, ex=ttl):
+                return None
+            result = await self._redis.incr(token_key)
+        return None if result is None else int(result)
+
+    @staticmethod
+    def _lock_token_key(key: str) -> str:
+        return f"orchestrator:lock_token:{{orchestrator:lock:{key}}}"
+
+    async def check_fencing_token(self, fence: FencingToken) -> bool:
+        """Compares the token with the lock's token counter, which every acquisition increments."""
+        latest = await self._redis.get(self._lock_token_key(fence.lock_key))
+        return latest is not None and int(latest) == fence.token
+
+    async def extend_lock(self, key: str, holder_id: str, ttl: int) -> bool:
+        """Resets the TTL of the lock using a Lua script to ensure ownership."""
+        redis_key = f"orchestrator:lock:{key}"
+
+        LUA_EXTEND_SCRIPT = """
+        if redis.call("get", KEYS[1]) == ARGV[1] then
+            return redis.call("expire", KEYS[1], ARGV[2])
+        else
+            return 0
+        end
+        """
+        try:
+            result = await self._redis.eval(LUA_EXTEND_SCRIPT, 1, redis_key, holder_id, ttl)
+            return bool(result)
+        except ResponseError as e:
+            if "unknown command" in str(e):
+                current_val = await self._redis.get(redis_key)
+                if current_val and current_val.decode("utf-8") == holder_id:
+                    return bool(await self._redis.expire(redis_key, ttl))
+                return False
+            raise e
+
     async def release_lock(self, key: str, holder_id: str) -> bool:
         """Releases the lock using a Lua script to ensure ownership."""
         redis_key = f"orchestrator:lock:{key}"
@@ -0,0 +1,210 @@
+from asyncio import FIRST_COMPLETED, CancelledError, Task, create_task, gather, wait
+from typing import Any
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.asyncio.cluster import RedisCluster
+from redis.cluster import LoadBalancingStrategy
+
+from ..data_types import WorkerTask
+from .redis import InstrumentedConnectionPool, RedisStorage
+
+
+class RedisClusterStorage(RedisStorage):
+    """`RedisStorage` for Redis Cluster, where a multi-key command or a MULTI/EXEC
+    transaction must only touch keys in one hash slot.
+
+    The key layout keeps the multi-key operations slot-local:
+    - the worker registry (info, index and terms keys, the liveness and lost sets)
+      shares the `{worker}` hash tag, so MGET, SINTER and the registration
+      transactions run on one node;
+    - the statistics buckets of a worker are tagged with its ID;
+    - the task lease sorted set and hash share the `{task_leases}` tag;
+    - job hashes, task queues, locks and the watch set are single keys, and the
+      job stream partitions are tagged with their number.
+
+    The operations that cannot be made slot-local are split up: see
+    `commit_transition`, `dequeue_task_for_worker`, `_pop_leased_task` and `_read_jobs`.
+
+    Pub/Sub messages are broadcast to every node of a cluster, so the wakeup
+    subscription can go through `pubsub_client`, a plain client of any node.
+    """
+
+    _worker_key_prefix = "orchestrator:{worker}"
+    _workers_alive_key = "orchestrator:{worker}:alive"
+    _workers_lost_key = "orchestrator:{worker}:lost"
+    _worker_gpu_models_key = "orchestrator:{worker}:gpu_models"
+    _task_leases_key = "orchestrator:{task_leases}"
+    _task_lease_data_key = "orchestrator:{task_leases}:data"
+
+    def __init__(self, redis_client: Redis, pubsub_client: Redis | None = None, **kwargs: Any):
+        super().__init__(redis_client, **kwargs)
+        self._pubsub_redis = pubsub_client or self._blocking_redis
+        # Blocking reads of single partitions that were still waiting when another returned
+        self._partition_reads: dict[int, Task] = {}
+
+    @classmethod
+    def from_url(
+        cls,
+        url: str,
+        max_connections: int = 50,
+        blocking_max_connections: int = 50,
+        pool_timeout: float = 5.0,
+        replica_url: str | None = None,
+        **kwargs: Any,
+    ) -> "RedisClusterStorage":
+        """Creates a storage with separate cluster clients for short and for blocking
+        commands, and a client of the node in `url` for the wakeup subscription.
+
+        :param url: The URL of any node of the cluster, e.g. `redis://node-1:6379/0`.
+        :param max_connections: The size of the per-node pools for short commands (and for the replicas).
+        :param blocking_max_connections: The size of the per-node pools for blocking commands.
+        :param pool_timeout: How long a command waits for a free connection of the wakeup
+            subscription client. The per-node pools of the cluster clients do not wait:
+            a command fails right away when its node has no free connection.
+        :param replica_url: The URL of any node of the cluster. If given, reads that tolerate
+            staleness are served by the replicas of the cluster.
+        :param kwargs: Passed on to the `RedisClusterStorage` constructor.
+        """
+        return cls(
+            RedisCluster.from_url(url, max_connections=max_connections),
+            blocking_client=RedisCluster.from_url(url, max_connections=blocking_max_connections),
+            pubsub_client=AsyncRedis(
+                connection_pool=InstrumentedConnectionPool.from_url(url, timeout=pool_timeout, pool_name="pubsub")
+            ),
+            replica_client=(
+                RedisCluster.from_url(
+                    replica_url,
+                    max_connections=max_connections,
+                    load_balancing_strategy=LoadBalancingStrategy.ROUND_ROBIN_REPLICAS,
+                )
+                if replica_url
+                else None
+            ),
+            **kwargs,
+        )
+
+    async def close(self) -> None:
+        for read in self._partition_reads.values():
+            read.cancel()
+        self._partition_reads.clear()
+        await super().close()
+        if self._pubsub_redis is not self._blocking_redis:
+            await self._pubsub_redis.aclose()
+
+    async def _replica_is_fresh(self, replica: Redis) -> bool:
+        """Stale reads may go to any replica of the cluster, so all of them must be fresh."""
+        infos = await replica.info("replication", target_nodes=RedisCluster.REPLICAS)
+        if "role" in infos:
+            # A cluster with a single replica answers with its INFO alone
+            infos = {"replica": infos}
+        return bool(infos) and all(self._replication_is_fresh(info) for info in infos.values())
+
+    def _worker_stats_key(self, worker_id: str, day: int) -> str:
+        return f"orchestrator:worker:stats:{{{worker_id}}}:{day}"
+
+    async def commit_transition(
+        self,
+        job_id: str,
+        state: dict[str, Any],
+        enqueue: bool = False,
+        watch: dict[str, float] | None = None,
+        worker_tasks: list[WorkerTask] | None = None,
+    ) -> None:
+        """Writes the job state in a transaction on the job's key, then the watch
+        entries, worker tasks and the stream entry in one pipeline, which the cluster
+        client splits by node. No worker or executor can see the step before its state,
+        but unlike on a single node, a crash in between leaves the new state saved
+        without them.
+        """
+        await self.save_job_state(job_id, state)
+        if enqueue or watch or worker_tasks:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                self._stage_transition_effects(pipe, job_id, enqueue, watch, worker_tasks)
+                await pipe.execute()
+        self._watch_added(watch or {})
+
+    async def commit_transitions(
+        self,
+        states: dict[str, dict[str, Any]],
+        watch: dict[str, float] | None = None,
+        worker_tasks: list[WorkerTask] | None = None,
+    ) -> None:
+        """The jobs are in different slots, so each state is written in its own
+        transaction, all of them concurrently. The watch entries and worker tasks
+        follow in one pipeline once every state is saved.
+        """
+        await gather(*(self.save_job_state(job_id, state) for job_id, state in states.items()))
+        if watch or worker_tasks:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                self._stage_watch_and_tasks(pipe, watch, worker_tasks)
+                await pipe.execute()
+        self._watch_added(watch or {})
+
+    async def dequeue_task_for_worker(
+        self,
+        worker_id: str,
+        timeout: int,
+        shared_queues: list[str] | None = None,
+        lease_seconds: float = 0,
+    ) -> dict[str, Any] | None:
+        """BZPOPMAX can only wait on keys of one slot, so the queues of a worker with
+        shared queues are polled with ZPOPMAX instead. Long polling of the API goes
+        through `pop_task_for_worker` and does not take this path.
+        """
+        if shared_queues:
+            return await self._poll_task_for_worker(worker_id, timeout, shared_queues, lease_seconds)
+        return await super().dequeue_task_for_worker(worker_id, timeout, None, lease_seconds)
+
+    async def _pop_leased_task(
+        self,
+        worker_id: str,
+        queue_keys: list[str],
+        lease_seconds: float,
+    ) -> dict[str, Any] | None:
+        """The task queues and the leases are in different slots, so the lease is
+        recorded right after the pop. A crash in between loses the task.
+        """
+        return await self._pop_then_lease(worker_id, queue_keys, lease_seconds)
+
+    async def _claim_leased_task(self, worker_id: str, key: str, member: bytes, lease_seconds: float) -> bool:
+        """Like `_pop_leased_task`, the lease is recorded right after the claim."""
+        return await self._claim_then_lease(worker_id, key, member, lease_seconds)
+
+    async def _read_jobs(self, client: Any, max_count: int, block_ms: int | None) -> list[tuple[str, str]]:
+        """XREADGROUP can only read streams of one slot, so each partition is read by
+        its own command, and the call returns as soon as one of them does. Reads that
+        are still blocked are left running and collected by a later call, so no entry
+        delivered to them is lost.
+        """
+        await self._ensure_consumer_group()
+        partitions = sorted(self._read_partitions)
+        if not partitions and not self._partition_reads:
+            return []
+        count = max(1, max_count // max(1, len(partitions)))
+        for partition in partitions:
+            if partition not in self._partition_reads:
+                self._partition_reads[partition] = create_task(self._read_partition(client, partition, count, block_ms))
+        try:
+            await wait(list(self._partition_reads.values()), return_when=FIRST_COMPLETED)
+        except CancelledError:
+            return []
+        jobs = []
+        for partition, read in list(self._partition_reads.items()):
+            if read.done():
+                del self._partition_reads[partition]
+                jobs.extend(read.result())
+        return jobs
+
+    async def _read_partition(
+        self, client: Any, partition: int, count: int, block_ms: int | None
+    ) -> list[tuple[str, str]]:
+        result = await client.xreadgroup(
+            self._group_name,
+            self._consumer_name,
+            {self._partition_key(partition): ">"},
+            count=count,
+            block=block_ms,
+        )
+        # Counted as in flight right away, so the partition is not handed over meanwhile.
+        return self._parse_stream_messages(result[0][1], partition) if result else []
@@ -0,0 +1,136 @@
+"""Multiplexed long polling of worker task queues.
+
+A worker polling for its next task used to hold a blocking BZPOPMAX, and with it a
+Redis connection, for the whole poll timeout. The `TaskWaiter` parks such requests
+in-process instead. A single subscription per orchestrator instance receives the
+name of every task queue a task is added to and wakes a request parked on that
+queue, which then pops the task without blocking.
+"""
+
+from asyncio import CancelledError, Future, get_running_loop, sleep, timeout
+from logging import getLogger
+from typing import Any
+
+from .storage.base import StorageBackend
+
+logger = getLogger(__name__)
+
+# Delay before subscribing again after the wakeup subscription failed
+RESUBSCRIBE_DELAY_SECONDS = 1.0
+
+
+class TaskWaiter:
+    """Parks long-polling task requests and wakes them when a task arrives."""
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+        self._running = False
+        # queue name -> futures of the requests parked on it, in arrival order
+        self._waiters: dict[str, dict[Future, None]] = {}
+
+    async def run(self):
+        """Consumes the wakeup notifications of the storage."""
+        logger.info("TaskWaiter started.")
+        self._running = True
+        while self._running:
+            try:
+                async for queue_name in self.storage.listen_task_wakeups():
+                    if queue_name is None:
+                        # (Re)subscribed: notifications sent before were missed.
+                        self._wake_all()
+                    else:
+                        self._wake(queue_name)
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in TaskWaiter subscription, subscribing again.")
+                await sleep(RESUBSCRIBE_DELAY_SECONDS)
+        self._wake_all()
+        logger.info("TaskWaiter stopped.")
+
+    def stop(self):
+        self._running = False
+
+    @property
+    def parked_count(self) -> int:
+        return len({waiter for waiters in self._waiters.values() for waiter in waiters})
+
+    async def wait_for_task(
+        self,
+        worker_id: str,
+        timeout_seconds: float,
+        shared_queues: list[str] | None = None,
+        lease_seconds: float = 0,
+    ) -> dict[str, Any] | None:
+        """Waits for a task in the worker's queue or one of the shared queues.
+        Has the same semantics as `StorageBackend.dequeue_task_for_worker`.
+        """
+        queue_names = [worker_id, *(shared_queues or [])]
+        loop = get_running_loop()
+        deadline = loop.time() + timeout_seconds
+        # The queue whose wakeup this request took and has not yet used
+        woken_by: str | None = None
+        try:
+            while True:
+                # Parked before popping, so a task added in between still wakes it.
+                waiter = loop.create_future()
+                awaited = False
+                self._park(waiter, queue_names)
+                try:
+                    task = await self.storage.pop_task_for_worker(worker_id, shared_queues, lease_seconds)
+                    if task is not None:
+                        if task.get("shared_queue", worker_id) == woken_by:
+                            woken_by = None
+                        return task
+                    # Another worker took the task that caused the wakeup.
+                    woken_by = None
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        return None
+                    try:
+                        async with timeout(remaining):
+                            woken_by = await waiter
+                        awaited = True
+                    except TimeoutError:
+                        return None
+                finally:
+                    self._unpark(waiter, queue_names)
+                    if not awaited and waiter.done() and not waiter.cancelled():
+                        # Woken while popping, and the wakeup was never awaited.
+                        self._wake(waiter.result())
+        finally:
+            if woken_by is not None:
+                # Hands a wakeup this request did not use on to another parked request.
+                self._wake(woken_by)
+
+    def _park(self, waiter: Future, queue_names: list[str]) -> None:
+        for name in queue_names:
+            self._waiters.setdefault(name, {})[waiter] = None
+
+    def _unpark(self, waiter: Future, queue_names: list[str]) -> None:
+        for name in queue_names:
+            waiters = self._waiters.get(name)
+            if waiters is not None:
+                waiters.pop(waiter, None)
+                if not waiters:
+                    del self._waiters[name]
+
+    def _wake(self, queue_name: str | None) -> None:
+        """Wakes the longest parked request on the queue. One task needs one worker,
+        so waking every request parked on a shared queue would only cause empty pops.
+        """
+        if queue_name is None:
+            return
+        waiters = self._waiters.get(queue_name, {})
+        while waiters:
+            waiter = next(iter(waiters))
+            del waiters[waiter]
+            if not waiter.done():
+                waiter.set_result(queue_name)
+                return
+
+    def _wake_all(self) -> None:
+        for waiters in self._waiters.values():
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
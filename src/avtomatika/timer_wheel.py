@@ -0,0 +1,119 @@
+"""A hierarchical timing wheel for the deadlines of watched jobs.
+
+Level 0 has one slot per tick. Each higher level has slots as wide as a full turn
+of the level below it. An entry goes on the lowest level that spans its distance
+from the current tick. When the wheel turns past a higher-level slot, that slot's
+entries cascade down to lower levels. Adding and removing an entry costs O(1),
+however many entries there are.
+"""
+
+from math import inf
+
+
+class TimerWheel:
+    """Keeps deadlines (wall-clock timestamps) by key and reports the ones that are due."""
+
+    def __init__(self, now: float, tick_seconds: float = 0.1, slots: int = 64, levels: int = 4):
+        self._tick_seconds = tick_seconds
+        self._slots = slots
+        self._wheels: list[list[dict[str, float]]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        # Entries too far away for the top level, placed again on each of its turns
+        self._overflow: dict[str, float] = {}
+        # key -> (level, slot), or None for the overflow
+        self._positions: dict[str, tuple[int, int] | None] = {}
+        self._current_tick = self._tick(now)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._positions
+
+    def _tick(self, timestamp: float) -> int:
+        return int(timestamp // self._tick_seconds)
+
+    def add(self, key: str, deadline: float) -> None:
+        """Adds the key, or moves it to the new deadline if it is already in the wheel."""
+        self.remove(key)
+        self._place(key, deadline)
+
+    def remove(self, key: str) -> None:
+        if key not in self._positions:
+            return
+        position = self._positions.pop(key)
+        if position is None:
+            del self._overflow[key]
+        else:
+            level, slot = position
+            del self._wheels[level][slot][key]
+
+    def _place(self, key: str, deadline: float) -> None:
+        # Entries that are already due go into the current slot.
+        tick = max(self._tick(deadline), self._current_tick)
+        distance = tick - self._current_tick
+        span = self._slots
+        for level, wheel in enumerate(self._wheels):
+            if distance < span:
+                slot = (tick // (span // self._slots)) % self._slots
+                wheel[slot][key] = deadline
+                self._positions[key] = (level, slot)
+                return
+            span *= self._slots
+        self._overflow[key] = deadline
+        self._positions[key] = None
+
+    def next_deadline(self) -> float:
+        """Returns the earliest deadline in the wheel, or `inf` if it is empty. An entry
+        on a higher level can be due before one on a lower level that was added later,
+        so the first occupied slot of every level is considered.
+        """
+        earliest = min(self._overflow.values(), default=inf)
+        width = 1
+        for level, wheel in enumerate(self._wheels):
+            current = self._current_tick // width
+            # Above level 0, the current slot only holds entries of the next turn.
+            first = 0 if level == 0 else 1
+            for offset in range(first, first + self._slots):
+                if entries := wheel[(current + offset) % self._slots]:
+                    earliest = min(earliest, *entries.values())
+                    break
+            width *= self._slots
+        return earliest
+
+    def advance(self, now: float) -> list[str]:
+        """Turns the wheel up to `now` and removes and returns the keys that are due."""
+        target = self._tick(now)
+        due: list[str] = []
+        if not self._positions:
+            self._current_tick = max(self._current_tick, target)
+            return due
+        while True:
+            slot = self._wheels[0][self._current_tick % self._slots]
+            for key, deadline in list(slot.items()):
+                if deadline <= now:
+                    del slot[key]
+                    del self._positions[key]
+                    due.append(key)
+            if self._current_tick >= target:
+                return due
+            self._current_tick += 1
+            self._cascade()
+
+    def _cascade(self) -> None:
+        """Moves the entries of the higher-level slots the wheel has just reached down,
+        starting at the top, so entries cascading through several levels are not left
+        in a slot that was already emptied.
+        """
+        levels = len(self._wheels)
+        top = 0
+        while top < levels and self._current_tick % self._slots ** (top + 1) == 0:
+            top += 1
+        if top == levels:
+            entries, self._overflow = self._overflow, {}
+            for key, deadline in entries.items():
+                self._place(key, deadline)
+        for level in range(min(top, levels - 1), 0, -1):
+            slot = (self._current_tick // self._slots**level) % self._slots
+            entries, self._wheels[level][slot] = self._wheels[level][slot], {}
+            for key, deadline in entries.items():
+                self._place(key, deadline)
@@ -1,16 +1,39 @@
-from asyncio import CancelledError, sleep
+from asyncio import CancelledError, Event, gather, timeout
 from logging import getLogger
+from math import inf
+from time import time
 from typing import TYPE_CHECKING
 from uuid import uuid4
 
+from . import metrics
+from .timer_wheel import TimerWheel
+
 if TYPE_CHECKING:
     from .engine import OrchestratorEngine
 
 logger = getLogger(__name__)
 
+# Maximum number of overdue jobs claimed and read in one batch
+TIMEOUT_BATCH_SIZE = 500
+TIMEOUT_ERROR_MESSAGE = "Worker task timed out."
+# Sweep intervals after which a watcher that stopped sweeping loses its watch shards
+WATCH_MEMBERSHIP_INTERVALS = 3
+
 
 class Watcher:
-    """A background process that monitors for "stuck" jobs."""
+    """A background process that monitors for "stuck" jobs.
+
+    The watch entries this instance adds and removes are mirrored in a `TimerWheel`
+    (the watcher is the storage's `deadline_listener`), so the watcher sleeps until
+    the next deadline and handles a timeout as soon as it is due. Claiming a timed
+    out job is atomic, so each is handled only once.
+
+    The storage index stays the source of truth. It is split into shards, and the
+    live instances divide the shards among themselves by consistent hashing. Every
+    `WATCHER_INTERVAL_SECONDS` each watcher renews its membership, sweeps the shards
+    it owns for overdue jobs and then also waits for their earliest deadline, which
+    covers deadlines set by other instances or before a restart.
+    """
 
     def __init__(self, engine: "OrchestratorEngine"):
         self.engine = engine
@@ -19,64 +42,122 @@ class Watcher:
         self._running = False
         self.watch_interval_seconds = self.config.WATCHER_INTERVAL_SECONDS
         self._instance_id = str(uuid4())
+        self._wheel = TimerWheel(time())
+        self._owned_shards: set[int] = set()
+        # The earliest deadline in the owned shards as of the last check
+        self._stored_deadline = inf
+        self._next_sweep_at = 0.0
+        self._wake_at = inf
+        self._wakeup = Event()
+        self.storage.deadline_listener = self
 
-    async def run(self):
+    def add(self, watch_id: str, timeout_at: float) -> None:
+        self._wheel.add(watch_id, timeout_at)
+        if timeout_at < self._wake_at:
+            self._wakeup.set()
+
+    def remove(self, watch_id: str) -> None:
+        self._wheel.remove(watch_id)
+
+    async def run(self) -> None:
         """The main loop of the watcher."""
         logger.info(f"Watcher started (Instance ID: {self._instance_id}).")
         self._running = True
         while self._running:
             try:
-                await sleep(self.watch_interval_seconds)
-
-                # Attempt to acquire distributed lock
-                # We set TTL slightly longer than the expected execution time,
-                # but shorter than the interval if possible.
-                # Actually, a fixed TTL like 60s is fine as long as we release it.
-                if not await self.storage.acquire_lock("global_watcher_lock", self._instance_id, 60):
-                    logger.debug("Watcher lock held by another instance. Skipping check.")
-                    continue
+                if time() >= self._next_sweep_at:
+                    self._next_sweep_at = time() + self.watch_interval_seconds
+                    await self.sweep()
 
-                try:
-                    logger.info("Watcher running check for timed out jobs...")
-                    timed_out_job_ids = await self.storage.get_timed_out_jobs()
-
-                    for job_id in timed_out_job_ids:
-                        logger.warning(f"Job {job_id} timed out. Moving to failed state.")
-                        try:
-                            # Get the latest version to avoid overwriting
-                            job_state = await self.storage.get_job_state(job_id)
-                            if job_state and job_state["status"] == "waiting_for_worker":
-                                job_state["status"] = "failed"
-                                job_state["error_message"] = "Worker task timed out."
-                                await self.storage.save_job_state(job_id, job_state)
-
-                                # Increment the metric
-                                from . import metrics
-
-                                metrics.jobs_failed_total.inc(
-                                    {
-                                        metrics.LABEL_BLUEPRINT: job_state.get(
-                                            "blueprint_name",
-                                            "unknown",
-                                        ),
-                                    },
-                                )
-                        except Exception:
-                            logger.exception(
-                                f"Failed to update state for timed out job {job_id}",
-                            )
-                finally:
-                    # Always release the lock so we (or others) can run next time
-                    await self.storage.release_lock("global_watcher_lock", self._instance_id)
+                await self._sleep_until(min(self._next_sweep_at, self._wheel.next_deadline(), self._stored_deadline))
 
+                now = time()
+                shards = {self.storage.watch_shard(watch_id) for watch_id in self._wheel.advance(now)}
+                if self._stored_deadline <= now:
+                    # Reset first, so a failing check is retried by the next sweep, not in a loop.
+                    self._stored_deadline = inf
+                    shards |= self._owned_shards
+                if shards:
+                    await self._handle_timed_out_jobs(shards)
             except CancelledError:
                 logger.info("Watcher received cancellation request.")
                 break
             except Exception:
                 logger.exception("Error in Watcher main loop.")
 
+        try:
+            await self.storage.release_watch_shards(self._instance_id)
+        except Exception:
+            logger.exception("Failed to release the watch shards.")
         logger.info("Watcher stopped.")
 
-    def stop(self):
+    async def _sleep_until(self, wake_at: float) -> None:
+        """Sleeps until `wake_at` or until an earlier deadline is added."""
+        self._wake_at = wake_at
+        self._wakeup.clear()
+        try:
+            async with timeout(max(0.0, wake_at - time())):
+                await self._wakeup.wait()
+        except TimeoutError:
+            pass
+        finally:
+            self._wake_at = inf
+
+    async def sweep(self) -> None:
+        """Renews this instance's share of the watch shards and handles all overdue
+        jobs in the shards it owns, whoever set their deadlines.
+        """
+        # An instance that stops sweeping loses its shards after a few intervals.
+        ttl = int(self.watch_interval_seconds * WATCH_MEMBERSHIP_INTERVALS)
+        owned = await self.storage.refresh_watch_shards(self._instance_id, max(1, ttl))
+        if owned != self._owned_shards:
+            logger.info(f"Watcher owns {len(owned)} watch shards: {sorted(owned)}.")
+            self._owned_shards = owned
+        await self._handle_timed_out_jobs(owned)
+
+    async def _handle_timed_out_jobs(self, shards: set[int]) -> None:
+        """Claims the overdue jobs of the shards in batches, reads their states in one
+        round trip and sends the jobs still waiting for a worker down the retry path,
+        writing them back in one batch as well.
+        """
+        while True:
+            timed_out_job_ids = await self.storage.get_timed_out_jobs(TIMEOUT_BATCH_SIZE, shards)
+            for watch_id in timed_out_job_ids:
+                self._wheel.remove(watch_id)
+            if timed_out_job_ids:
+                logger.info(f"Claimed {len(timed_out_job_ids)} timed out watch entries.")
+                try:
+                    job_states = await self.storage.get_job_states(timed_out_job_ids)
+                except Exception:
+                    logger.exception(f"Failed to read the states of timed out jobs {timed_out_job_ids}")
+                    job_states = {}
+                waiting = [
+                    job_state for job_state in job_states.values() if job_state.get("status") == "waiting_for_worker"
+                ]
+                if waiting:
+                    await self._handle_waiting_jobs(waiting)
+            if len(timed_out_job_ids) < TIMEOUT_BATCH_SIZE:
+                break
+        stored_deadline = await self.storage.get_next_watch_deadline(self._owned_shards)
+        self._stored_deadline = inf if stored_deadline is None else stored_deadline
+
+    async def _handle_waiting_jobs(self, job_states: list[dict]) -> None:
+        job_ids = [job_state["id"] for job_state in job_states]
+        logger.warning(f"Jobs {job_ids} timed out waiting for their workers.")
+        try:
+            # The workers may still get to the tasks: make them discard the tasks instead.
+            task_ids = [task_id for job_state in job_states if (task_id := job_state.get("current_task_id"))]
+            await gather(*(self.storage.set_task_cancellation_flag(task_id) for task_id in task_ids))
+            await self.engine._handle_task_failures(job_states, TIMEOUT_ERROR_MESSAGE)
+        except Exception:
+            logger.exception(f"Failed to handle timed out jobs {job_ids}")
+        for job_state in job_states:
+            if job_state.get("status") in ("failed", "quarantined"):
+                metrics.jobs_failed_total.inc(
+                    {metrics.LABEL_BLUEPRINT: job_state.get("blueprint_name", "unknown")},
+                )
+
+    def stop(self) -> None:
         """Stops the watcher."""
         self._running = False
+        self._wakeup.set()
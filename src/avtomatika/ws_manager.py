@@ -1,5 +1,7 @@
-from asyncio import Lock
+from asyncio import Future, Lock, get_running_loop, wait_for
+from asyncio import TimeoutError as AsyncTimeoutError
 from logging import getLogger
+from typing import Any
 
 from aiohttp import web
 
@@ -11,24 +13,74 @@ class WebSocketManager:
 
     def __init__(self):
         self._connections: dict[str, web.WebSocketResponse] = {}
+        # Workers that asked to receive tasks over their connection.
+        self._push_workers: set[str] = set()
+        # Pushed tasks waiting for a `task_ack`: task ID -> (worker ID, future).
+        self._pending_acks: dict[str, tuple[str, Future]] = {}
         self._lock = Lock()
 
-    async def register(self, worker_id: str, ws: web.WebSocketResponse):
-        """Registers a new WebSocket connection for a worker."""
+    async def register(self, worker_id: str, ws: web.WebSocketResponse, push_tasks: bool = False):
+        """Registers a new WebSocket connection for a worker.
+
+        :param push_tasks: Whether the worker accepts tasks pushed over this connection.
+        """
         async with self._lock:
             if worker_id in self._connections:
                 # Close the old connection if it exists
                 await self._connections[worker_id].close(code=1008, message=b"New connection established")
             self._connections[worker_id] = ws
-            logger.info(f"WebSocket connection registered for worker {worker_id}.")
+            if push_tasks:
+                self._push_workers.add(worker_id)
+            else:
+                self._push_workers.discard(worker_id)
+            logger.info(f"WebSocket connection registered for worker {worker_id} (push_tasks={push_tasks}).")
 
-    async def unregister(self, worker_id: str):
-        """Unregisters a WebSocket connection."""
+    async def unregister(self, worker_id: str, ws: web.WebSocketResponse | None = None):
+        """Unregisters a WebSocket connection.
+
+        :param ws: If given, the connection is only removed if it is still the registered one,
+            so a replaced connection does not unregister its successor.
+        """
         async with self._lock:
-            if worker_id in self._connections:
+            if worker_id in self._connections and (ws is None or self._connections[worker_id] is ws):
                 del self._connections[worker_id]
+                self._push_workers.discard(worker_id)
+                # Pushes to this connection can no longer be acknowledged.
+                for pending_worker_id, future in self._pending_acks.values():
+                    if pending_worker_id == worker_id and not future.done():
+                        future.set_result(False)
                 logger.info(f"WebSocket connection for worker {worker_id} unregistered.")
 
+    def accepts_pushed_tasks(self, worker_id: str) -> bool:
+        """Returns True if the worker has an open connection that accepts pushed tasks."""
+        connection = self._connections.get(worker_id)
+        return worker_id in self._push_workers and connection is not None and not connection.closed
+
+    async def push_task(self, worker_id: str, task_payload: dict[str, Any], ack_timeout: float) -> bool:
+        """Sends a task to the worker and waits for its `task_ack`.
+
+        :return: True if the worker acknowledged the task, False if it could not be
+            delivered or was not acknowledged in time.
+        """
+        connection = self._connections.get(worker_id)
+        if not connection or connection.closed:
+            return False
+
+        task_id = task_payload["task_id"]
+        future: Future = get_running_loop().create_future()
+        self._pending_acks[task_id] = (worker_id, future)
+        try:
+            await connection.send_json({"command": "run_task", "task": task_payload})
+            return await wait_for(future, timeout=ack_timeout)
+        except AsyncTimeoutError:
+            logger.warning(f"Worker {worker_id} did not acknowledge pushed task {task_id} in time.")
+            return False
+        except Exception as e:
+            logger.error(f"Failed to push task {task_id} to worker {worker_id}: {e}")
+            return False
+        finally:
+            self._pending_acks.pop(task_id, None)
+
     async def send_command(self, worker_id: str, command: dict):
         """Sends a JSON command to a specific worker."""
         async with self._lock:
@@ -45,11 +97,15 @@ class WebSocketManager:
                 logger.warning(f"Cannot send command: No active WebSocket connection for worker {worker_id}.")
                 return False
 
-    @staticmethod
-    async def handle_message(worker_id: str, message: dict):
+    async def handle_message(self, worker_id: str, message: dict):
         """Handles an incoming message from a worker."""
         event_type = message.get("event")
-        if event_type == "progress_update":
+        if event_type == "task_ack":
+            pending = self._pending_acks.get(message.get("task_id", ""))
+            # A worker can only acknowledge tasks that were pushed to it.
+            if pending and pending[0] == worker_id and not pending[1].done():
+                pending[1].set_result(True)
+        elif event_type == "progress_update":
             # In a real application, you'd likely forward this to a history store
             # or a pub/sub system for real-time UI updates.
             logger.info(
@@ -66,4 +122,5 @@ class WebSocketManager:
             for ws in self._connections.values():
                 await ws.close(code=1001, message=b"Server shutdown")
             self._connections.clear()
+            self._push_workers.clear()
             logger.info("All WebSocket connections closed.")
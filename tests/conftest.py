@@ -11,6 +11,8 @@ from opentelemetry.sdk.trace.export import (
     ConsoleSpanExporter,
     SimpleSpanProcessor,
 )
+from redis.crc import key_slot
+from redis.exceptions import ResponseError
 from src.avtomatika.client_config_loader import load_client_configs_to_redis
 from src.avtomatika.config import Config
 from src.avtomatika.engine import ENGINE_KEY, OrchestratorEngine
@@ -59,6 +61,63 @@ async def redis_client():
     await client.aclose()
 
 
+def _command_keys(args: tuple) -> list:
+    """Returns the keys a command touches, for the commands the storage sends."""
+    name, *rest = [arg.decode(errors="replace") if isinstance(arg, bytes) else str(arg) for arg in args]
+    name = name.upper()
+    if name in ("MGET", "DEL", "EXISTS", "SINTER", "SUNION"):
+        return rest
+    if name in ("BZPOPMAX", "BZPOPMIN"):
+        return rest[:-1]
+    if name in ("EVAL", "EVALSHA"):
+        return rest[2 : 2 + int(rest[1])]
+    if name == "XREADGROUP":
+        streams = rest[rest.index("STREAMS") + 1 :]
+        return streams[: len(streams) // 2]
+    if name in ("PUBLISH", "MULTI", "EXEC", "FLUSHDB", "SCRIPT"):
+        return []
+    return rest[:1]
+
+
+def _assert_single_slot(keys: list) -> None:
+    slots = {key_slot(key.encode()) for key in keys}
+    if len(slots) > 1:
+        raise ResponseError("CROSSSLOT Keys in request don't hash to the same slot")
+
+
+class SlotCheckingRedis(redis.FakeRedis):
+    """A stand-in for Redis Cluster: like a cluster node, it rejects multi-key
+    commands and MULTI/EXEC transactions whose keys are in different hash slots.
+    """
+
+    async def execute_command(self, *args, **options):
+        _assert_single_slot(_command_keys(args))
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        async def checked_execute(raise_on_error=True):
+            if pipe.is_transaction:
+                _assert_single_slot([key for args, _ in pipe.command_stack for key in _command_keys(args)])
+            else:
+                for args, _ in pipe.command_stack:
+                    _assert_single_slot(_command_keys(args))
+            return await execute(raise_on_error)
+
+        pipe.execute = checked_execute
+        return pipe
+
+
+@pytest_asyncio.fixture
+async def cluster_client():
+    """A fakeredis client that enforces the hash slot rules of Redis Cluster."""
+    client = SlotCheckingRedis(decode_responses=False)
+    yield client
+    await client.aclose()
+
+
 @pytest.fixture
 def memory_storage():
     """Provides a MemoryStorage instance."""
@@ -1,7 +1,9 @@
 import asyncio
+from time import time
 
 import pytest
-from src.avtomatika.storage.base import StorageBackend
+from src.avtomatika.data_types import FencingToken, WorkerTask, WorkerTaskStats
+from src.avtomatika.storage.base import StorageBackend, stats_day
 
 
 @pytest.mark.asyncio
@@ -25,6 +27,166 @@ class StorageTestSuite:
         # Acknowledge the job
         await storage.ack_job(message_id)
 
+    async def test_dequeue_jobs_returns_batch(self, storage: StorageBackend):
+        for i in range(3):
+            await storage.enqueue_job(f"batch-job-{i}")
+
+        jobs = await storage.dequeue_jobs(max_count=2, block_ms=100)
+        assert [job_id for job_id, _ in jobs] == ["batch-job-0", "batch-job-1"]
+        assert len({message_id for _, message_id in jobs}) == 2
+
+        rest = await storage.dequeue_jobs(max_count=10, block_ms=100)
+        assert [job_id for job_id, _ in rest] == ["batch-job-2"]
+
+        for _, message_id in jobs + rest:
+            await storage.ack_job(message_id)
+        assert await storage.dequeue_jobs(max_count=10, block_ms=100) == []
+
+    async def test_commit_transition_writes_all_parts(self, storage: StorageBackend):
+        job_id = "commit-job"
+        state = {"id": job_id, "status": "waiting_for_worker", "current_state": "work"}
+        task = WorkerTask(worker_id="commit-worker", payload={"job_id": job_id, "task_id": "t-1"}, priority=5.0)
+
+        await storage.commit_transition(job_id, state, enqueue=True, watch={job_id: 0.0}, worker_tasks=[task])
+
+        assert await storage.get_job_state(job_id) == state
+        assert await storage.get_timed_out_jobs() == [job_id]
+        assert await storage.dequeue_task_for_worker("commit-worker", 1) == task.payload
+        jobs = await storage.dequeue_jobs(max_count=10, block_ms=100)
+        assert [queued_id for queued_id, _ in jobs] == [job_id]
+        await storage.ack_job(jobs[0][1])
+
+    async def test_timed_out_jobs_are_claimed_by_deadline(self, storage: StorageBackend):
+        now = time()
+        for i, offset in enumerate([-3, -1, -2, 60]):
+            await storage.add_job_to_watch(f"deadline-job-{i}", now + offset)
+
+        assert await storage.get_timed_out_jobs(limit=2) == ["deadline-job-0", "deadline-job-2"]
+        assert await storage.get_timed_out_jobs(limit=2) == ["deadline-job-1"]
+        assert await storage.get_timed_out_jobs() == []
+
+    async def test_next_watch_deadline(self, storage: StorageBackend):
+        assert await storage.get_next_watch_deadline() is None
+        now = time()
+        await storage.add_job_to_watch("next-deadline-1", now + 30)
+        await storage.commit_transition(
+            "next-deadline-2", {"id": "next-deadline-2"}, watch={"next-deadline-2": now + 10}
+        )
+        assert await storage.get_next_watch_deadline() == pytest.approx(now + 10)
+
+        await storage.remove_job_from_watch("next-deadline-2")
+        assert await storage.get_next_watch_deadline() == pytest.approx(now + 30)
+
+    async def test_lock_fencing_tokens(self, storage: StorageBackend):
+        first = await storage.acquire_lock_with_token("fenced-lock", "holder-1", 10)
+        assert first is not None
+        assert await storage.acquire_lock_with_token("fenced-lock", "holder-2", 10) is None
+        assert await storage.extend_lock("fenced-lock", "holder-1", 10) is True
+
+        assert await storage.release_lock("fenced-lock", "holder-1") is True
+        second = await storage.acquire_lock_with_token("fenced-lock", "holder-2", 10)
+        assert second is not None and second > first
+        assert await storage.check_fencing_token(FencingToken("fenced-lock", second)) is True
+        assert await storage.check_fencing_token(FencingToken("fenced-lock", first)) is False
+
+    async def test_fenced_worker_update(self, storage: StorageBackend):
+        await storage.register_worker("fenced-worker", {"worker_id": "fenced-worker"}, 60)
+        stale = FencingToken("fenced-leader", await storage.acquire_lock_with_token("fenced-leader", "old", 10))
+        await storage.release_lock("fenced-leader", "old")
+        current = FencingToken("fenced-leader", await storage.acquire_lock_with_token("fenced-leader", "new", 10))
+
+        assert await storage.update_worker_data("fenced-worker", {"reputation": 0.5}, fence=current) is not None
+        assert await storage.update_worker_data("fenced-worker", {"reputation": 0.1}, fence=stale) is None
+        assert (await storage.get_worker_info("fenced-worker"))["reputation"] == 0.5
+
+    async def test_lock_lifecycle(self, storage: StorageBackend):
+        assert await storage.acquire_lock("leased-lock", "holder-1", 10) is True
+        assert await storage.acquire_lock("leased-lock", "holder-2", 10) is False
+        assert await storage.extend_lock("leased-lock", "holder-1", 10) is True
+        assert await storage.extend_lock("leased-lock", "holder-2", 10) is False
+
+        assert await storage.release_lock("leased-lock", "holder-1") is True
+        assert await storage.acquire_lock("leased-lock", "holder-2", 10) is True
+
+    async def test_batch_job_state_reads_and_commits(self, storage: StorageBackend):
+        await storage.save_job_state("batch-1", {"id": "batch-1", "status": "waiting_for_worker", "data": 1})
+        await storage.save_job_state("batch-2", {"id": "batch-2", "status": "running"})
+
+        states = await storage.get_job_states(["batch-1", "batch-2", "missing"], fields=["status", "data"])
+        assert states == {"batch-1": {"status": "waiting_for_worker", "data": 1}, "batch-2": {"status": "running"}}
+
+        retry = WorkerTask(worker_id="batch-worker", payload={"job_id": "batch-1", "task_id": "t-1"}, priority=1.0)
+        await storage.commit_transitions(
+            {
+                "batch-1": {"id": "batch-1", "status": "waiting_for_worker"},
+                "batch-2": {"id": "batch-2", "status": "failed"},
+            },
+            watch={"batch-1": 1.0},
+            worker_tasks=[retry],
+        )
+        # Full saves remove the fields that were dropped
+        assert await storage.get_job_states(["batch-1", "batch-2"]) == {
+            "batch-1": {"id": "batch-1", "status": "waiting_for_worker"},
+            "batch-2": {"id": "batch-2", "status": "failed"},
+        }
+        assert await storage.get_timed_out_jobs() == ["batch-1"]
+        assert await storage.dequeue_task_for_worker("batch-worker", 1) == retry.payload
+
+    async def test_claim_worker_task(self, storage: StorageBackend):
+        first = WorkerTask(worker_id="claim-worker", payload={"job_id": "j-1", "task_id": "t-1"}, priority=1.0)
+        second = WorkerTask(worker_id="claim-worker", payload={"job_id": "j-2", "task_id": "t-2"}, priority=2.0)
+        await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=[first, second])
+
+        assert await storage.claim_worker_task("claim-worker", second.payload) is True
+        assert await storage.claim_worker_task("claim-worker", second.payload) is False
+        assert await storage.claim_worker_task("other-worker", first.payload) is False
+        assert await storage.dequeue_task_for_worker("claim-worker", 1) == first.payload
+
+    async def test_claimed_task_is_leased(self, storage: StorageBackend):
+        task = WorkerTask(worker_id="claim-worker", payload={"job_id": "j-1", "task_id": "t-1"}, priority=3.0)
+        await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=[task])
+
+        assert await storage.claim_worker_task("claim-worker", task.payload, lease_seconds=0.2) is True
+        assert await storage.extend_task_lease("claim-worker", "t-1", 0.2) is True
+        await asyncio.sleep(0.3)
+        assert await storage.pop_expired_task_leases() == [("claim-worker", task.payload, 3.0)]
+
+    async def test_shared_task_queues(self, storage: StorageBackend):
+        await storage.register_task_queue_class("render", "any", {})
+        await storage.register_task_queue_class("render", "gpu", {"resource_requirements": {"gpu_info": {}}})
+        classes = await storage.get_task_queue_classes(["render", "unknown"])
+        assert classes == {"render": {"any": {}, "gpu": {"resource_requirements": {"gpu_info": {}}}}}
+
+        shared = [
+            WorkerTask(None, {"job_id": "j-1", "task_id": f"t-{i}"}, priority, shared_queue="shared:render:any")
+            for i, priority in enumerate([1.0, 3.0, 3.0])
+        ]
+        own = WorkerTask("shared-worker", {"job_id": "j-2", "task_id": "own"}, 0.0)
+        await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=[*shared, own])
+
+        queues = ["shared:render:any"]
+        # The worker's own queue comes first, then the shared queue by priority
+        assert (await storage.dequeue_task_for_worker("shared-worker", 1, queues))["task_id"] == "own"
+        assert (await storage.dequeue_task_for_worker("other-worker", 1, queues))["task_id"] in ("t-1", "t-2")
+        assert (await storage.dequeue_task_for_worker("shared-worker", 1, queues))["task_id"] in ("t-1", "t-2")
+        assert (await storage.dequeue_task_for_worker("shared-worker", 1, queues))["task_id"] == "t-0"
+
+    async def test_pop_task_and_wakeups(self, storage: StorageBackend):
+        wakeups = storage.listen_task_wakeups()
+        assert await anext(wakeups) is None
+
+        shared = WorkerTask(None, {"job_id": "j-1", "task_id": "shared"}, 1.0, shared_queue="shared:render:any")
+        own = WorkerTask("pop-worker", {"job_id": "j-1", "task_id": "own"}, 0.0)
+        await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=[shared, own])
+        received = [await asyncio.wait_for(anext(wakeups), 1) for _ in range(2)]
+        assert sorted(received) == ["pop-worker", "shared:render:any"]
+
+        queues = ["shared:render:any"]
+        assert (await storage.pop_task_for_worker("pop-worker", queues))["task_id"] == "own"
+        assert (await storage.pop_task_for_worker("pop-worker", queues))["task_id"] == "shared"
+        assert await storage.pop_task_for_worker("pop-worker", queues) is None
+        await wakeups.aclose()
+
     async def test_job_state_serialization(self, storage: StorageBackend):
         job_id = "test-state-123"
         initial_state = {
@@ -57,6 +219,34 @@ class StorageTestSuite:
         assert final_state["status"] == "running"
         assert final_state["retry_count"] == 1
 
+    async def test_get_job_state_projection(self, storage: StorageBackend):
+        job_id = "projection-job"
+        state = {"id": job_id, "status": "running", "initial_data": {"files": ["a.py"]}, "tmp": 1}
+        await storage.save_job_state(job_id, state)
+
+        assert await storage.get_job_state(job_id, fields=["status", "missing"]) == {"status": "running"}
+        assert await storage.get_job_state("no-such-job", fields=["status"]) is None
+
+        # Fields dropped from the state are removed on the next save
+        del state["tmp"]
+        state["status"] = "finished"
+        await storage.save_job_state(job_id, state)
+        assert await storage.get_job_state(job_id) == state
+
+    async def test_worker_task_stats_are_windowed(self, storage: StorageBackend):
+        await storage.record_worker_task_outcome("stats-worker", True, 100, window_days=30)
+        stats = await storage.record_worker_task_outcome("stats-worker", False, None, window_days=30)
+        assert stats == WorkerTaskStats(successes=1, failures=1, total_duration_ms=100, timed_tasks=1)
+
+        today = stats_day()
+        await storage.set_worker_task_stats("stats-worker", today - 1, WorkerTaskStats(5, 0, 0, 0), window_days=30)
+        # Too old for the window
+        await storage.set_worker_task_stats("stats-worker", today - 40, WorkerTaskStats(7, 7, 0, 0), window_days=30)
+
+        stats = await storage.get_worker_task_stats("stats-worker", window_days=30)
+        assert (stats.successes, stats.failures) == (6, 1)
+        assert await storage.get_worker_task_stats("other-worker", window_days=30) == WorkerTaskStats()
+
     async def test_register_and_get_worker_info(self, storage: StorageBackend):
         worker_id = "worker-1"
         info = {
@@ -76,6 +266,87 @@ class StorageTestSuite:
         assert fetched_info["resources"]["cpu"] == 4
         assert "gpu" in fetched_info["tags"]
 
+    async def test_find_workers_uses_registry_indexes(self, storage: StorageBackend):
+        gpu_worker = {
+            "worker_id": "gpu-1",
+            "supported_tasks": ["render", "upscale"],
+            "resources": {"gpu_info": {"model": "NVIDIA T4", "vram_gb": 16}},
+            "installed_models": [{"name": "sd-1.5", "version": "1.0"}],
+        }
+        cpu_worker = {"worker_id": "cpu-1", "status": "idle", "supported_tasks": ["upscale"]}
+        busy_worker = {"worker_id": "cpu-2", "status": "busy", "supported_tasks": ["upscale"]}
+        for worker in (gpu_worker, cpu_worker, busy_worker):
+            await storage.register_worker(worker["worker_id"], dict(worker), 60)
+
+        def ids(workers):
+            return sorted(w["worker_id"] for w in workers)
+
+        assert ids(await storage.find_workers(task_type="upscale")) == ["cpu-1", "cpu-2", "gpu-1"]
+        assert ids(await storage.find_workers(task_type="upscale", status="idle")) == ["cpu-1", "gpu-1"]
+        assert ids(await storage.find_workers(task_type="render")) == ["gpu-1"]
+        assert await storage.find_workers(task_type="unknown") == []
+
+        # GPU model is matched as a substring, installed models as a subset
+        gpu_requirements = {"gpu_info": {"model": "T4"}, "installed_models": ["sd-1.5"]}
+        assert ids(await storage.find_workers(task_type="upscale", resource_requirements=gpu_requirements)) == ["gpu-1"]
+        assert await storage.find_workers(resource_requirements={"gpu_info": {"model": "A100"}}) == []
+
+        # Status changes move the worker between index sets
+        await storage.update_worker_status("cpu-2", {"status": "idle"}, 60)
+        await storage.update_worker_status("gpu-1", {"status": "busy"}, 60)
+        assert ids(await storage.find_workers(task_type="upscale", status="idle")) == ["cpu-1", "cpu-2"]
+
+        await storage.deregister_worker("cpu-1")
+        assert ids(await storage.find_workers(task_type="upscale", status="idle")) == ["cpu-2"]
+        assert await storage.get_active_worker_count() == 2
+
+    async def test_find_workers_skips_expired_workers(self, storage: StorageBackend):
+        await storage.register_worker("short-lived", {"worker_id": "short-lived", "supported_tasks": ["t"]}, 1)
+        await storage.register_worker("long-lived", {"worker_id": "long-lived", "supported_tasks": ["t"]}, 60)
+        await asyncio.sleep(1.1)
+
+        workers = await storage.find_workers(task_type="t")
+        assert [w["worker_id"] for w in workers] == ["long-lived"]
+        assert [w["worker_id"] for w in await storage.get_available_workers()] == ["long-lived"]
+        assert await storage.get_active_worker_count() == 1
+
+    async def test_lost_workers_and_drained_tasks(self, storage: StorageBackend):
+        await storage.register_worker("lost-worker", {"worker_id": "lost-worker", "supported_tasks": ["t"]}, 1)
+        await storage.register_worker("live-worker", {"worker_id": "live-worker", "supported_tasks": ["t"]}, 60)
+        tasks = [
+            WorkerTask("lost-worker", {"job_id": "j-1", "task_id": f"t-{i}"}, priority)
+            for i, priority in enumerate([1.0, 5.0])
+        ]
+        await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=tasks)
+        assert await storage.pop_lost_workers() == []
+
+        await asyncio.sleep(1.1)
+        assert await storage.pop_lost_workers() == ["lost-worker"]
+        # Each lost worker is reported only once
+        assert await storage.pop_lost_workers() == []
+
+        drained = await storage.drain_worker_tasks("lost-worker")
+        assert drained == [(tasks[1].payload, 5.0), (tasks[0].payload, 1.0)]
+        assert await storage.drain_worker_tasks("lost-worker") == []
+
+    async def test_task_leases(self, storage: StorageBackend):
+        tasks = [WorkerTask("lease-worker", {"job_id": "j-1", "task_id": f"t-{i}"}, 2.0) for i in range(3)]
+        await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=tasks)
+        for _ in tasks:
+            assert await storage.dequeue_task_for_worker("lease-worker", 1, lease_seconds=0.2)
+        assert await storage.pop_expired_task_leases() == []
+
+        await storage.ack_task_lease("t-0")
+        assert await storage.extend_task_lease("lease-worker", "t-1", 60) is True
+        assert await storage.extend_task_lease("other-worker", "t-2", 60) is False
+        assert await storage.extend_task_lease("lease-worker", "t-0", 60) is False
+
+        await asyncio.sleep(0.3)
+        assert await storage.pop_expired_task_leases() == [("lease-worker", tasks[2].payload, 2.0)]
+        assert await storage.pop_expired_task_leases() == []
+        # An expired lease cannot be extended any more
+        assert await storage.extend_task_lease("lease-worker", "t-2", 60) is False
+
     async def test_dequeue_empty_queue(self, storage: StorageBackend):
         # We assume queue is empty initially or flushed
         # For RedisStorage, dequeue has a timeout. MemoryStorage waits indefinitely.
@@ -98,22 +369,24 @@ class StorageTestSuite:
         id1, msg_id1 = result1
         assert id1 == job_id
 
-        # 2. Consumer restarts (calls dequeue_job again)
-        # It should receive the SAME message (from PEL) because it wasn't ACKed.
+        # 2. New jobs are read without looking at the pending entries
+        assert await storage.dequeue_job() is None
+
+        # 3. The reclaimer receives the SAME message (from PEL) because it wasn't ACKed.
         # Wait a bit for min_idle_time if using Redis
-        if storage.__class__.__name__ == "RedisStorage":
-            await asyncio.sleep(0.2)
-        result2 = await storage.dequeue_job()
-        assert result2 is not None
-        id2, msg_id2 = result2
+        from src.avtomatika.storage.redis import RedisStorage
 
-        assert id2 == job_id
-        assert msg_id2 == msg_id1
+        if isinstance(storage, RedisStorage):
+            await asyncio.sleep(0.2)
+        cursor, reclaimed = await storage.reclaim_jobs("0-0", 10)
+        assert cursor == "0-0"
+        assert reclaimed == [(job_id, msg_id1)]
+        msg_id2 = reclaimed[0][1]
 
-        # 3. Now ACK it
+        # 4. Now ACK it
         await storage.ack_job(msg_id2)
 
-        # 4. Should now get new messages
+        # 5. Should now get new messages
         job_id_2 = "job-2"
         await storage.enqueue_job(job_id_2)
 
@@ -0,0 +1,184 @@
+import pytest
+import pytest_asyncio
+from fakeredis.aioredis import FakeRedis
+from src.avtomatika.blobs.base import (
+    BLOB_REF_KEY,
+    BlobView,
+    blob_digest,
+    is_blob_ref,
+    offload_blobs,
+    resolve_blobs,
+)
+from src.avtomatika.blobs.filesystem import FileSystemBlobStore
+from src.avtomatika.blobs.redis import RedisBlobStore
+from src.avtomatika.engine import ENGINE_KEY
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture(params=["filesystem", "redis"])
+async def blob_store(request, tmp_path):
+    if request.param == "filesystem":
+        yield FileSystemBlobStore(str(tmp_path))
+    else:
+        store = RedisBlobStore(FakeRedis())
+        yield store
+        await store.close()
+
+
+async def test_put_get_and_ranges(blob_store):
+    data = bytes(range(256)) * 10
+    digest = await blob_store.put(data)
+
+    assert digest == blob_digest(data)
+    assert await blob_store.put(data) == digest  # Stored only once
+    assert await blob_store.size(digest) == len(data)
+    assert await blob_store.get(digest) == data
+    assert await blob_store.get(digest, 10, 20) == data[10:20]
+    assert await blob_store.get(digest, 2500) == data[2500:]
+    assert b"".join([chunk async for chunk in blob_store.iter_chunks(digest, 5, 2005, chunk_size=300)]) == data[5:2005]
+
+    missing = blob_digest(b"missing")
+    assert await blob_store.get(missing) is None
+    assert await blob_store.size(missing) is None
+    with pytest.raises(ValueError):
+        await blob_store.get("../../etc/passwd")
+
+
+async def test_offload_and_resolve_round_trip(blob_store):
+    value = {
+        "bot_id": "b-1",
+        "code": "print('hi')\n" * 100,
+        "files": {"bot.py": "x" * 50, "data.bin": b"\x00" * 200},
+        "requirements": ["aiogram"],
+    }
+    offloaded = await offload_blobs(blob_store, value, threshold=100)
+
+    assert offloaded["bot_id"] == "b-1"
+    assert offloaded["files"]["bot.py"] == "x" * 50
+    assert is_blob_ref(offloaded["code"])
+    assert offloaded["code"]["size"] == len(value["code"])
+    assert is_blob_ref(offloaded["files"]["data.bin"])
+    assert await offload_blobs(blob_store, offloaded, threshold=100) == offloaded
+    assert await resolve_blobs(blob_store, offloaded) == value
+
+
+async def test_blob_view_resolves_read_keys_and_keeps_unchanged_references(blob_store):
+    stored = await offload_blobs(blob_store, {"code": "c" * 200, "files": {"a.py": "a" * 200}, "id": 1}, 100)
+    view = BlobView(blob_store, stored, threshold=100)
+    assert view.data == stored
+
+    await view.resolve({"files", "missing"})
+    assert view.data["files"] == {"a.py": "a" * 200}
+    assert is_blob_ref(view.data["code"])
+    # Content that was only read goes back to its reference
+    assert await view.store() == stored
+
+    view.data["files"]["b.py"] = "b" * 200
+    saved = await view.store()
+    assert saved["files"]["a.py"] == stored["files"]["a.py"]
+    assert await resolve_blobs(blob_store, saved["files"]["b.py"]) == "b" * 200
+
+
+async def test_worker_blob_endpoint_supports_ranges(aiohttp_client, app, tmp_path):
+    client = await aiohttp_client(app)
+    engine = app[ENGINE_KEY]
+    engine.blob_store = FileSystemBlobStore(str(tmp_path))
+    data = b"0123456789" * 1000
+    digest = await engine.blob_store.put(data)
+    headers = {"X-Worker-Token": engine.config.GLOBAL_WORKER_TOKEN}
+
+    resp = await client.get(f"/_worker/blobs/{digest}", headers=headers)
+    assert resp.status == 200
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    assert await resp.read() == data
+
+    resp = await client.get(f"/_worker/blobs/{digest}", headers={**headers, "Range": "bytes=100-199"})
+    assert resp.status == 206
+    assert resp.headers["Content-Range"] == f"bytes 100-199/{len(data)}"
+    assert await resp.read() == data[100:200]
+
+    resp = await client.get(f"/_worker/blobs/{digest}", headers={**headers, "Range": "bytes=-10"})
+    assert resp.status == 206
+    assert await resp.read() == data[-10:]
+
+    resp = await client.get(f"/_worker/blobs/{digest}", headers={**headers, "Range": "bytes=20000-"})
+    assert resp.status == 416
+
+    resp = await client.get(f"/_worker/blobs/{blob_digest(b'other')}", headers=headers)
+    assert resp.status == 404
+
+
+async def test_dispatch_offloads_large_params(tmp_path):
+    from unittest.mock import AsyncMock
+
+    from src.avtomatika.config import Config
+    from src.avtomatika.dispatcher import Dispatcher
+
+    storage = AsyncMock()
+    storage.find_workers.return_value = [{"worker_id": "w-1", "supported_tasks": ["start_bot"]}]
+    config = Config()
+    config.BLOB_INLINE_THRESHOLD_BYTES = 16
+    dispatcher = Dispatcher(storage, config, FileSystemBlobStore(str(tmp_path)))
+
+    task = await dispatcher.prepare_task(
+        {"id": "job-1"},
+        {"type": "start_bot", "params": {"code": "a" * 64, "bot_id": "b-1"}},
+    )
+
+    assert task.payload["params"]["bot_id"] == "b-1"
+    assert task.payload["params"]["code"][BLOB_REF_KEY] == blob_digest(b"a" * 64)
+
+
+async def test_handlers_see_resolved_initial_data(tmp_path):
+    from unittest.mock import AsyncMock, MagicMock
+
+    from src.avtomatika.blueprint import StateMachineBlueprint
+    from src.avtomatika.executor import JobExecutor
+
+    store = FileSystemBlobStore(str(tmp_path))
+    code = "print('hello')" * 10
+    bp = StateMachineBlueprint(name="blob-bp")
+    seen = {}
+
+    @bp.handler_for("start", is_start=True)
+    async def start(context, actions):
+        seen["code"] = context.initial_data["code"]
+        context.initial_data["notes"] = "n" * 64
+        actions.transition_to("done")
+
+    @bp.handler_for("done", is_end=True)
+    async def done(context, actions):
+        pass
+
+    engine = MagicMock()
+    engine.storage = AsyncMock()
+    engine.blob_store = store
+    engine.blueprints = {"blob-bp": bp}
+    engine.config.BLOB_INLINE_THRESHOLD_BYTES = 16
+    engine.config.EXECUTOR_MAX_CHAINED_STEPS = 0
+    initial_data = await offload_blobs(store, {"code": code, "archive": "z" * 64, "user_id": "u-1"}, 16)
+    store.get = AsyncMock(wraps=store.get)
+    store.put = AsyncMock(wraps=store.put)
+    engine.storage.get_job_state.return_value = {
+        "id": "job-1",
+        "blueprint_name": "blob-bp",
+        "current_state": "start",
+        "initial_data": initial_data,
+        "state_history": {},
+        "client_config": {},
+    }
+    executor = JobExecutor(engine, AsyncMock())
+
+    await executor._process_job("job-1", "msg-1")
+
+    assert seen["code"] == code
+    # Only the blob the handler reads is fetched, and only the new value is uploaded
+    assert [call.args[0] for call in store.get.await_args_list] == [initial_data["code"][BLOB_REF_KEY]]
+    assert [call.args[0] for call in store.put.await_args_list] == [b"n" * 64]
+    # The saved state keeps large values, including new ones, as references
+    saved = engine.storage.commit_transition.call_args.args[1]["initial_data"]
+    assert saved["code"] == initial_data["code"]
+    assert saved["archive"] == initial_data["archive"]
+    assert saved["user_id"] == "u-1"
+    assert await resolve_blobs(store, saved["notes"]) == "n" * 64
@@ -126,6 +126,46 @@ def test_find_handler_no_handler(blueprint):
         blueprint.find_handler("start", MagicMock())
 
 
+def test_compile_indexes_conditions_and_plans(blueprint):
+    @blueprint.handler_for("start", is_start=True)
+    async def default(context, actions):
+        pass
+
+    @blueprint.handler_for("start").when("context.initial_data.status == 'completed'")
+    async def completed(job_id, initial_data, worker_field, initial_field, missing):
+        pass
+
+    @blueprint.handler_for("other").when("context.initial_data.status == 'completed'")
+    async def other(context):
+        pass
+
+    blueprint.compile()
+    assert [h.func for h in blueprint._conditions_by_state["start"]] == [completed]
+    assert blueprint.handler_plan(completed) is blueprint._handler_plans[completed]
+
+    context = MagicMock()
+    context.job_id = "job-1"
+    context.initial_data = {"status": "completed", "initial_field": "i", "worker_field": "ignored"}
+    context.state_history = {"worker_field": "w"}
+    assert blueprint.find_handler("start", context) is completed
+    assert blueprint.handler_plan(completed).bind(context) == {
+        "job_id": "job-1",
+        "initial_data": context.initial_data,
+        "worker_field": "w",
+        "initial_field": "i",
+    }
+    assert blueprint.handler_plan(default).bind(context) == {"context": context, "actions": context.actions}
+    assert blueprint.handler_plan(other).bind(context) == {"context": context}
+
+    # Handlers added after compiling are picked up as well
+    @blueprint.handler_for("start").when("context.initial_data.status == 'new'")
+    async def new(context):
+        pass
+
+    context.initial_data = {"status": "new"}
+    assert blueprint.find_handler("start", context) is new
+
+
 def test_render_graph_with_filename(blueprint, tmp_path):
     @blueprint.handler_for("start", is_start=True)
     def handler(context, actions):
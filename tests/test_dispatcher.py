@@ -1,7 +1,9 @@
+from types import MethodType
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from src.avtomatika.dispatcher import Dispatcher
+from src.avtomatika.storage.base import StorageBackend
 
 # --- Sample Worker Data ---
 GPU_WORKER = {
@@ -31,6 +33,9 @@ CPU_WORKER = {
 def mock_storage():
     storage = MagicMock()
     storage.get_available_workers = AsyncMock(return_value=[])
+    # Use the generic query implementation on top of the mocked worker list
+    storage.find_workers = MethodType(StorageBackend.find_workers, storage)
+    storage.commit_transition = MethodType(StorageBackend.commit_transition, storage)
     storage.enqueue_task_for_worker = AsyncMock()
     storage.save_job_state = AsyncMock()
     return storage
@@ -304,3 +309,28 @@ class TestDispatcherStrategies:
         called_args, _ = mock_storage.enqueue_task_for_worker.call_args
         dispatched_worker_id = called_args[0]
         assert dispatched_worker_id == worker_B["worker_id"]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_queries_only_capable_idle_workers(dispatcher, mock_storage):
+    """Tests that the dispatcher asks the registry for idle workers of the task type only."""
+    mock_storage.find_workers = AsyncMock(return_value=[GPU_WORKER])
+
+    task_info = {"type": "image_generation", "resource_requirements": {"gpu_info": {"model": "T4"}}}
+    await dispatcher.dispatch({"id": "job-1", "tracing_context": {}}, task_info)
+
+    mock_storage.find_workers.assert_called_once_with(
+        task_type="image_generation",
+        status="idle",
+        resource_requirements={"gpu_info": {"model": "T4"}},
+    )
+    mock_storage.get_available_workers.assert_not_called()
+    assert mock_storage.enqueue_task_for_worker.call_args[0][0] == GPU_WORKER["worker_id"]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_raises_if_no_worker_supports_task(dispatcher, mock_storage):
+    mock_storage.get_available_workers = AsyncMock(return_value=[CPU_WORKER])
+
+    with pytest.raises(RuntimeError, match="No suitable workers for task type 'image_generation'"):
+        await dispatcher.dispatch({"id": "job-1", "tracing_context": {}}, {"type": "image_generation"})
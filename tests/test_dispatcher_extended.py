@@ -1,12 +1,16 @@
+from types import MethodType
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from src.avtomatika.dispatcher import Dispatcher
+from src.avtomatika.storage.base import StorageBackend
 
 
 @pytest.fixture
 def mock_storage():
     storage = AsyncMock()
+    storage.find_workers = MethodType(StorageBackend.find_workers, storage)
+    storage.commit_transition = MethodType(StorageBackend.commit_transition, storage)
     return storage
 
 
@@ -93,3 +97,87 @@ async def test_dispatcher_max_cost_filtering(dispatcher, mock_storage):
 
     args = mock_storage.enqueue_task_for_worker.call_args[0]
     assert args[0] == "just_right"
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_shared_mode_queues_by_task_type_and_requirements():
+    """Verifies that the shared mode needs no idle worker and routes by requirement class."""
+    from src.avtomatika.config import Config
+    from src.avtomatika.storage.memory import MemoryStorage
+
+    storage = MemoryStorage()
+    config = Config()
+    config.DISPATCH_MODE = "shared"
+    dispatcher = Dispatcher(storage, config)
+
+    # No workers at all: dispatching still succeeds
+    job_state = {"id": "job-1"}
+    gpu_task = {"type": "render", "resource_requirements": {"gpu_info": {"vram_gb": 16}}}
+    task = await dispatcher.prepare_task(job_state, gpu_task)
+    assert task.worker_id is None
+    assert task.shared_queue.startswith("shared:render:")
+    assert task.payload["shared_queue"] == task.shared_queue
+    assert job_state["task_worker_id"] is None
+    assert job_state["current_task_id"] == task.payload["task_id"]
+    plain = await dispatcher.prepare_task({"id": "job-2"}, {"type": "render"})
+    assert plain.shared_queue == "shared:render:any"
+
+    small_gpu = {"worker_id": "w-1", "supported_tasks": ["render"], "resources": {"gpu_info": {"vram_gb": 8}}}
+    big_gpu = {"worker_id": "w-2", "supported_tasks": ["render"], "resources": {"gpu_info": {"vram_gb": 24}}}
+    assert await dispatcher.shared_queues_for_worker(small_gpu) == ["shared:render:any"]
+    assert sorted(await dispatcher.shared_queues_for_worker(big_gpu)) == sorted([task.shared_queue, plain.shared_queue])
+
+
+@pytest.mark.asyncio
+async def test_shared_queue_task_is_assigned_to_polling_worker(aiohttp_client, app):
+    """Tests that a worker polling in the shared dispatch mode takes tasks from the
+    shared queue of its task types and is recorded as the task's worker.
+    """
+    from src.avtomatika.engine import ENGINE_KEY
+
+    engine = app[ENGINE_KEY]
+    engine.config.DISPATCH_MODE = "shared"
+    client = await aiohttp_client(app)
+    storage = engine.storage
+    await storage.register_worker("worker-1", {"worker_id": "worker-1", "supported_tasks": ["start_bot"]}, 60)
+
+    job_state = {"id": "job-shared", "status": "waiting_for_worker"}
+    task = await engine.dispatcher.prepare_task(job_state, {"type": "start_bot"})
+    await storage.commit_transition("job-shared", job_state, worker_tasks=[task])
+
+    headers = {"X-Worker-Token": engine.config.GLOBAL_WORKER_TOKEN}
+    resp = await client.get("/_worker/workers/worker-1/tasks/next", headers=headers)
+    assert resp.status == 200
+    assert (await resp.json())["task_id"] == task.payload["task_id"]
+    assert (await storage.get_job_state("job-shared"))["task_worker_id"] == "worker-1"
+
+
+@pytest.mark.asyncio
+async def test_polled_task_is_leased_until_result(aiohttp_client, app):
+    """Tests that a polled task is leased to the worker, that the worker can extend
+    the lease and that submitting the result releases it.
+    """
+    from src.avtomatika.engine import ENGINE_KEY
+
+    engine = app[ENGINE_KEY]
+    engine.config.TASK_LEASE_SECONDS = 30
+    client = await aiohttp_client(app)
+    storage = engine.storage
+    await storage.register_worker("worker-1", {"worker_id": "worker-1", "supported_tasks": ["start_bot"]}, 60)
+
+    job_state = {"id": "job-leased", "status": "waiting_for_worker"}
+    task = await engine.dispatcher.prepare_task(job_state, {"type": "start_bot"})
+    await storage.commit_transition("job-leased", job_state, worker_tasks=[task])
+    task_id = task.payload["task_id"]
+
+    headers = {"X-Worker-Token": engine.config.GLOBAL_WORKER_TOKEN}
+    resp = await client.get("/_worker/workers/worker-1/tasks/next", headers=headers)
+    assert resp.status == 200
+    resp = await client.post(f"/_worker/workers/worker-1/tasks/{task_id}/lease", headers=headers)
+    assert resp.status == 200
+    assert (await resp.json())["lease_seconds"] == 30
+
+    result = {"job_id": "job-leased", "task_id": task_id, "worker_id": "worker-1", "result": {"status": "success"}}
+    await client.post("/_worker/tasks/result", json=result, headers=headers)
+    resp = await client.post(f"/_worker/workers/worker-1/tasks/{task_id}/lease", headers=headers)
+    assert resp.status == 404
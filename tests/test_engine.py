@@ -11,12 +11,13 @@ from avtomatika.engine import (
     EXECUTOR_KEY,
     EXECUTOR_TASK_KEY,
     HEALTH_CHECKER_KEY,
-    HEALTH_CHECKER_TASK_KEY,
     HTTP_SESSION_KEY,
+    LEADER_ELECTOR_KEY,
+    LEADER_ELECTOR_TASK_KEY,
     REPUTATION_CALCULATOR_KEY,
-    REPUTATION_CALCULATOR_TASK_KEY,
     SCHEDULER_KEY,
-    SCHEDULER_TASK_KEY,
+    TASK_WAITER_KEY,
+    TASK_WAITER_TASK_KEY,
     WATCHER_KEY,
     WATCHER_TASK_KEY,
     OrchestratorEngine,
@@ -121,6 +122,7 @@ async def test_on_startup(engine, monkeypatch):
         patch("avtomatika.engine.ReputationCalculator", autospec=True),
         patch("avtomatika.engine.HealthChecker", autospec=True),
         patch("avtomatika.engine.Scheduler", autospec=True),
+        patch("avtomatika.engine.JobStreamTrimmer", autospec=True),
         patch("avtomatika.engine.load_client_configs_to_redis", mock_load_clients),
         patch("avtomatika.engine.load_worker_configs_to_redis", mock_load_workers),
         patch("os.path.exists", return_value=True),  # Mock that the config file exists
@@ -136,7 +138,9 @@ async def test_on_startup(engine, monkeypatch):
         assert REPUTATION_CALCULATOR_KEY in app
         assert HEALTH_CHECKER_KEY in app
         assert SCHEDULER_KEY in app
-        assert mock_create_task.call_count == 5
+        assert LEADER_ELECTOR_KEY in app
+        # The singleton services are started by the leader elector, not at startup
+        assert mock_create_task.call_count == 4
 
 
 @pytest.mark.asyncio
@@ -147,18 +151,20 @@ async def test_on_shutdown(engine):
     app[REPUTATION_CALCULATOR_KEY] = MagicMock()
     app[HEALTH_CHECKER_KEY] = MagicMock()
     app[SCHEDULER_KEY] = MagicMock()
+    app[TASK_WAITER_KEY] = MagicMock()
+    app[LEADER_ELECTOR_KEY] = MagicMock()
+    app[DISPATCHER_KEY] = MagicMock(wait_for_pushes=AsyncMock())
 
     app[HTTP_SESSION_KEY] = MagicMock(close=AsyncMock())
 
     # Create real Future objects for the tasks
     loop = asyncio.get_event_loop()
-    app[HEALTH_CHECKER_TASK_KEY] = loop.create_future()
+    app[LEADER_ELECTOR_TASK_KEY] = loop.create_future()
     app[WATCHER_TASK_KEY] = loop.create_future()
-    app[REPUTATION_CALCULATOR_TASK_KEY] = loop.create_future()
     app[EXECUTOR_TASK_KEY] = loop.create_future()
-    app[SCHEDULER_TASK_KEY] = loop.create_future()
+    app[TASK_WAITER_TASK_KEY] = loop.create_future()
 
-    engine.history_storage = MagicMock(close=AsyncMock())
+    engine.history_storage = MagicMock(close=AsyncMock(), flush=AsyncMock())
 
     engine.ws_manager = MagicMock(close_all=AsyncMock())
 
@@ -170,17 +176,18 @@ async def test_on_shutdown(engine):
 
     app[EXECUTOR_KEY].stop.assert_called_once()
     app[WATCHER_KEY].stop.assert_called_once()
-    app[REPUTATION_CALCULATOR_KEY].stop.assert_called_once()
-    app[HEALTH_CHECKER_KEY].stop.assert_called_once()
+    app[DISPATCHER_KEY].wait_for_pushes.assert_awaited_once()
+    app[LEADER_ELECTOR_KEY].stop.assert_called_once()
+    engine.history_storage.flush.assert_called_once()
     engine.history_storage.close.assert_called_once()
     app[HTTP_SESSION_KEY].close.assert_called_once()
     engine.ws_manager.close_all.assert_called_once()
 
     # We need to check the cancel method on the future, not the mock
-    assert app[HEALTH_CHECKER_TASK_KEY].cancelled()
+    assert app[LEADER_ELECTOR_TASK_KEY].cancelled()
     assert app[WATCHER_TASK_KEY].cancelled()
-    assert app[REPUTATION_CALCULATOR_TASK_KEY].cancelled()
     assert app[EXECUTOR_TASK_KEY].cancelled()
+    assert app[TASK_WAITER_TASK_KEY].cancelled()
 
 
 @pytest.mark.asyncio
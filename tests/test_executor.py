@@ -13,8 +13,13 @@ def mock_engine():
     engine.history_storage = AsyncMock()
     engine.dispatcher = AsyncMock()
     engine.blueprints = {}
+    engine.blob_store = None
     engine.config = MagicMock()
     engine.config.JOB_MAX_RETRIES = 3  # Default max retries for tests
+    engine.config.EXECUTOR_MAX_CHAINED_STEPS = 0
+    engine.config.EXECUTOR_RECLAIM_INTERVAL_SECONDS = 60
+    engine.config.JOB_STREAM_PARTITION_TTL_SECONDS = 15
+    engine.storage.reclaim_jobs.return_value = ("0-0", [])
     return engine
 
 
@@ -52,7 +57,7 @@ async def test_process_job_blueprint_not_found(job_executor):
     job_executor.storage.get_job_state.return_value = job_state
     job_executor.storage.ack_job = AsyncMock()
     await job_executor._process_job("test-job", "msg-123")
-    job_executor.storage.save_job_state.assert_called_with(
+    job_executor.storage.commit_transition.assert_called_with(
         "test-job",
         {
             "id": "test-job",
@@ -64,6 +69,7 @@ async def test_process_job_blueprint_not_found(job_executor):
             "error_message": "Blueprint 'test-bp' not found",
             "tracing_context": ANY,
         },
+        enqueue=True,
     )
     job_executor.storage.ack_job.assert_called_with("msg-123")
 
@@ -78,7 +84,7 @@ async def test_process_job_handler_not_found(job_executor):
     job_executor.storage.get_job_state.return_value = job_state
     job_executor.storage.ack_job = AsyncMock()
     await job_executor._process_job("test-job", "msg-123")
-    job_executor.storage.save_job_state.assert_called_with(
+    job_executor.storage.commit_transition.assert_called_with(
         "test-job",
         {
             "id": "test-job",
@@ -90,6 +96,7 @@ async def test_process_job_handler_not_found(job_executor):
             "error_message": "Handler not found",
             "tracing_context": ANY,
         },
+        enqueue=True,
     )
     job_executor.storage.ack_job.assert_called_with("msg-123")
 
@@ -149,8 +156,8 @@ async def test_process_job_handler_dependency_injection(job_executor, mocker):
     assert captured_args["worker_field"] == "worker_value"
     assert captured_args["initial_field"] == "initial_value"
 
-    # 2. Check that the correct state transition was triggered and saved
-    job_executor.storage.save_job_state.assert_called_with(
+    # 2. Check that the correct state transition was saved and the job re-enqueued for the next state
+    job_executor.storage.commit_transition.assert_called_with(
         job_id,
         {
             "id": job_id,
@@ -163,9 +170,8 @@ async def test_process_job_handler_dependency_injection(job_executor, mocker):
             "status": "running",
             "tracing_context": ANY,
         },
+        enqueue=True,
     )
-    # 3. Check that the job was re-enqueued for the next state
-    job_executor.storage.enqueue_job.assert_called_with(job_id)
     job_executor.storage.ack_job.assert_called_with("msg-123")
 
 
@@ -212,7 +218,7 @@ async def test_process_job_handler_backward_compatibility(job_executor):
     assert isinstance(call_args[1], ActionFactory)
 
     # 2. Check that the job was transitioned
-    job_executor.storage.save_job_state.assert_called_with(
+    job_executor.storage.commit_transition.assert_called_with(
         job_id,
         {
             "id": job_id,
@@ -225,8 +231,8 @@ async def test_process_job_handler_backward_compatibility(job_executor):
             "status": "running",
             "tracing_context": ANY,
         },
+        enqueue=True,
     )
-    job_executor.storage.enqueue_job.assert_called_with(job_id)
     job_executor.storage.ack_job.assert_called_with("msg-123")
 
 
@@ -280,7 +286,7 @@ async def test_di_name_collision_precedence(job_executor, mocker):
     assert isinstance(captured_args["actions"], ActionFactory)
 
     # Verify transition
-    job_executor.storage.save_job_state.assert_called_with(
+    job_executor.storage.commit_transition.assert_called_with(
         job_id_context,
         {
             "id": job_id_context,
@@ -293,6 +299,7 @@ async def test_di_name_collision_precedence(job_executor, mocker):
             "status": "running",
             "tracing_context": ANY,
         },
+        enqueue=True,
     )
     job_executor.storage.ack_job.assert_called_with("msg-123")
 
@@ -334,7 +341,7 @@ async def test_di_missing_argument_fails_job(job_executor, caplog):
 
     # --- Assertions ---
     # The job should have been attempted to retry
-    job_executor.storage.save_job_state.assert_called_with(
+    job_executor.storage.commit_transition.assert_called_with(
         job_id,
         {
             "id": job_id,
@@ -348,11 +355,229 @@ async def test_di_missing_argument_fails_job(job_executor, caplog):
             "error_message": ANY,  # Check that an error message is present
             "tracing_context": ANY,
         },
+        enqueue=True,
     )
     assert (
         "missing 1 required positional argument: 'non_existent_arg'"
-        in job_executor.storage.save_job_state.call_args[0][1]["error_message"]
+        in job_executor.storage.commit_transition.call_args[0][1]["error_message"]
     )
     assert f"Error executing handler for job {job_id}. Attempt 1/1." in caplog.text
-    job_executor.storage.enqueue_job.assert_called_with(job_id)  # Job is re-enqueued for retry
     job_executor.storage.ack_job.assert_called_with("msg-123")
+
+
+@pytest.mark.asyncio
+async def test_run_fills_free_slots_from_one_dequeue(job_executor, mocker):
+    """The main loop should request a batch sized to the free concurrency slots."""
+    import asyncio
+
+    job_executor.engine.config.EXECUTOR_MAX_CONCURRENT_JOBS = 3
+    job_executor.engine.config.EXECUTOR_DEQUEUE_BLOCK_MS = 1000
+    processed = []
+
+    async def fake_process(job_id, message_id):
+        processed.append(job_id)
+
+    mocker.patch.object(job_executor, "_process_job", side_effect=fake_process)
+
+    batches = [[("job-1", "1-0"), ("job-2", "2-0"), ("job-3", "3-0")]]
+
+    async def fake_dequeue(max_count, block_ms):
+        if batches:
+            return batches.pop(0)
+        job_executor.stop()
+        return []
+
+    job_executor.storage.dequeue_jobs = AsyncMock(side_effect=fake_dequeue)
+
+    await asyncio.wait_for(job_executor.run(), timeout=2)
+    await asyncio.sleep(0)
+
+    assert processed == ["job-1", "job-2", "job-3"]
+    first_call = job_executor.storage.dequeue_jobs.call_args_list[0]
+    assert first_call.args == (3, 1000)
+
+
+@pytest.mark.asyncio
+async def test_reclaimed_jobs_are_started_before_new_ones(job_executor, mocker):
+    import asyncio
+
+    job_executor.engine.config.EXECUTOR_MAX_CONCURRENT_JOBS = 2
+    job_executor.engine.config.EXECUTOR_DEQUEUE_BLOCK_MS = 1000
+    job_executor.storage.reclaim_jobs.side_effect = [
+        ("5-0", [("job-1", "1-0"), ("job-2", "2-0")]),
+        ("0-0", [("job-2", "2-0")]),
+    ]
+    await job_executor.reclaim_pending_jobs(limit=2)
+    # The queue is full: the scan does not continue
+    await job_executor.reclaim_pending_jobs(limit=2)
+    assert job_executor.storage.reclaim_jobs.await_count == 1
+    assert job_executor._reclaim_cursor == "5-0"
+
+    processed = []
+
+    async def fake_process(job_id, message_id):
+        processed.append(job_id)
+
+    async def fake_dequeue(max_count, block_ms):
+        job_executor.stop()
+        return [("job-3", "3-0")]
+
+    mocker.patch.object(job_executor, "_process_job", side_effect=fake_process)
+    mocker.patch.object(job_executor, "reclaim_pending_jobs", AsyncMock())
+    job_executor.storage.dequeue_jobs = AsyncMock(side_effect=fake_dequeue)
+
+    await asyncio.wait_for(job_executor.run(), timeout=2)
+    await asyncio.sleep(0)
+
+    assert processed == ["job-1", "job-2", "job-3"]
+
+
+@pytest.mark.asyncio
+async def test_messages_of_one_job_are_processed_in_order(job_executor, mocker):
+    import asyncio
+
+    events = []
+    release_first = asyncio.Event()
+
+    async def fake_process(job_id, message_id):
+        events.append(f"start {message_id}")
+        if message_id == "1-0":
+            await release_first.wait()
+        events.append(f"end {message_id}")
+
+    mocker.patch.object(job_executor, "_process_job", side_effect=fake_process)
+    job_executor._start_job("job-1", "1-0")
+    job_executor._start_job("job-1", "2-0")
+    job_executor._start_job("job-2", "3-0")
+    await asyncio.sleep(0.01)
+    assert events == ["start 1-0", "start 3-0", "end 3-0"]
+
+    release_first.set()
+    await asyncio.wait(job_executor._active_tasks)
+    assert events[3:] == ["end 1-0", "start 2-0", "end 2-0"]
+    assert job_executor._job_tails == {}
+
+
+def _chain_blueprint():
+    bp = StateMachineBlueprint(name="chain-bp")
+
+    @bp.handler_for("start", is_start=True)
+    async def start(context, actions):
+        context.initial_data["visited"] = ["start"]
+        actions.transition_to("middle")
+
+    @bp.handler_for("middle")
+    async def middle(context, actions):
+        context.initial_data["visited"].append("middle")
+        actions.transition_to("dispatch")
+
+    @bp.handler_for("dispatch")
+    async def dispatch(context, actions):
+        context.initial_data["visited"].append("dispatch")
+        actions.dispatch_task(task_type="work", params={}, transitions={"success": "done"})
+
+    @bp.handler_for("done", is_end=True)
+    async def done(context, actions):
+        pass
+
+    return bp
+
+
+def _chain_job(state="start"):
+    return {
+        "id": "job-chain",
+        "blueprint_name": "chain-bp",
+        "current_state": state,
+        "initial_data": {},
+        "state_history": {},
+        "client_config": {},
+    }
+
+
+@pytest.mark.asyncio
+async def test_process_job_chains_transitions_in_process(job_executor):
+    job_executor.engine.config.EXECUTOR_MAX_CHAINED_STEPS = 5
+    job_executor.engine.config.WORKER_TIMEOUT_SECONDS = 30
+    job_executor.engine.blueprints["chain-bp"] = _chain_blueprint()
+    job_executor.storage.get_job_state.return_value = _chain_job()
+
+    await job_executor._process_job("job-chain", "msg-1")
+
+    # State is persisted once, by the dispatch at the end of the chain
+    job_executor.storage.commit_transition.assert_called_once()
+    job_executor.storage.get_job_state.assert_called_once()
+    saved_state = job_executor.storage.commit_transition.call_args.args[1]
+    assert saved_state["current_state"] == "dispatch"
+    assert saved_state["status"] == "waiting_for_worker"
+    assert saved_state["initial_data"]["visited"] == ["start", "middle", "dispatch"]
+
+    # Every state still gets its own history events, with the state as it was at the time
+    events = [call.args[0] for call in job_executor.history_storage.log_job_event.call_args_list]
+    assert [(e["event_type"], e["state"]) for e in events] == [
+        ("state_started", "start"),
+        ("state_finished", "start"),
+        ("state_started", "middle"),
+        ("state_finished", "middle"),
+        ("state_started", "dispatch"),
+        ("task_dispatched", "dispatch"),
+    ]
+    assert events[1]["context_snapshot"]["current_state"] == "start"
+    assert events[2]["context_snapshot"]["initial_data"]["visited"] == ["start"]
+
+
+@pytest.mark.asyncio
+async def test_process_job_chaining_respects_step_limit(job_executor):
+    job_executor.engine.config.EXECUTOR_MAX_CHAINED_STEPS = 1
+    job_executor.engine.blueprints["chain-bp"] = _chain_blueprint()
+    job_executor.storage.get_job_state.return_value = _chain_job()
+
+    await job_executor._process_job("job-chain", "msg-1")
+
+    # start -> middle ran in-process, middle -> dispatch goes back through the queue
+    job_executor.storage.commit_transition.assert_called_once_with("job-chain", ANY, enqueue=True)
+    assert job_executor.storage.commit_transition.call_args.args[1]["current_state"] == "dispatch"
+    job_executor.dispatcher.prepare_task.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_process_job_chain_persists_when_last_handler_takes_no_action(job_executor):
+    job_executor.engine.config.EXECUTOR_MAX_CHAINED_STEPS = 5
+    bp = StateMachineBlueprint(name="chain-bp")
+
+    @bp.handler_for("start", is_start=True)
+    async def start(context, actions):
+        actions.transition_to("done")
+
+    @bp.handler_for("done", is_end=True)
+    async def done(context, actions):
+        pass
+
+    job_executor.engine.blueprints["chain-bp"] = bp
+    job_executor.storage.get_job_state.return_value = _chain_job()
+
+    await job_executor._process_job("job-chain", "msg-1")
+
+    job_executor.storage.commit_transition.assert_called_once_with("job-chain", ANY)
+    assert job_executor.storage.commit_transition.call_args.args[1]["current_state"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_chained_steps_copy_the_state_only_for_history(job_executor, mocker):
+    from src.avtomatika import executor
+    from src.avtomatika.history.noop import NoOpHistoryStorage
+
+    job_executor.engine.config.EXECUTOR_MAX_CHAINED_STEPS = 5
+    job_executor.engine.config.WORKER_TIMEOUT_SECONDS = 30
+    job_executor.engine.blueprints["chain-bp"] = _chain_blueprint()
+    deepcopy = mocker.spy(executor, "deepcopy")
+
+    # One copy per chained step (start -> middle -> dispatch)
+    job_executor.storage.get_job_state.return_value = _chain_job()
+    await job_executor._process_job("job-chain", "msg-1")
+    assert deepcopy.call_count == 2
+
+    deepcopy.reset_mock()
+    job_executor.history_storage = NoOpHistoryStorage()
+    job_executor.storage.get_job_state.return_value = _chain_job()
+    await job_executor._process_job("job-chain", "msg-2")
+    deepcopy.assert_not_called()
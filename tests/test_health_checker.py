@@ -1,32 +1,125 @@
 import asyncio
 import contextlib
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from src.avtomatika.data_types import WorkerTask
 from src.avtomatika.health_checker import HealthChecker
+from src.avtomatika.storage.memory import MemoryStorage
 
 
 @pytest.fixture
 def mock_engine():
     """Mocks the orchestrator engine and its dependencies."""
     engine = MagicMock()
+    engine.storage = MemoryStorage()
+    engine.config.WORKER_LOSS_CHECK_INTERVAL_SECONDS = 0.01
+    engine.dispatcher.prepare_task = AsyncMock(
+        side_effect=lambda job_state, task_info: WorkerTask("new-worker", {**task_info, "job_id": job_state["id"]}, 1.0)
+    )
+    engine.dispatcher.push_tasks = MagicMock()
+    engine.history_storage.log_worker_event = AsyncMock()
     return engine
 
 
 @pytest.mark.asyncio
-async def test_passive_health_checker_does_not_error(mock_engine):
-    """Tests that the new passive HealthChecker can be instantiated and run
-    without causing errors. Its run loop is expected to do nothing but sleep.
-    """
+async def test_health_checker_can_be_started_and_stopped(mock_engine):
     health_checker = HealthChecker(mock_engine)
 
-    # We test that run() can be started and cancelled without exceptions
     run_task = asyncio.create_task(health_checker.run())
-    await asyncio.sleep(0.01)  # Give it a moment to start
+    await asyncio.sleep(0.05)
     run_task.cancel()
 
     with contextlib.suppress(asyncio.CancelledError):
         await run_task
 
-    # The stop method should also be callable without error
     health_checker.stop()
+
+
+@pytest.mark.asyncio
+async def test_lost_worker_tasks_are_reassigned(mock_engine):
+    storage = mock_engine.storage
+    await storage.register_worker("old-worker", {"worker_id": "old-worker"}, -1)
+    await storage.save_job_state(
+        "job-1",
+        {
+            "id": "job-1",
+            "status": "waiting_for_worker",
+            "current_task_id": "task-1",
+            "current_task_info": {"type": "render", "dispatch_strategy": "cheapest"},
+        },
+    )
+    await storage.save_job_state("job-2", {"id": "job-2", "status": "finished"})
+    orphaned = WorkerTask("old-worker", {"job_id": "job-1", "task_id": "task-1", "type": "render", "params": {}}, 3.0)
+    stale = WorkerTask("old-worker", {"job_id": "job-2", "task_id": "task-2", "type": "render", "params": {}}, 1.0)
+    await storage.commit_transition("job-1", await storage.get_job_state("job-1"), worker_tasks=[orphaned, stale])
+
+    await HealthChecker(mock_engine).check_lost_workers()
+
+    mock_engine.dispatcher.prepare_task.assert_awaited_once()
+    task_info = mock_engine.dispatcher.prepare_task.call_args.args[1]
+    assert task_info["task_id"] == "task-1"
+    assert task_info["dispatch_strategy"] == "cheapest"
+    assert task_info["priority"] == 3.0
+    assert (await storage.dequeue_task_for_worker("new-worker", 1))["task_id"] == "task-1"
+    mock_engine.dispatcher.push_tasks.assert_called_once()
+
+    event = mock_engine.history_storage.log_worker_event.call_args.args[0]
+    assert event["worker_id"] == "old-worker"
+    assert event["event_type"] == "lost"
+    assert event["worker_info_snapshot"]["reassigned_tasks"] == [{"task_id": "task-1", "worker_id": "new-worker"}]
+
+
+@pytest.mark.asyncio
+async def test_reregistered_worker_keeps_its_tasks(mock_engine):
+    storage = mock_engine.storage
+    await storage.register_worker("flaky-worker", {"worker_id": "flaky-worker"}, -1)
+    assert await storage.pop_lost_workers() == ["flaky-worker"]
+    storage._lost_workers.add("flaky-worker")
+    await storage.register_worker("flaky-worker", {"worker_id": "flaky-worker"}, 60)
+
+    await HealthChecker(mock_engine).check_lost_workers()
+
+    mock_engine.history_storage.log_worker_event.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_expired_task_lease_is_redelivered(mock_engine):
+    storage = mock_engine.storage
+    job_state = {
+        "id": "job-1",
+        "status": "waiting_for_worker",
+        "current_task_id": "task-1",
+        "current_task_info": {"type": "render"},
+    }
+    task = WorkerTask("worker-1", {"job_id": "job-1", "task_id": "task-1", "type": "render", "params": {}}, 2.0)
+    await storage.commit_transition("job-1", job_state, worker_tasks=[task])
+    assert await storage.dequeue_task_for_worker("worker-1", 1, lease_seconds=0.01) == task.payload
+    await asyncio.sleep(0.02)
+
+    await HealthChecker(mock_engine).redeliver_expired_leases()
+
+    assert mock_engine.dispatcher.prepare_task.call_args.args[1]["task_id"] == "task-1"
+    assert (await storage.dequeue_task_for_worker("new-worker", 1))["task_id"] == "task-1"
+
+
+@pytest.mark.asyncio
+async def test_parallel_branch_is_reassigned_with_its_task_spec(mock_engine):
+    storage = mock_engine.storage
+    await storage.register_worker("old-worker", {"worker_id": "old-worker"}, -1)
+    branch_info = {"type": "render", "resource_requirements": {"gpu": True}, "timeout_seconds": 30}
+    job_state = {
+        "id": "job-1",
+        "status": "waiting_for_parallel_tasks",
+        "active_branches": ["branch-1"],
+        "branch_task_info": {"branch-1": branch_info},
+    }
+    task = WorkerTask("old-worker", {"job_id": "job-1", "task_id": "branch-1", "type": "render", "params": {}}, 1.0)
+    await storage.commit_transition("job-1", job_state, worker_tasks=[task])
+
+    await HealthChecker(mock_engine).check_lost_workers()
+
+    task_info = mock_engine.dispatcher.prepare_task.call_args.args[1]
+    assert task_info["task_id"] == "branch-1"
+    assert task_info["resource_requirements"] == {"gpu": True}
+    assert task_info["timeout_seconds"] == 30
@@ -1,3 +1,4 @@
+import asyncio
 import uuid
 from unittest.mock import AsyncMock, MagicMock
 
@@ -7,7 +8,9 @@ import pytest_asyncio
 from fakeredis.aioredis import FakeRedis
 from src.avtomatika.blueprint import StateMachineBlueprint
 from src.avtomatika.config import Config
+from src.avtomatika.data_types import WorkerTask
 from src.avtomatika.executor import JobExecutor
+from src.avtomatika.history.buffered import BufferedHistoryStorage
 from src.avtomatika.history.sqlite import SQLiteHistoryStorage
 from src.avtomatika.storage.redis import RedisStorage
 
@@ -171,6 +174,57 @@ async def test_get_job_summary_empty(sqlite_storage: SQLiteHistoryStorage):
     assert summary == {}
 
 
+async def test_sqlite_log_job_events_batch(sqlite_storage: SQLiteHistoryStorage):
+    events = [
+        {"job_id": "batch-job", "state": f"s{i}", "event_type": "state_started", "timestamp": 1000 + i}
+        for i in range(5)
+    ]
+    await sqlite_storage.log_job_events(events)
+
+    history = await sqlite_storage.get_job_history("batch-job")
+    assert [e["state"] for e in history] == ["s0", "s1", "s2", "s3", "s4"]
+
+
+async def test_buffered_history_writes_in_batches(sqlite_storage: SQLiteHistoryStorage, mocker):
+    buffered = BufferedHistoryStorage(sqlite_storage, batch_size=3, flush_interval=60)
+    await buffered.initialize()
+    log_batch = mocker.spy(sqlite_storage, "log_job_events")
+
+    for i in range(3):
+        await buffered.log_job_event({"job_id": "buffered-job", "state": f"s{i}", "event_type": "state_started"})
+    await buffered.log_worker_event({"worker_id": "w-1", "event_type": "registered"})
+    # The first full batch is written by the background task without waiting for the interval.
+    for _ in range(10):
+        if log_batch.call_count:
+            break
+        await asyncio.sleep(0.01)
+    assert [len(call.args[0]) for call in log_batch.call_args_list] == [3]
+
+    # Reads see events that are still buffered
+    history = await buffered.get_job_history("buffered-job")
+    assert [e["state"] for e in history] == ["s0", "s1", "s2"]
+
+    # Closing flushes the rest before closing the wrapped store
+    close = mocker.patch.object(sqlite_storage, "close")
+    await buffered.log_job_event({"job_id": "buffered-job", "state": "s3", "event_type": "state_started"})
+    await buffered.close()
+    assert len(await sqlite_storage.get_job_history("buffered-job")) == 4
+    close.assert_awaited_once()
+
+
+async def test_buffered_history_applies_backpressure(sqlite_storage: SQLiteHistoryStorage):
+    # Without the background writer nothing drains the queue.
+    buffered = BufferedHistoryStorage(sqlite_storage, max_queue_size=2)
+    await buffered.log_job_event({"job_id": "j", "event_type": "e"})
+    await buffered.log_job_event({"job_id": "j", "event_type": "e"})
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(buffered.log_job_event({"job_id": "j", "event_type": "e"}), timeout=0.05)
+
+    await buffered.flush()
+    await asyncio.wait_for(buffered.log_job_event({"job_id": "j", "event_type": "e"}), timeout=0.05)
+
+
 @pytest_asyncio.fixture
 async def redis_client():
     client = FakeRedis()
@@ -213,6 +267,7 @@ async def test_executor_logs_history_integration(sqlite_storage: SQLiteHistorySt
 
     # The dispatcher needs to be an async mock to be awaitable
     mock_dispatcher = AsyncMock()
+    mock_dispatcher.prepare_task.return_value = WorkerTask("worker-1", {"task_id": "task-1"}, 0.0)
     mock_engine.dispatcher = mock_dispatcher
 
     # 2. Instantiate the real JobExecutor with real history and fake storage
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from src.avtomatika.leader import LeaderElector, still_leading
+from src.avtomatika.storage.memory import MemoryStorage
+
+
+class RecordingService:
+    """A singleton service that records whether it is running."""
+
+    def __init__(self):
+        self.running = False
+        self.runs = 0
+        self.fencing_token = None
+
+    async def run(self):
+        self.running = True
+        self.runs += 1
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.running = False
+
+    def stop(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_only_the_leader_runs_the_services():
+    storage = MemoryStorage()
+    electors, services = [], []
+    for _ in range(2):
+        elector = LeaderElector(storage, lease_seconds=1)
+        service = RecordingService()
+        elector.add_service(service)
+        electors.append(elector)
+        services.append(service)
+    tasks = [asyncio.create_task(elector.run()) for elector in electors]
+    await asyncio.sleep(0.1)
+
+    leader = 0 if electors[0].is_leader else 1
+    follower = 1 - leader
+    assert not electors[follower].is_leader
+    assert services[leader].running and not services[follower].running
+    token = electors[leader].fencing_token
+    assert token is not None and electors[follower].fencing_token is None
+    assert services[leader].fencing_token == token
+    assert await storage.check_fencing_token(token) is True
+
+    # A clean shutdown releases the lease, and the other instance takes over
+    electors[leader].stop()
+    tasks[leader].cancel()
+    await tasks[leader]
+    assert not services[leader].running
+    await asyncio.sleep(0.5)
+    assert electors[follower].is_leader and services[follower].running
+    assert electors[follower].fencing_token.token > token.token
+    # The services of the old leader are fenced out
+    assert await still_leading(storage, token) is False
+    assert await still_leading(storage, services[follower].fencing_token) is True
+
+    electors[follower].stop()
+    tasks[follower].cancel()
+    await tasks[follower]
+    assert not services[follower].running
+
+
+@pytest.mark.asyncio
+async def test_leader_steps_down_when_the_lease_is_lost():
+    storage = MemoryStorage()
+    elector = LeaderElector(storage, lease_seconds=1)
+    service = RecordingService()
+    elector.add_service(service)
+    task = asyncio.create_task(elector.run())
+    await asyncio.sleep(0.1)
+    assert elector.is_leader and service.running
+
+    # Another instance took the lease over, e.g. after this one stalled
+    await storage.release_lock("leader", elector._instance_id)
+    assert await storage.acquire_lock_with_token("leader", "other-instance", 10) is not None
+    await asyncio.sleep(0.5)
+    assert not elector.is_leader and not service.running
+
+    elector.stop()
+    task.cancel()
+    await task
+    # The lease of the other instance is left alone
+    assert await storage.extend_lock("leader", "other-instance", 10) is True
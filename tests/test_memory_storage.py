@@ -1,5 +1,5 @@
 import pytest
-from src.avtomatika.storage.memory import MemoryStorage
+from src.avtomatika.storage.memory import DeadlineHeap, MemoryStorage
 
 from .storage_test_suite import StorageTestSuite
 
@@ -19,4 +19,36 @@ class TestMemoryStorage(StorageTestSuite):
     MemoryStorage-specific tests.
     """
 
-    pass
+    async def test_tasks_of_equal_priority_are_fifo(self, storage: MemoryStorage):
+        for i in range(3):
+            await storage.enqueue_task_for_worker("fifo-worker", {"task_id": f"t-{i}"}, 1.0)
+        await storage.enqueue_task_for_worker("fifo-worker", {"task_id": "urgent"}, 9.0)
+
+        delivered = [(await storage.dequeue_task_for_worker("fifo-worker", 1))["task_id"] for _ in range(4)]
+        assert delivered == ["urgent", "t-0", "t-1", "t-2"]
+
+
+def test_deadline_heap():
+    heap = DeadlineHeap()
+    heap["a"] = 30.0
+    heap["b"] = 10.0
+    heap["c"] = 20.0
+    # Moved and removed keys leave stale heap entries that must be skipped
+    heap["b"] = 40.0
+    heap.pop("c")
+
+    assert heap.next_deadline() == 30.0
+    assert heap.pop_due(35.0) == ["a"]
+    assert heap.pop_due(35.0) == []
+    assert "b" in heap and len(heap) == 1
+    assert heap.pop_due(50.0, limit=0) == []
+    assert heap.pop_due(50.0) == ["b"]
+    assert heap.next_deadline() is None
+
+
+def test_deadline_heap_drops_stale_entries_on_rebuild():
+    heap = DeadlineHeap()
+    for deadline in range(1000):
+        heap["key"] = float(deadline)
+    assert len(heap._heap) < 100
+    assert heap.pop_due(1000.0) == ["key"]
@@ -105,3 +105,14 @@ async def test_db_connection_error(dsn):
     storage = PostgresHistoryStorageImpl(dsn)
     with patch("asyncpg.create_pool", new=AsyncMock(side_effect=OSError("Connection failed"))), pytest.raises(OSError):
         await storage.initialize()
+
+
+@pytest.mark.asyncio
+async def test_log_job_events_uses_copy(postgres_storage):
+    storage, mock_conn, _, _ = postgres_storage
+    await storage.initialize()
+    mock_conn.reset_mock()
+    await storage.log_job_events([{"job_id": "job-1"}, {"job_id": "job-2"}])
+    mock_conn.copy_records_to_table.assert_awaited_once()
+    assert len(mock_conn.copy_records_to_table.call_args.kwargs["records"]) == 2
+    mock_conn.execute.assert_not_called()
@@ -1,6 +1,9 @@
 import pytest
 
 try:
+    from fakeredis import FakeServer, aioredis
+    from src.avtomatika.storage.redis import InstrumentedConnectionPool, RedisStorage
+
     from .storage_test_suite import StorageTestSuite
 
     redis_installed = True
@@ -27,4 +30,277 @@ class TestRedisStorage(StorageTestSuite):
     Runs the common storage test suite for RedisStorage.
     """
 
-    pass
+    async def test_save_job_state_writes_only_changed_fields(self, storage, redis_client):
+        job_id = "delta-job"
+        state = {"id": job_id, "status": "pending", "initial_data": {"source": "x" * 1000}}
+        await storage.save_job_state(job_id, state)
+        assert await redis_client.type(f"orchestrator:job:{job_id}") == b"hash"
+        await storage.get_job_state(job_id)
+
+        state["status"] = "running"
+        async with redis_client.pipeline(transaction=True) as pipe:
+            storage._stage_job_state(pipe, job_id, state)
+            staged = [args for args, _ in pipe.command_stack]
+        assert len(staged) == 1
+        assert staged[0][:2] == ("HSET", f"orchestrator:job:{job_id}")
+        assert "initial_data" not in staged[0]
+
+    async def test_job_state_is_rewritten_unless_read_since_the_last_write(self, storage, redis_client):
+        job_id = "stale-job"
+        state = {"id": job_id, "status": "pending", "initial_data": {"a": 1}}
+        await storage.save_job_state(job_id, state)
+        await storage.get_job_states([job_id])
+        await storage.save_job_state(job_id, {**state, "status": "running"})
+        # Another instance changes a field this one believes unchanged
+        await redis_client.hset(f"orchestrator:job:{job_id}", "initial_data", storage._pack({"a": 2}))
+
+        async with redis_client.pipeline(transaction=True) as pipe:
+            storage._stage_job_state(pipe, job_id, {**state, "status": "finished"})
+            staged = [args[0] for args, _ in pipe.command_stack]
+        assert staged == ["DEL", "HSET"]
+
+    async def test_reads_and_migrates_legacy_blob(self, storage, redis_client):
+        job_id = "legacy-job"
+        state = {"id": job_id, "status": "running", "initial_data": {"a": 1}}
+        await redis_client.set(f"orchestrator:job:{job_id}", storage._pack(state))
+
+        assert await storage.get_job_state(job_id) == state
+        assert await storage.get_job_state(job_id, fields=["status"]) == {"status": "running"}
+
+        updated = await storage.update_job_state(job_id, {"status": "finished"})
+        assert updated == {**state, "status": "finished"}
+        assert await redis_client.type(f"orchestrator:job:{job_id}") == b"hash"
+        assert await storage.get_job_state(job_id) == updated
+
+    async def test_acked_jobs_leave_the_stream(self, storage, redis_client):
+        for i in range(3):
+            await storage.enqueue_job(f"stream-job-{i}")
+        jobs = await storage.dequeue_jobs(max_count=2, block_ms=100)
+        # One job not delivered yet, two delivered but not acknowledged
+        assert await storage.get_job_queue_length() == 3
+
+        await storage.ack_job(jobs[0][1])
+        assert await redis_client.xlen("orchestrator:job_stream") == 2
+        assert await storage.get_job_queue_length() == 2
+
+    async def test_trim_job_stream_removes_acknowledged_entries(self, storage, redis_client):
+        for i in range(3):
+            await storage.enqueue_job(f"legacy-job-{i}")
+        jobs = await storage.dequeue_jobs(max_count=3, block_ms=100)
+        # Acknowledged without deleting, as before entries were deleted on ack
+        await redis_client.xack("orchestrator:job_stream", "orchestrator_group", jobs[0][1], jobs[1][1])
+
+        assert await storage.trim_job_stream() == 2
+        assert await redis_client.xlen("orchestrator:job_stream") == 1
+
+        await redis_client.xack("orchestrator:job_stream", "orchestrator_group", jobs[2][1])
+        assert await storage.trim_job_stream() == 1
+        assert await storage.get_job_queue_length() == 0
+
+
+async def test_blocking_commands_use_the_blocking_client(mocker):
+    # Two clients with their own connections to the same server
+    server = FakeServer()
+    redis_client = aioredis.FakeRedis(server=server)
+    blocking_client = aioredis.FakeRedis(server=server)
+    storage = RedisStorage(redis_client, blocking_client=blocking_client)
+    bzpopmax = mocker.spy(blocking_client, "bzpopmax")
+    xreadgroup = mocker.spy(blocking_client, "xreadgroup")
+
+    await storage.enqueue_task_for_worker("worker-1", {"task_id": "t-1"}, 1.0)
+    assert await storage.dequeue_task_for_worker("worker-1", 1) == {"task_id": "t-1"}
+    await storage.enqueue_job("job-1")
+    assert [job_id for job_id, _ in await storage.dequeue_jobs(max_count=1, block_ms=100)] == ["job-1"]
+
+    bzpopmax.assert_called_once()
+    xreadgroup.assert_called_once()
+    await redis_client.aclose()
+    await blocking_client.aclose()
+
+
+async def test_from_url_creates_separate_pools():
+    storage = RedisStorage.from_url("redis://localhost:6379/0", max_connections=3, blocking_max_connections=7)
+
+    pools = [storage._redis.connection_pool, storage._blocking_redis.connection_pool]
+    assert all(isinstance(pool, InstrumentedConnectionPool) for pool in pools)
+    assert [(pool.pool_name, pool.max_connections) for pool in pools] == [("default", 3), ("blocking", 7)]
+    await storage.close()
+
+
+async def test_stale_reads_go_to_a_fresh_replica(redis_client, mocker):
+    # A replica on its own server, which has not received anything yet
+    replica = aioredis.FakeRedis(server=FakeServer())
+    storage = RedisStorage(redis_client, replica_client=replica, replica_max_lag_seconds=5)
+    fresh = {"master_link_status": "up", "master_last_io_seconds_ago": 1}
+    info = mocker.patch.object(replica, "info", new_callable=mocker.AsyncMock, return_value=fresh)
+    await storage.save_job_state("job-1", {"id": "job-1"})
+    await storage.register_worker("worker-1", {"worker_id": "worker-1"}, 60)
+
+    assert await storage.get_job_state("job-1", allow_stale=True) is None
+    assert await storage.get_available_workers(allow_stale=True) == []
+    assert await storage.get_job_state("job-1") == {"id": "job-1"}
+    assert len(await storage.get_available_workers()) == 1
+    info.assert_awaited_once()
+
+    # Too far behind: stale reads fall back to the primary
+    info.return_value = {"master_link_status": "up", "master_last_io_seconds_ago": 30}
+    storage._replica_checked_at = float("-inf")
+    assert await storage.get_job_state("job-1", allow_stale=True) == {"id": "job-1"}
+    await replica.aclose()
+
+
+async def test_partitions_are_balanced_across_instances(redis_client):
+    first = RedisStorage(redis_client, consumer_name="a", stream_partitions=4)
+    second = RedisStorage(redis_client, consumer_name="b", stream_partitions=4)
+    await first.refresh_job_stream_partitions(ttl=30)
+    assert first._owned_partitions == {0, 1, 2, 3}
+
+    # The second instance joins: its partitions are only taken over once released
+    await second.refresh_job_stream_partitions(ttl=30)
+    assert second._owned_partitions == set()
+    await first.refresh_job_stream_partitions(ttl=30)
+    await second.refresh_job_stream_partitions(ttl=30)
+    assert first._owned_partitions == {0, 2}
+    assert second._owned_partitions == {1, 3}
+
+    job_ids = [f"partitioned-job-{i}" for i in range(8)]
+    for job_id in job_ids:
+        await first.enqueue_job(job_id)
+        await first.enqueue_job(job_id)
+    jobs = await first.dequeue_jobs(max_count=100, block_ms=100)
+    jobs += await second.dequeue_jobs(max_count=100, block_ms=100)
+    assert sorted(job_id for job_id, _ in jobs) == sorted(job_ids * 2)
+    for job_id, message_id in jobs:
+        owner = first if first._job_partition(job_id) in first._owned_partitions else second
+        assert int(message_id.split("/")[0]) == owner._job_partition(job_id)
+        await owner.ack_job(message_id)
+    assert await first.get_job_queue_length() == 0
+
+    # An instance that leaves hands its partitions over to the others at once
+    await second.release_job_stream_partitions()
+    await first.refresh_job_stream_partitions(ttl=30)
+    assert first._owned_partitions == {0, 1, 2, 3}
+
+
+async def test_partitioned_reads_return_at_most_max_count(redis_client):
+    storage = RedisStorage(redis_client, consumer_name="a", stream_partitions=4)
+    await storage.refresh_job_stream_partitions(ttl=30)
+    job_ids = [f"capped-job-{i}" for i in range(8)]
+    for job_id in job_ids:
+        await storage.enqueue_job(job_id)
+
+    # At least one entry is read per partition; the ones beyond max_count are kept
+    first = await storage.dequeue_jobs(max_count=2, block_ms=100)
+    assert len(first) == 2
+    rest = await storage.dequeue_jobs(max_count=100, block_ms=100)
+    rest += await storage.dequeue_jobs(max_count=100, block_ms=100)
+    assert sorted(job_id for job_id, _ in first + rest) == sorted(job_ids)
+
+
+async def test_watch_shards_are_split_across_instances(redis_client):
+    from time import time
+
+    from src.avtomatika.storage.base import assign_shards
+
+    first = RedisStorage(redis_client, watch_shards=16)
+    second = RedisStorage(redis_client, watch_shards=16)
+    assert await first.refresh_watch_shards("a", ttl=30) == set(range(16))
+    owned_by_b = await second.refresh_watch_shards("b", ttl=30)
+    owned_by_a = await first.refresh_watch_shards("a", ttl=30)
+    assert owned_by_a | owned_by_b == set(range(16)) and not owned_by_a & owned_by_b
+
+    await first.add_job_to_watch("future-job", time() + 60)
+    future_shard = first.watch_shard("future-job")
+    assert await first.get_next_watch_deadline({future_shard}) == pytest.approx(time() + 60, abs=1)
+    assert await first.get_next_watch_deadline(set(range(16)) - {future_shard}) is None
+
+    job_ids = [f"sharded-job-{i}" for i in range(20)]
+    for job_id in job_ids:
+        await first.add_job_to_watch(job_id, time() - 1)
+
+    # Each instance only claims the jobs of its own shards
+    claimed_by_a = await first.get_timed_out_jobs(shards=owned_by_a)
+    assert all(first.watch_shard(job_id) in owned_by_a for job_id in claimed_by_a)
+    claimed_by_b = await second.get_timed_out_jobs(shards=owned_by_b)
+    assert sorted(claimed_by_a + claimed_by_b) == sorted(job_ids)
+
+    # An instance that leaves hands its shards over to the others at once
+    await second.release_watch_shards("b")
+    assert await first.refresh_watch_shards("a", ttl=30) == set(range(16))
+    # Consistent hashing: a third member only takes shards, it does not reshuffle the others
+    with_c = assign_shards(["a", "b", "c"], 64)
+    without_c = assign_shards(["a", "b"], 64)
+    assert with_c["a"] <= without_c["a"] and with_c["b"] <= without_c["b"]
+
+
+class TestRedisClusterStorage(StorageTestSuite):
+    """
+    Runs the common storage test suite for RedisClusterStorage against a stand-in
+    that rejects commands and transactions spanning several hash slots.
+    """
+
+    @pytest.fixture
+    def storage(self, cluster_client, config):
+        from src.avtomatika.storage.redis_cluster import RedisClusterStorage
+
+        return RedisClusterStorage(cluster_client, consumer_name=config.INSTANCE_ID, min_idle_time_ms=100)
+
+    async def test_worker_registry_keys_share_a_slot(self, storage):
+        from redis.crc import key_slot
+
+        keys = [
+            storage._worker_info_key("worker-1"),
+            storage._worker_index_key("type:gpu"),
+            storage._worker_terms_key("worker-2"),
+            storage._workers_alive_key,
+            storage._workers_lost_key,
+            storage._worker_gpu_models_key,
+        ]
+        assert len({key_slot(key.encode()) for key in keys}) == 1
+        assert key_slot(storage._task_leases_key.encode()) == key_slot(storage._task_lease_data_key.encode())
+
+
+async def test_standalone_layout_is_rejected_by_the_cluster_stand_in(cluster_client):
+    from redis.exceptions import ResponseError
+
+    storage = RedisStorage(cluster_client)
+    with pytest.raises(ResponseError, match="CROSSSLOT"):
+        await storage.register_worker("worker-1", {"worker_id": "worker-1", "supported_tasks": ["a"]}, 30)
+
+
+async def test_cluster_storage_reads_partitions_separately(cluster_client):
+    from src.avtomatika.storage.redis_cluster import RedisClusterStorage
+
+    storage = RedisClusterStorage(cluster_client, consumer_name="a", stream_partitions=4)
+    await storage.refresh_job_stream_partitions(ttl=30)
+    job_ids = [f"cluster-job-{i}" for i in range(8)]
+    for job_id in job_ids:
+        await storage.enqueue_job(job_id)
+
+    jobs = []
+    while len(jobs) < len(job_ids):
+        jobs.extend(await storage.dequeue_jobs(max_count=100, block_ms=100))
+    assert sorted(job_id for job_id, _ in jobs) == sorted(job_ids)
+    for _, message_id in jobs:
+        await storage.ack_job(message_id)
+    assert await storage.get_job_queue_length() == 0
+    await storage.close()
+
+
+async def test_cluster_stale_reads_need_every_replica_fresh(cluster_client, mocker):
+    from src.avtomatika.storage.redis_cluster import RedisClusterStorage
+
+    replica = mocker.MagicMock()
+    storage = RedisClusterStorage(cluster_client, replica_client=replica, replica_max_lag_seconds=5)
+    fresh = {"role": "slave", "master_link_status": "up", "master_last_io_seconds_ago": 1}
+    lagging = {"role": "slave", "master_link_status": "up", "master_last_io_seconds_ago": 30}
+
+    replica.info = mocker.AsyncMock(return_value={"node-1": fresh, "node-2": fresh})
+    assert await storage._read_client() is replica
+    storage._replica_checked_at = float("-inf")
+    replica.info.return_value = {"node-1": fresh, "node-2": lagging}
+    assert await storage._read_client() is cluster_client
+    # A single replica answers with its INFO alone
+    storage._replica_checked_at = float("-inf")
+    replica.info.return_value = fresh
+    assert await storage._read_client() is replica
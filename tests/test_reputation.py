@@ -1,7 +1,9 @@
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
-from src.avtomatika.reputation import ReputationCalculator
+from src.avtomatika.data_types import FencingToken, WorkerTaskStats
+from src.avtomatika.reputation import REPUTATION_HISTORY_DAYS, ReputationCalculator, record_task_outcome
+from src.avtomatika.storage.memory import MemoryStorage
 
 
 @pytest.fixture
@@ -14,55 +16,33 @@ def mock_engine():
 
 @pytest.mark.asyncio
 async def test_reputation_calculation_logic(mock_engine):
-    """Tests the basic logic of reputation calculation."""
+    """Tests that reputation is calculated from the outcome counters."""
     calculator = ReputationCalculator(mock_engine)
+    calculator.fencing_token = FencingToken("leader", 7)
+    mock_engine.storage.get_available_workers.return_value = [{"worker_id": "worker-1", "reputation": 1.0}]
+    mock_engine.storage.get_worker_task_stats.return_value = WorkerTaskStats(successes=3, failures=1)
 
-    # 1. Configure mocks
-    mock_workers = [{"worker_id": "worker-1"}]
-    mock_engine.storage.get_available_workers.return_value = mock_workers
-
-    # History: 3 successful tasks, 1 failed
-    mock_history = [
-        {
-            "event_type": "task_finished",
-            "context_snapshot": {"result": {"status": "success"}},
-        },
-        {
-            "event_type": "task_finished",
-            "context_snapshot": {"result": {"status": "success"}},
-        },
-        {
-            "event_type": "task_finished",
-            "context_snapshot": {"result": {"status": "failure"}},
-        },
-        {
-            "event_type": "task_finished",
-            "context_snapshot": {"result": {"status": "success"}},
-        },
-        {"event_type": "state_started"},  # This event should be ignored
-    ]
-    mock_engine.history_storage.get_worker_history.return_value = mock_history
-
-    # 2. Perform calculation
     await calculator.calculate_all_reputations()
 
-    # 3. Check the result
-    # Expected reputation = 3 / 4 = 0.75
+    # Expected reputation = 3 / 4 = 0.75, without touching the history
+    mock_engine.storage.get_worker_task_stats.assert_called_once_with("worker-1", REPUTATION_HISTORY_DAYS)
     mock_engine.storage.update_worker_data.assert_called_once_with(
         "worker-1",
         {"reputation": 0.75},
+        fence=FencingToken("leader", 7),
     )
+    mock_engine.history_storage.get_worker_history.assert_not_called()
 
 
 @pytest.mark.asyncio
-async def test_reputation_no_history(mock_engine):
-    """Tests the case where a worker has no task history.
+async def test_reputation_no_tasks(mock_engine):
+    """Tests the case where a worker has no finished tasks in the window.
     The reputation should not change.
     """
     calculator = ReputationCalculator(mock_engine)
     mock_workers = [{"worker_id": "worker-1", "reputation": 1.0}]
     mock_engine.storage.get_available_workers.return_value = mock_workers
-    mock_engine.history_storage.get_worker_history.return_value = []
+    mock_engine.storage.get_worker_task_stats.return_value = WorkerTaskStats()
 
     await calculator.calculate_all_reputations()
 
@@ -71,18 +51,49 @@ async def test_reputation_no_history(mock_engine):
 
 
 @pytest.mark.asyncio
-async def test_reputation_division_by_zero(mock_engine):
-    """Tests the case where a worker has a history, but no task completion events
-    (to avoid division by zero).
-    """
-    calculator = ReputationCalculator(mock_engine)
-    mock_workers = [{"worker_id": "worker-1", "reputation": 1.0}]
-    mock_engine.storage.get_available_workers.return_value = mock_workers
-    mock_engine.history_storage.get_worker_history.return_value = [
-        {"event_type": "state_started"},
+async def test_record_task_outcome_updates_reputation():
+    """Tests that each result updates the counters and the stored reputation."""
+    storage = MemoryStorage()
+    await storage.register_worker("worker-1", {"worker_id": "worker-1"}, 60)
+
+    assert await record_task_outcome(storage, "worker-1", True, 100) == 1.0
+    assert await record_task_outcome(storage, "worker-1", False, 300) == 0.5
+    assert await record_task_outcome(storage, "worker-1", True) == 0.6667
+    assert (await storage.get_worker_info("worker-1"))["reputation"] == 0.6667
+
+    stats = await storage.get_worker_task_stats("worker-1", REPUTATION_HISTORY_DAYS)
+    assert stats == WorkerTaskStats(successes=2, failures=1, total_duration_ms=400, timed_tasks=2)
+    assert stats.average_duration_ms == 200
+
+    # Unknown workers are counted but have no info to update
+    assert await record_task_outcome(storage, "gone-worker", True) is None
+
+
+@pytest.mark.asyncio
+async def test_backfill_from_history():
+    """Tests that counters of workers without statistics are rebuilt from history."""
+    engine = MagicMock()
+    engine.storage = MemoryStorage()
+    engine.history_storage = AsyncMock()
+    await engine.storage.register_worker("worker-1", {"worker_id": "worker-1"}, 60)
+    calculator = ReputationCalculator(engine)
+
+    # History: 3 successful tasks, 1 failed
+    engine.history_storage.get_worker_history.return_value = [
+        {"event_type": "task_finished", "duration_ms": 10, "context_snapshot": {"result": {"status": "success"}}},
+        {"event_type": "task_finished", "duration_ms": 10, "context_snapshot": {"result": {"status": "success"}}},
+        {"event_type": "task_finished", "duration_ms": 10, "context_snapshot": {"result": {"status": "failure"}}},
+        {"event_type": "task_finished", "duration_ms": 10, "context_snapshot": {"result": {"status": "success"}}},
+        {"event_type": "state_started"},  # This event should be ignored
     ]
 
-    await calculator.calculate_all_reputations()
+    await calculator.backfill_from_history()
 
-    # The update method should not be called
-    mock_engine.storage.update_worker_data.assert_not_called()
+    stats = await engine.storage.get_worker_task_stats("worker-1", REPUTATION_HISTORY_DAYS)
+    assert (stats.successes, stats.failures) == (3, 1)
+    assert (await engine.storage.get_worker_info("worker-1"))["reputation"] == 0.75
+
+    # Workers that already have counters are not backfilled again
+    engine.history_storage.get_worker_history.reset_mock()
+    await calculator.backfill_from_history()
+    engine.history_storage.get_worker_history.assert_not_called()
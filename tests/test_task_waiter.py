@@ -0,0 +1,73 @@
+import asyncio
+import contextlib
+
+import pytest
+import pytest_asyncio
+from src.avtomatika.data_types import WorkerTask
+from src.avtomatika.storage.memory import MemoryStorage
+from src.avtomatika.task_waiter import TaskWaiter
+
+
+@pytest_asyncio.fixture
+async def waiter():
+    task_waiter = TaskWaiter(MemoryStorage())
+    run_task = asyncio.create_task(task_waiter.run())
+    await asyncio.sleep(0)
+    yield task_waiter
+    task_waiter.stop()
+    run_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_parked_request_is_woken_by_new_task(waiter):
+    request = asyncio.create_task(waiter.wait_for_task("worker-1", 5))
+    await asyncio.sleep(0.01)
+    assert waiter.parked_count == 1
+
+    task = WorkerTask("worker-1", {"job_id": "j-1", "task_id": "t-1"}, 1.0)
+    await waiter.storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=[task])
+
+    assert await asyncio.wait_for(request, 1) == task.payload
+    assert waiter.parked_count == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_times_out_without_task(waiter):
+    assert await waiter.wait_for_task("worker-1", 0.05) is None
+    assert waiter.parked_count == 0
+
+
+@pytest.mark.asyncio
+async def test_shared_task_wakes_one_request_at_a_time(waiter):
+    queues = ["shared:render:any"]
+    requests = [asyncio.create_task(waiter.wait_for_task(f"worker-{i}", 5, queues)) for i in range(3)]
+    await asyncio.sleep(0.01)
+
+    tasks = [WorkerTask(None, {"job_id": "j-1", "task_id": f"t-{i}"}, 1.0, shared_queue=queues[0]) for i in range(2)]
+    await waiter.storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=tasks)
+    done, pending = await asyncio.wait(requests, timeout=0.1)
+
+    assert sorted(request.result()["task_id"] for request in done) == ["t-0", "t-1"]
+    assert len(pending) == 1
+    pending.pop().cancel()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_passes_its_wakeup_on():
+    # Not running: wakeups are only sent by the test.
+    waiter = TaskWaiter(MemoryStorage())
+    queues = ["shared:render:any"]
+    first = asyncio.create_task(waiter.wait_for_task("worker-1", 5, queues))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(waiter.wait_for_task("worker-2", 5, queues))
+    await asyncio.sleep(0.01)
+
+    task = WorkerTask(None, {"job_id": "j-1", "task_id": "t-1"}, 1.0, shared_queue=queues[0])
+    await waiter.storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=[task])
+    # The first request is woken, but its worker disconnects before it pops the task.
+    waiter._wake(queues[0])
+    first.cancel()
+
+    assert await asyncio.wait_for(second, 1) == task.payload
@@ -0,0 +1,60 @@
+from math import inf
+
+from src.avtomatika.timer_wheel import TimerWheel
+
+
+def test_due_entries_are_returned_once():
+    wheel = TimerWheel(1000.0)
+    wheel.add("a", 1000.25)
+    wheel.add("b", 1000.55)
+
+    assert wheel.advance(1000.2) == []
+    assert wheel.advance(1000.3) == ["a"]
+    assert wheel.advance(1000.3) == []
+    assert "a" not in wheel and "b" in wheel
+    assert wheel.advance(1001.0) == ["b"]
+    assert len(wheel) == 0
+
+
+def test_overdue_entries_are_due_right_away():
+    wheel = TimerWheel(1000.0)
+    wheel.add("late", 990.0)
+    assert wheel.next_deadline() == 990.0
+    assert wheel.advance(1000.0) == ["late"]
+
+
+def test_removed_and_moved_entries():
+    wheel = TimerWheel(1000.0)
+    wheel.add("removed", 1001.0)
+    wheel.add("moved", 1001.0)
+    wheel.remove("removed")
+    wheel.remove("unknown")
+    wheel.add("moved", 1005.0)
+
+    assert wheel.advance(1002.0) == []
+    assert wheel.next_deadline() == 1005.0
+    assert wheel.advance(1005.0) == ["moved"]
+    assert wheel.next_deadline() == inf
+
+
+def test_far_deadlines_cascade_down_to_their_tick():
+    wheel = TimerWheel(0.0, tick_seconds=1.0, slots=4, levels=2)
+    # Beyond level 1 (16 ticks), so it starts in the overflow
+    wheel.add("far", 37.5)
+    wheel.add("near", 5.0)
+
+    assert wheel.next_deadline() == 5.0
+    assert wheel.advance(5.0) == ["near"]
+    assert wheel.next_deadline() == 37.5
+    assert wheel.advance(37.0) == []
+    assert wheel.advance(37.5) == ["far"]
+
+
+def test_next_deadline_looks_at_every_level():
+    wheel = TimerWheel(0.0, tick_seconds=1.0, slots=4, levels=3)
+    wheel.add("level-1", 6.0)
+    wheel.advance(3.0)
+    # Added later on level 0, but due after the entry on level 1
+    wheel.add("level-0", 6.5)
+    assert wheel.next_deadline() == 6.0
+    assert sorted(wheel.advance(6.5)) == ["level-0", "level-1"]
@@ -1,25 +1,25 @@
 import asyncio
+from time import time
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from src.avtomatika.storage.memory import MemoryStorage
 from src.avtomatika.watcher import Watcher
 
 
 @pytest.mark.asyncio
 async def test_watcher_run():
     """Tests that the watcher correctly identifies and handles timed out jobs."""
+    waiting_job = {"id": "job-1", "status": "waiting_for_worker", "blueprint_name": "test_bp", "current_task_id": "t-1"}
+    finished_job = {"id": "job-2", "status": "finished", "blueprint_name": "test_bp"}
     engine = MagicMock()
-    engine.storage.get_timed_out_jobs = AsyncMock(return_value=["job-1"])
-    engine.storage.get_job_state = AsyncMock(
-        return_value={
-            "id": "job-1",
-            "status": "waiting_for_worker",
-            "blueprint_name": "test_bp",
-        }
-    )
-    engine.storage.acquire_lock = AsyncMock(return_value=True)
-    engine.storage.release_lock = AsyncMock(return_value=True)
-    engine.storage.save_job_state = AsyncMock()  # Mock save_job_state too
+    engine.storage.get_timed_out_jobs = AsyncMock(return_value=["job-1", "job-2"])
+    engine.storage.get_job_states = AsyncMock(return_value={"job-1": waiting_job, "job-2": finished_job})
+    engine.storage.get_next_watch_deadline = AsyncMock(return_value=None)
+    engine.storage.set_task_cancellation_flag = AsyncMock()
+    engine.storage.refresh_watch_shards = AsyncMock(return_value={0})
+    engine.storage.release_watch_shards = AsyncMock()
+    engine._handle_task_failures = AsyncMock()
 
     watcher = Watcher(engine)
     watcher.watch_interval_seconds = 0.1
@@ -30,14 +30,51 @@ async def test_watcher_run():
     watcher.stop()
     await task
 
-    engine.storage.get_timed_out_jobs.assert_called()
-    engine.storage.get_job_state.assert_called_with("job-1")
-    engine.storage.save_job_state.assert_called_with(
-        "job-1",
-        {
-            "id": "job-1",
-            "status": "failed",
-            "blueprint_name": "test_bp",
-            "error_message": "Worker task timed out.",
-        },
-    )
+    # The watcher sweeps the shards it owns and leaves them when it stops
+    engine.storage.get_timed_out_jobs.assert_called_with(500, {0})
+    engine.storage.release_watch_shards.assert_awaited_once_with(watcher._instance_id)
+    engine.storage.get_job_states.assert_called_with(["job-1", "job-2"])
+    # Only the job still waiting for a worker goes down the retry path
+    engine.storage.set_task_cancellation_flag.assert_called_with("t-1")
+    engine._handle_task_failures.assert_called_with([waiting_job], "Worker task timed out.")
+    assert all(call.args[0][0] is waiting_job for call in engine._handle_task_failures.call_args_list)
+
+
+@pytest.mark.asyncio
+async def test_watcher_wakes_up_at_the_next_deadline():
+    """A timeout is handled when it is due, not at the next sweep."""
+    engine = MagicMock()
+    engine.storage = MemoryStorage()
+    engine.config.WATCHER_INTERVAL_SECONDS = 60
+    engine._handle_task_failures = AsyncMock()
+
+    watcher = Watcher(engine)
+    task = asyncio.create_task(watcher.run())
+    # Let the first sweep finish, so the watcher is asleep until the next one
+    await asyncio.sleep(0.05)
+
+    state = {"id": "job-1", "status": "waiting_for_worker", "current_task_id": "t-1"}
+    await engine.storage.commit_transition("job-1", state, watch={"job-1": time() + 0.2})
+    await asyncio.sleep(0.5)
+    watcher.stop()
+    await task
+
+    engine._handle_task_failures.assert_awaited_once_with([state], "Worker task timed out.")
+    assert await engine.storage.get_next_watch_deadline() is None
+
+
+@pytest.mark.asyncio
+async def test_only_one_watcher_sweeps_a_shard():
+    storage = MemoryStorage()
+    engines = []
+    for _ in range(2):
+        engine = MagicMock()
+        engine.storage = storage
+        engine.config.WATCHER_INTERVAL_SECONDS = 60
+        engines.append(engine)
+    watchers = [Watcher(engine) for engine in engines]
+    for watcher in watchers:
+        await watcher.sweep()
+    await watchers[0].sweep()
+
+    assert sorted(len(watcher._owned_shards) for watcher in watchers) == [0, 1]
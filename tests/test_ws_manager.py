@@ -76,3 +76,179 @@ async def test_ws_manager_close_all():
     ws1.close.assert_called_with(code=1001, message=b"Server shutdown")
     ws2.close.assert_called_with(code=1001, message=b"Server shutdown")
     assert not manager._connections
+
+
+@pytest.mark.asyncio
+async def test_ws_manager_push_task_waits_for_ack():
+    """Tests that a pushed task is only confirmed by a task_ack from the same worker."""
+    manager = WebSocketManager()
+    ws = AsyncMock(spec=web.WebSocketResponse)
+    ws.closed = False
+    await manager.register("worker-1", ws, push_tasks=True)
+    assert manager.accepts_pushed_tasks("worker-1")
+
+    async def ack(message):
+        # Acks from other workers are ignored
+        await manager.handle_message("worker-2", {"event": "task_ack", "task_id": message["task"]["task_id"]})
+        await manager.handle_message("worker-1", {"event": "task_ack", "task_id": message["task"]["task_id"]})
+
+    ws.send_json.side_effect = ack
+    assert await manager.push_task("worker-1", {"task_id": "t-1"}, ack_timeout=1) is True
+    ws.send_json.assert_called_with({"command": "run_task", "task": {"task_id": "t-1"}})
+
+    ws.send_json.side_effect = None
+    assert await manager.push_task("worker-1", {"task_id": "t-2"}, ack_timeout=0.01) is False
+    assert not manager._pending_acks
+
+    # Connections without push support, and replaced connections, do not get tasks
+    await manager.register("worker-1", ws)
+    assert not manager.accepts_pushed_tasks("worker-1")
+    assert await manager.push_task("worker-3", {"task_id": "t-3"}, ack_timeout=1) is False
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_push_tasks_falls_back_to_queue():
+    """Tests that pushed tasks are claimed from the queue and, without an ack, cancelled
+    on the worker and returned to the queue.
+    """
+    from src.avtomatika.config import Config
+    from src.avtomatika.data_types import WorkerTask
+    from src.avtomatika.dispatcher import Dispatcher
+    from src.avtomatika.storage.memory import MemoryStorage
+
+    storage = MemoryStorage()
+    manager = WebSocketManager()
+    ws = AsyncMock(spec=web.WebSocketResponse)
+    ws.closed = False
+    await manager.register("worker-1", ws, push_tasks=True)
+    config = Config()
+    config.WS_TASK_ACK_TIMEOUT_MS = 10
+    dispatcher = Dispatcher(storage, config, ws_manager=manager)
+
+    acked = WorkerTask("worker-1", {"task_id": "t-1", "job_id": "j-1"}, 1.0)
+    await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=[acked])
+
+    async def ack(message):
+        await manager.handle_message("worker-1", {"event": "task_ack", "task_id": message["task"]["task_id"]})
+
+    ws.send_json.side_effect = ack
+    dispatcher.push_tasks([acked])
+    await dispatcher.wait_for_pushes()
+    assert await storage.dequeue_task_for_worker("worker-1", timeout=0.01) is None
+
+    unacked = WorkerTask("worker-1", {"task_id": "t-2", "job_id": "j-1"}, 1.0)
+    await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=[unacked])
+    ws.send_json.side_effect = None
+    dispatcher.push_tasks([unacked])
+    await dispatcher.wait_for_pushes()
+    ws.send_json.assert_called_with({"command": "cancel_task", "task_id": "t-2", "job_id": "j-1"})
+    assert await storage.dequeue_task_for_worker("worker-1", timeout=0.01) == unacked.payload
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_leaves_unacknowledged_leased_tasks_to_their_lease():
+    """Tests that a leased task without an ack is neither re-queued nor cancelled, as the
+    worker may still run it.
+    """
+    from src.avtomatika.config import Config
+    from src.avtomatika.data_types import WorkerTask
+    from src.avtomatika.dispatcher import Dispatcher
+    from src.avtomatika.storage.memory import MemoryStorage
+
+    storage = MemoryStorage()
+    manager = WebSocketManager()
+    ws = AsyncMock(spec=web.WebSocketResponse)
+    ws.closed = False
+    await manager.register("worker-1", ws, push_tasks=True)
+    config = Config()
+    config.WS_TASK_ACK_TIMEOUT_MS = 10
+    config.TASK_LEASE_SECONDS = 60
+    dispatcher = Dispatcher(storage, config, ws_manager=manager)
+
+    task = WorkerTask("worker-1", {"task_id": "t-1", "job_id": "j-1"}, 1.0)
+    await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=[task])
+    dispatcher.push_tasks([task])
+    await dispatcher.wait_for_pushes()
+
+    ws.send_json.assert_called_once_with({"command": "run_task", "task": task.payload})
+    assert await storage.dequeue_task_for_worker("worker-1", timeout=0.01) is None
+    # The worker that acked late keeps the task by extending its lease
+    assert await storage.extend_task_lease("worker-1", "t-1", 60) is True
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_pushes_tasks_concurrently():
+    """Tests that one unacknowledged push does not delay the others by its ack timeout."""
+    from time import monotonic
+
+    from src.avtomatika.config import Config
+    from src.avtomatika.data_types import WorkerTask
+    from src.avtomatika.dispatcher import Dispatcher
+    from src.avtomatika.storage.memory import MemoryStorage
+
+    storage = MemoryStorage()
+    manager = WebSocketManager()
+    for worker_id in ("worker-1", "worker-2", "worker-3"):
+        ws = AsyncMock(spec=web.WebSocketResponse)
+        ws.closed = False
+        await manager.register(worker_id, ws, push_tasks=True)
+    config = Config()
+    config.WS_TASK_ACK_TIMEOUT_MS = 200
+    dispatcher = Dispatcher(storage, config, ws_manager=manager)
+
+    tasks = [WorkerTask(f"worker-{i}", {"task_id": f"t-{i}", "job_id": "j-1"}, 1.0) for i in (1, 2, 3)]
+    await storage.commit_transition("j-1", {"id": "j-1"}, worker_tasks=tasks)
+
+    started = monotonic()
+    dispatcher.push_tasks(tasks)
+    # Returns at once; the pushes wait for their acks concurrently
+    assert monotonic() - started < 0.1
+    await dispatcher.wait_for_pushes()
+    assert monotonic() - started < 0.5
+    for task in tasks:
+        assert await storage.dequeue_task_for_worker(task.worker_id, timeout=0.01) == task.payload
+
+
+@pytest.mark.asyncio
+async def test_worker_websocket_receives_tasks_and_sends_results(aiohttp_client, app):
+    """Tests task push, result submission and heartbeats over the worker WebSocket."""
+    from src.avtomatika.data_types import WorkerTask
+    from src.avtomatika.engine import ENGINE_KEY
+
+    engine = app[ENGINE_KEY]
+    client = await aiohttp_client(app)
+    storage = engine.storage
+    await storage.register_worker("worker-1", {"worker_id": "worker-1"}, 60)
+    job_state = {
+        "id": "job-ws",
+        "blueprint_name": "bot_runner",
+        "current_state": "start_bot",
+        "initial_data": {},
+        "status": "waiting_for_worker",
+        "current_task_transitions": {"success": "bot_started"},
+    }
+    task = WorkerTask("worker-1", {"job_id": "job-ws", "task_id": "task-ws", "type": "start_bot"}, 0.0)
+    await storage.commit_transition("job-ws", job_state, worker_tasks=[task])
+
+    headers = {"X-Worker-Token": engine.config.GLOBAL_WORKER_TOKEN}
+    async with client.ws_connect("/_worker/ws/worker-1?push_tasks=true", headers=headers) as ws:
+        engine.dispatcher.push_tasks([task])
+        message = await ws.receive_json(timeout=5)
+        assert message == {"command": "run_task", "task": task.payload}
+        await ws.send_json({"event": "task_ack", "task_id": "task-ws"})
+        await engine.dispatcher.wait_for_pushes()
+        # The task was delivered over the socket, not left in the queue
+        assert await storage.claim_worker_task("worker-1", task.payload) is False
+
+        await ws.send_json(
+            {"event": "task_result", "job_id": "job-ws", "task_id": "task-ws", "result": {"status": "success"}}
+        )
+        reply = await ws.receive_json(timeout=5)
+        assert reply["command"] == "task_result_ack"
+        assert reply["code"] == 200
+        assert reply["response"] == {"status": "result_accepted_success"}
+        assert (await storage.get_job_state("job-ws"))["current_state"] == "bot_started"
+
+        await ws.send_json({"event": "heartbeat"})
+        reply = await ws.receive_json(timeout=5)
+        assert reply == {"command": "heartbeat_ack", "code": 200, "response": {"status": "ttl_refreshed"}}